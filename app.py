@@ -13,11 +13,12 @@ STATE_CODE="06"
 NAME="Anton"
 
 
-# city to geocode first (lat and lon)
-URL=f"http://api.openweathermap.org/geo/1.0/direct?q={CITY},{STATE_CODE}&limit=2&appid={API_KEY}"
-
-from functions import get_geocodes
-LATITUDE,LONGITUDE = get_geocodes(URL)
+# city to geocode first (lat and lon), only index misses call OpenWeatherMap
+from functions import GeocodeIndex
+geocode_index = GeocodeIndex()
+LATITUDE,LONGITUDE = geocode_index.lookup(CITY, STATE_CODE, api_key=API_KEY)
+print(f"Geocode index stats: {geocode_index.stats()}")
+geocode_index.close()
 
 # ADD GREATER ERROR HANDLING IN GEO CODE FUNCTION
 if LATITUDE is None or LONGITUDE is None:
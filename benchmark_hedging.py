@@ -0,0 +1,94 @@
+# tail latency of forecast fetches against local stand-in providers, with and without hedging:
+# each stand-in answers in a few ms but now and then stalls or fails, like a slow api retrying with backoff
+#   python benchmark_hedging.py --requests 500 --output hedging_results.json
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+from functions.async_fetch import decode_weather_responses
+from functions.forecast import daily_forecast, hourly_forecast
+from functions.providers import HedgedProviders, LatencyTracker, ProviderError
+from record_fixtures import FORECAST_FIXTURE, LATITUDE, LONGITUDE, TIMEZONE
+
+
+class StandInProvider:
+    def __init__(self, name, payload, median=0.02, stall_rate=0.05, stall_seconds=0.5, failure_rate=0.01, seed=0):
+        self.name = name
+        self.payload = payload
+        self.median = median
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    async def fetch_forecast(self, LATITUDE, LONGITUDE, timezone, forecast_days=1, consumers=None):
+        self.requests += 1
+        delay = self.median * self.random.lognormvariate(0, 0.3)
+        if self.random.random() < self.stall_rate:
+            delay += self.stall_seconds
+        await asyncio.sleep(delay)
+        if self.random.random() < self.failure_rate:
+            raise ProviderError(f"{self.name} returned status 502")
+        response = decode_weather_responses(self.payload)[0]
+        return hourly_forecast(response), daily_forecast(response)
+
+async def run_mode(payload, mode, requests, concurrency, args):
+    primary = StandInProvider("primary", payload, args.median, args.stall_rate, args.stall_seconds, args.failure_rate, seed=1)
+    secondary = StandInProvider("secondary", payload, args.median * 1.5, args.stall_rate, args.stall_seconds, args.failure_rate, seed=2)
+    tracker = LatencyTracker(default_delay=args.median * 3)
+    providers = HedgedProviders([primary] if mode == "primary only" else [primary, secondary], tracker, hedge=mode == "hedged")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await providers.fetch_forecast(LATITUDE, LONGITUDE, TIMEZONE)
+            except ProviderError:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    latencies = np.array(latencies) * 1000
+    return {
+        "mode": mode,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "max_ms": round(float(latencies.max()), 1),
+        "failures": failures,
+        "requests_per_fetch": round((primary.requests + secondary.requests) / requests, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail latency of hedged forecast fetches against stand-in providers")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.02, help="typical stand-in response time, seconds")
+    parser.add_argument("--stall-rate", type=float, default=0.05, help="share of responses that stall")
+    parser.add_argument("--stall-seconds", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--output", help="also write the results as json")
+    args = parser.parse_args()
+
+    with open(FORECAST_FIXTURE, "rb") as file:
+        payload = file.read()
+    results = [asyncio.run(run_mode(payload, mode, args.requests, args.concurrency, args)) for mode in ("primary only", "fallback", "hedged")]
+    print(f"{'mode':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'failed':>8}{'req/fetch':>11}")
+    for result in results:
+        print(f"{result['mode']:<14}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}{result['max_ms']:>9}{result['failures']:>8}{result['requests_per_fetch']:>11}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"options": vars(args), "results": results}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# encode time and upload size of each chart encoding save_plot_to_buffer supports, so CPU can be
+# traded for upload bytes knowingly
+#   python benchmark_image_encoding.py --charts 20 --output encoding_results.json
+import time
+import json
+import argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from benchmark_plot_renderer import make_hourly_df
+from functions.data_plot_creation import TemperaturePlotRenderer, encode_figure
+
+ENCODINGS = [
+    ("png (matplotlib default)", {}),
+    ("png compress_level=1", {"compress_level": 1}),
+    ("png compress_level=9", {"compress_level": 9}),
+    ("png dpi=80", {"dpi": 80}),
+    ("png 256 colors", {"colors": 256}),
+    ("png 64 colors", {"colors": 64}),
+    ("png 32 colors", {"colors": 32}),
+    ("png 64 colors dpi=80", {"colors": 64, "dpi": 80}),
+    ("webp lossless", {"format": "webp"}),
+    ("webp quality=90", {"format": "webp", "quality": 90}),
+    ("webp quality=75", {"format": "webp", "quality": 75}),
+]
+
+# largest per-channel difference from the default png, 0 is pixel identical
+def max_pixel_error(reference, data):
+    image = np.asarray(Image.open(BytesIO(data)).convert("RGB"), dtype=np.int16)
+    if image.shape != reference.shape:
+        return None
+    return int(np.abs(image - reference).max())
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chart encodings by encode time and upload size")
+    parser.add_argument("--charts", type=int, default=20)
+    parser.add_argument("--output", help="also write the results as json")
+    args = parser.parse_args()
+
+    # the figure is drawn by the encode itself, so every option pays the same draw cost
+    renderer = TemperaturePlotRenderer()
+    frames = [make_hourly_df(seed) for seed in range(args.charts)]
+
+    results = []
+    for name, options in ENCODINGS:
+        seconds = []
+        sizes = []
+        errors = []
+        for hourly_weather_df in frames:
+            fig = renderer.render(hourly_weather_df)
+            reference = BytesIO()
+            encode_figure(fig, reference)
+            reference = np.asarray(Image.open(reference).convert("RGB"), dtype=np.int16)
+
+            buffer = BytesIO()
+            start = time.perf_counter()
+            encode_figure(fig, buffer, **options)
+            seconds.append(time.perf_counter() - start)
+            sizes.append(buffer.tell())
+            errors.append(max_pixel_error(reference, buffer.getvalue()))
+        results.append({
+            "encoding": name,
+            "options": options,
+            "median_encode_ms": round(float(np.median(seconds)) * 1000, 2),
+            "mean_bytes": int(np.mean(sizes)),
+            "max_pixel_error": None if None in errors else max(errors),
+        })
+    renderer.close()
+
+    baseline = results[0]["mean_bytes"]
+    print(f"{'encoding':<26}{'encode ms':>10}{'bytes':>10}{'size':>8}{'max px err':>12}")
+    for result in results:
+        error = "resized" if result["max_pixel_error"] is None else result["max_pixel_error"]
+        print(f"{result['encoding']:<26}{result['median_encode_ms']:>10.1f}{result['mean_bytes']:>10}{result['mean_bytes'] / baseline:>8.0%}{error:>12}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"charts": args.charts, "results": results}, file, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# offline end-to-end benchmark: geocode and Open-Meteo answers are replayed from fixtures/ and DMs go
+# to a local stand-in Discord server, so per-stage numbers are reproducible and diffable between commits
+#   python benchmark_pipeline.py --recipients 1 100 10000 --output benchmark_results.json
+import os
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+import functions.async_fetch as async_fetch
+import functions.metrics as metrics
+import functions.open_weather_api as open_weather_api
+from fake_discord import FakeDiscordServer, use_fake_discord
+from functions.async_fetch import AsyncWeatherFetcher
+from functions.data_plot_creation import TemperaturePlotRenderer
+from functions.data_processing import create_weather_messages
+from functions.discord_bot import send_weather_batch
+from functions.discord_rest import DiscordRestSender
+from functions.forecast import daily_forecast, hourly_forecast
+from functions.geocode_index import GeocodeIndex
+from functions.render_pool import PlotRenderPool, chart_payload_for_forecast
+
+BENCHMARK_TOKEN = "benchmark-token"
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage, start, items):
+        seconds = time.perf_counter() - start
+        self.stages[stage] = {"seconds": round(seconds, 6), "items": items, "per_second": round(items / seconds, 2) if seconds else None}
+
+# delivery "client": discord.py logged in over HTTP, "rest": DiscordRestSender straight to the API
+async def send_batch(server, jobs, max_concurrent_sends, delivery):
+    if delivery == "rest":
+        async with DiscordRestSender(BENCHMARK_TOKEN, max_concurrent_sends, api_base=f"{server.base_url}/api/v10", channels_path=None) as sender:
+            return await sender.send(jobs)
+    return await send_weather_batch(jobs, bot_token=BENCHMARK_TOKEN, max_concurrent_sends=max_concurrent_sends, connect_gateway=False)
+
+async def run_once(server, recipients, locations, max_concurrent_sends, render_pool=None, delivery="client"):
+    timer = StageTimer()
+    metrics.reset(f"{recipients}-recipients")
+    locations = min(locations, recipients)
+    # recipients are spread over a handful of locations, like real subscribers
+    location_of = np.arange(recipients) % locations
+
+    async with AsyncWeatherFetcher() as fetcher:
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as directory:
+            geocode_index = GeocodeIndex(os.path.join(directory, "geocodes.sqlite"))
+            geocodes = [await geocode_index.lookup_async(f"City {index}", "06", fetch=fetcher.get_geocodes) for index in range(locations)]
+            geocode_index.close()
+        timer.record("geocode", start, locations)
+
+        # the fixture holds one point, spread the locations over distinct grid cells
+        coordinates = [(round(latitude + index * 0.25, 4), longitude) for index, (latitude, longitude) in enumerate(geocodes)]
+        start = time.perf_counter()
+        responses = await fetcher.get_weather_data_batch(coordinates)
+        timer.record("forecast_fetch", start, locations)
+
+    start = time.perf_counter()
+    daily = [daily_forecast(response) for response in responses]
+    hourly = [hourly_forecast(response).from_hour(6) for response in responses]
+    messages = create_weather_messages(
+        [str(300000000000000000 + index) for index in range(recipients)],
+        [f"User {index}" for index in range(recipients)],
+        np.array([daily[location]["temperature_2m_max"][0] for location in location_of]),
+        np.array([daily[location]["temperature_2m_min"][0] for location in location_of]),
+        np.array([daily[location]["uv_index_max"][0] for location in location_of]),
+    )
+    timer.record("forecast_build", start, recipients)
+
+    messages_before = server.counts["message"]
+    if render_pool is None:
+        # one chart per location, every recipient at that location shares its bytes
+        start = time.perf_counter()
+        renderer = TemperaturePlotRenderer()
+        charts = [renderer.render_png(forecast.to_pandas()).getvalue() for forecast in hourly]
+        renderer.close()
+        timer.record("plot_render", start, locations)
+
+        jobs = [(300000000000000000 + index, messages[index], charts[location_of[index]]) for index in range(recipients)]
+        start = time.perf_counter()
+        results = await send_batch(server, jobs, max_concurrent_sends, delivery)
+        timer.record("discord_send", start, recipients)
+    else:
+        # charts come back from the worker processes as they finish, and their recipients' DMs start right away
+        charts = {}
+
+        async def stream_jobs():
+            payloads = [chart_payload_for_forecast(location, forecast) for location, forecast in enumerate(hourly)]
+            async for location, png in render_pool.render_async(payloads):
+                charts[location] = png
+                for index in np.flatnonzero(location_of == location):
+                    yield (300000000000000000 + int(index), messages[index], png)
+
+        start = time.perf_counter()
+        results = await send_batch(server, stream_jobs(), max_concurrent_sends, delivery)
+        timer.record("plot_render_and_send", start, recipients)
+
+    failures = [result["error"] for result in results if not result["success"]]
+    if failures:
+        raise RuntimeError(f"{len(failures)} sends failed, first error: {failures[0]}")
+    if server.counts["message"] - messages_before != recipients:
+        raise RuntimeError(f"Stand-in Discord received {server.counts['message'] - messages_before} messages, expected {recipients}")
+
+    total = sum(stage["seconds"] for stage in timer.stages.values())
+    # finer-grained spans recorded inside the pipeline (png encode, discord login, per-DM sends)
+    run_metrics = metrics.reset()
+    return {
+        "recipients": recipients,
+        "locations": locations,
+        "chart_bytes": len(charts[0]),
+        "render_processes": render_pool.processes if render_pool else 0,
+        "delivery": delivery,
+        "total_seconds": round(total, 6),
+        "recipients_per_second": round(recipients / total, 2),
+        "stages": timer.stages,
+        "spans": dict(run_metrics.stage_items()),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run_benchmarks(args):
+    server = await FakeDiscordServer(latency=args.discord_latency).start()
+    use_fake_discord(server.base_url)
+    open_weather_api.GEOCODE_URL = f"{server.base_url}/geo/1.0/direct"
+    async_fetch.OPEN_MATEO_URL = f"{server.base_url}/v1/forecast"
+    render_pool = None
+    if args.render_processes:
+        start = time.perf_counter()
+        render_pool = PlotRenderPool(args.render_processes).warm()
+        print(f"{args.render_processes} render processes warmed in {time.perf_counter() - start:.3f}s")
+    try:
+        runs = []
+        for recipients in args.recipients:
+            run = await run_once(server, recipients, args.locations, args.max_concurrent_sends, render_pool, args.delivery)
+            print(f"{recipients:>6} recipients: {run['total_seconds']:.3f}s total, " + ", ".join(f"{stage} {values['seconds']:.3f}s" for stage, values in run["stages"].items()))
+            runs.append(run)
+        return runs
+    finally:
+        await server.stop()
+        if render_pool is not None:
+            render_pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--recipients", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--locations", type=int, default=20, help="distinct locations the recipients are spread over")
+    parser.add_argument("--max-concurrent-sends", type=int, default=50)
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="seconds the stand-in Discord adds to each call")
+    parser.add_argument("--render-processes", type=int, default=0, help="render charts in this many worker processes, streaming each into the sends (0 renders in-process)")
+    parser.add_argument("--delivery", choices=("client", "rest"), default="client", help="send through a discord.py client or straight over the HTTP API")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    runs = asyncio.run(run_benchmarks(args))
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"locations": args.locations, "max_concurrent_sends": args.max_concurrent_sends, "discord_latency": args.discord_latency, "render_processes": args.render_processes, "delivery": args.delivery},
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import matplotlib.image as mpimg
+
+from functions.data_plot_creation import create_temperature_plot, save_plot_to_buffer, TemperaturePlotRenderer
+
+
+# synthetic 6am+ hourly frames, shaped like the one cloud_ready_weather_bot.py builds
+def make_hourly_df(seed):
+    rng = np.random.default_rng(seed)
+    date = pd.date_range(f"2026-10-{1 + seed % 28:02d} 06:00", periods=18, freq="h", tz="America/Los_Angeles")
+    hourly_weather_df = pd.DataFrame({
+        "date": date,
+        "temperature_2m": (rng.uniform(40, 70) + 15 * np.sin(np.linspace(0, np.pi, 18)) + rng.normal(0, 1, 18)).astype(np.float32),
+        "precipitation": np.where(rng.random(18) < 0.3, rng.choice([0.5, 3.0, 10.0, 60.0], 18), 0.0).astype(np.float32),
+    })
+    hourly_weather_df["hour"] = hourly_weather_df["date"].dt.hour
+    return hourly_weather_df
+
+def render_original(hourly_weather_df):
+    return save_plot_to_buffer(create_temperature_plot(hourly_weather_df)).getvalue()
+
+def charts_per_second(render, frames):
+    start = time.perf_counter()
+    for hourly_weather_df in frames:
+        render(hourly_weather_df)
+    return len(frames) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare create_temperature_plot with TemperaturePlotRenderer")
+    parser.add_argument("--charts", type=int, default=50)
+    args = parser.parse_args()
+
+    frames = [make_hourly_df(seed) for seed in range(args.charts)]
+    renderer = TemperaturePlotRenderer()
+
+    # the template renderer must draw exactly the same pixels as the original function
+    for hourly_weather_df in frames[:5]:
+        original = mpimg.imread(save_plot_to_buffer(create_temperature_plot(hourly_weather_df)), format="png")
+        templated = mpimg.imread(renderer.render_png(hourly_weather_df), format="png")
+        if original.shape != templated.shape or not np.array_equal(original, templated):
+            raise SystemExit("TemperaturePlotRenderer output differs from create_temperature_plot")
+    print("Output check: identical pixels")
+
+    original_rate = charts_per_second(render_original, frames)
+    renderer_rate = charts_per_second(lambda hourly_weather_df: renderer.render_png(hourly_weather_df).getvalue(), frames)
+    renderer.close()
+
+    print(f"create_temperature_plot + save_plot_to_buffer: {original_rate:.1f} charts/s")
+    print(f"TemperaturePlotRenderer.render_png:            {renderer_rate:.1f} charts/s ({renderer_rate / original_rate:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# leak check for long-running mode: the fixture pipeline (decode, forecast, message, chart, DM to a
+# local stand-in Discord) runs N times in one process, like a daemon over many days, and RSS and
+# tracemalloc are sampled after every iteration. growth that keeps going after warm-up is a leak
+#   python benchmark_soak.py --iterations 400 --output soak_results.json
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+
+from fake_discord import FakeDiscordServer, use_fake_discord
+from functions.async_fetch import decode_weather_responses
+from functions.data_plot_creation import TemperaturePlotRenderer
+from functions.data_processing import create_weather_messages
+from functions.discord_rest import DiscordRestSender
+from functions.forecast import daily_forecast, hourly_forecast
+from functions.plot_cache import PlotCache
+from record_fixtures import LATITUDE, LONGITUDE, TIMEZONE, UTC_OFFSET_SECONDS, encode_weather_response, synthetic_forecast
+
+SOAK_TOKEN = "soak-token"
+SAMPLE_FIELDS = ("seconds", "rss_bytes", "traced_bytes", "open_figures", "plot_cache_bytes")
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # no /proc (macOS): peak RSS is the closest stand-in, in KB on Linux and bytes on macOS
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# bytes per iteration, least squares over the samples after warm-up
+def growth_per_iteration(samples):
+    if len(samples) < 2:
+        return 0.0
+    return float(np.polyfit(np.arange(len(samples)), samples, 1)[0])
+
+# a day's forecast per iteration, cycling through distinct ones so the chart cache both hits and evicts
+def fixture_payloads(distinct):
+    payloads = []
+    for seed in range(distinct):
+        daily, hourly = synthetic_forecast(seed=seed)
+        payloads.append(encode_weather_response(LATITUDE, LONGITUDE, UTC_OFFSET_SECONDS, TIMEZONE, daily, hourly))
+    return payloads
+
+async def run_iteration(payload, sender, render, recipients):
+    response = decode_weather_responses(payload)[0]
+    daily = daily_forecast(response).day(0)
+    hourly_weather_df = hourly_forecast(response).day(0).from_hour(6).to_pandas()
+    messages = create_weather_messages(
+        [str(300000000000000000 + index) for index in range(recipients)],
+        [f"User {index}" for index in range(recipients)],
+        np.repeat(daily["temperature_2m_max"][:1], recipients),
+        np.repeat(daily["temperature_2m_min"][:1], recipients),
+        np.repeat(daily["uv_index_max"][:1], recipients),
+    )
+    columns = list(hourly_weather_df.columns)
+    png = render(hourly_weather_df)
+    if list(hourly_weather_df.columns) != columns:
+        raise RuntimeError(f"Rendering changed the caller's DataFrame: {columns} -> {list(hourly_weather_df.columns)}")
+    results = await sender.send([(300000000000000000 + index, messages[index], png) for index in range(recipients)])
+    failures = [result["error"] for result in results if not result["success"]]
+    if failures:
+        raise RuntimeError(f"{len(failures)} sends failed, first error: {failures[0]}")
+
+async def soak(args):
+    payloads = fixture_payloads(args.distinct_forecasts)
+    server = await FakeDiscordServer(keep_messages=False).start()
+    use_fake_discord(server.base_url)
+    # "figure": a new figure per chart (create_temperature_plot), "template": one TemperaturePlotRenderer
+    plot_cache = PlotCache(max_bytes=args.plot_cache_bytes)
+    renderer = TemperaturePlotRenderer() if args.renderer == "template" else None
+    if renderer is None:
+        render = lambda df: plot_cache.get_or_render(df).getvalue()
+    else:
+        render = lambda df: plot_cache.get_or_render(df, render=renderer.render_png).getvalue()
+    rc_before = dict(matplotlib.rcParams)
+
+    # one preallocated row per iteration, so recording the samples does not itself show up as growth
+    samples = np.zeros(args.iterations, dtype=[(name, np.float64) for name in SAMPLE_FIELDS])
+    tracemalloc.start(args.trace_frames)
+    baseline = None
+    try:
+        async with DiscordRestSender(SOAK_TOKEN, api_base=f"{server.base_url}/api/v10", channels_path=None) as sender:
+            for iteration in range(args.iterations):
+                start = time.perf_counter()
+                await run_iteration(payloads[iteration % len(payloads)], sender, render, args.recipients)
+                seconds = time.perf_counter() - start
+                gc.collect()
+                sample = samples[iteration]
+                sample["seconds"] = seconds
+                sample["rss_bytes"] = rss_bytes()
+                sample["traced_bytes"] = tracemalloc.get_traced_memory()[0]
+                sample["open_figures"] = len(plt.get_fignums())
+                sample["plot_cache_bytes"] = plot_cache.total_bytes
+                if iteration + 1 == args.warmup:
+                    baseline = tracemalloc.take_snapshot()
+                if iteration % args.report_every == 0 or iteration + 1 == args.iterations:
+                    print(f"{iteration:>6} {sample['rss_bytes'] / 2**20:>9.1f} {sample['traced_bytes'] / 2**10:>11.1f} {sample['open_figures']:>8.0f} {sample['plot_cache_bytes'] / 2**10:>10.1f} {seconds * 1000:>8.1f}")
+        final = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        await server.stop()
+        if renderer is not None:
+            renderer.close()
+
+    steady = samples[args.warmup:]
+    # snapshots and stats lines above are the harness's own, left out of the listing
+    harness = tracemalloc.Filter(False, __file__)
+    top_growth = []
+    if baseline is not None:
+        for stat in final.filter_traces([harness]).compare_to(baseline.filter_traces([harness]), "lineno")[:args.top]:
+            if stat.size_diff > 0:
+                top_growth.append({"where": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff})
+    return {
+        "rss_growth_per_iteration": round(growth_per_iteration(steady["rss_bytes"]), 1),
+        "traced_growth_per_iteration": round(growth_per_iteration(steady["traced_bytes"]), 1),
+        "max_open_figures": int(samples["open_figures"].max()),
+        "global_rc_changed": sorted(key for key, value in matplotlib.rcParams.items() if rc_before.get(key) != value),
+        "plot_cache": plot_cache.stats(),
+        "top_growth": top_growth,
+        "samples": [{"iteration": iteration, **{name: round(float(row[name]), 4) if name == "seconds" else int(row[name]) for name in SAMPLE_FIELDS}} for iteration, row in enumerate(samples)],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fixture pipeline repeatedly and report memory growth")
+    parser.add_argument("--iterations", type=int, default=400)
+    # matplotlib's text-metrics cache is per renderer and capped at 4096 entries, a new figure per chart fills it in ~200 charts
+    parser.add_argument("--warmup", type=int, default=200, help="iterations left out of the growth figures (bounded caches filling up, first imports)")
+    parser.add_argument("--recipients", type=int, default=5, help="DMs per iteration, all sharing its chart")
+    parser.add_argument("--distinct-forecasts", type=int, default=50, help="forecasts cycled through, each one its own chart")
+    parser.add_argument("--renderer", choices=("figure", "template"), default="figure")
+    parser.add_argument("--plot-cache-bytes", type=int, default=1024 * 1024, help="chart cache cap, below the distinct charts' total so it evicts")
+    parser.add_argument("--max-growth", type=float, default=1024, help="traced bytes per iteration above which the run fails")
+    parser.add_argument("--trace-frames", type=int, default=1)
+    parser.add_argument("--top", type=int, default=10, help="allocation sites listed by growth after warm-up")
+    parser.add_argument("--report-every", type=int, default=20)
+    parser.add_argument("--output", help="also write the results, with every sample, as json")
+    args = parser.parse_args()
+    if not 0 < args.warmup < args.iterations:
+        parser.error("--warmup must be at least 1 and below --iterations")
+
+    print(f"{'iter':>6} {'rss MB':>9} {'traced KB':>11} {'figures':>8} {'cache KB':>10} {'ms':>8}")
+    results = asyncio.run(soak(args))
+    print(f"after {args.warmup} warm-up iterations: rss {results['rss_growth_per_iteration']:+.0f} B/iteration, traced {results['traced_growth_per_iteration']:+.0f} B/iteration")
+    for site in results["top_growth"]:
+        print(f"  {site['size_diff_bytes']:>+10} B {site['count_diff']:>+7} blocks  {site['where']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"options": vars(args), **results}, file, indent=2)
+
+    problems = []
+    if results["traced_growth_per_iteration"] > args.max_growth:
+        problems.append(f"traced memory grows {results['traced_growth_per_iteration']:.0f} B per iteration")
+    if results["max_open_figures"] > (1 if args.renderer == "template" else 0):
+        problems.append(f"{results['max_open_figures']} figures left open")
+    if results["global_rc_changed"]:
+        problems.append(f"global matplotlib rcParams changed: {', '.join(results['global_rc_changed'][:5])}")
+    if problems:
+        raise SystemExit("Soak test failed: " + "; ".join(problems))
+
+if __name__ == "__main__":
+    main()
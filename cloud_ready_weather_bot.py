@@ -1,46 +1,63 @@
 import sys
 import os
+import time
+import argparse
+import importlib
 
 # error logging for deployment
 import logging
+from logging.handlers import RotatingFileHandler
 
 # env
 from dotenv import load_dotenv
 
-# open weather api
-import requests
+# per-stage timings, byte counts and cache counters (stdlib only, cheap to import)
+from functions import metrics
+
+# heavy dependencies (requests, pandas, seaborn, matplotlib, discord, openmeteo)
+# are imported by the stage that needs them, so a cold start only pays for what runs
+PROCESS_START = time.perf_counter()
+IMPORT_TIMINGS = {}
+
+def timed_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMINGS[name] = time.perf_counter() - start
+    return module
+
+def load_plotting():
+    matplotlib = timed_import("matplotlib")
+    matplotlib.use('Agg')
+    plt = timed_import("matplotlib.pyplot")
+    sns = timed_import("seaborn")
+    return sns, plt
+
+# per-import cost of this run, slowest first
+def startup_timing_report():
+    lines = [f"{name}: {seconds * 1000:.1f} ms" for name, seconds in sorted(IMPORT_TIMINGS.items(), key=lambda item: item[1], reverse=True)]
+    lines.append(f"total imports: {sum(IMPORT_TIMINGS.values()) * 1000:.1f} ms, process uptime: {(time.perf_counter() - PROCESS_START) * 1000:.1f} ms")
+    return "\n".join(lines)
 
-# open mateo weather api
-import openmeteo_requests
-import requests_cache
-import pandas as pd
-from retry_requests import retry
-
-# data plot creation and data processing
-# import pandas as pd # imported earlier
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
-from io import BytesIO
-
-# discord
-import discord
+# load env variables
+load_dotenv()
 
-# Set up logging
+# Set up logging: the log file rolls over at LOG_MAX_BYTES and keeps LOG_BACKUP_COUNT old files,
+# so a daemon running for months stays within (LOG_BACKUP_COUNT + 1) * LOG_MAX_BYTES of disk
+LOG_PATH = os.getenv("LOG_PATH", "weather_app.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 5 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 3))
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout),
-        logging.FileHandler('weather_app.log')
+        RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
     ]
 )
 logger = logging.getLogger(__name__)
 
-# load env variables
-load_dotenv()
-
 
 # constants
 API_KEY=os.getenv("API_KEY")
@@ -49,49 +66,58 @@ STATE_CODE="06"
 NAME="Anton"
 USER_ID = os.getenv("DISCORD_USER_ID")
 BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
+WEEKLY_CHART_DAYS = 7
+DISCORD_DELIVERY = os.getenv("DISCORD_DELIVERY", "rest")
 
 def get_geocodes(url):
+    requests = timed_import("requests")
+    get_http_session = timed_import("functions.http_client").get_http_session
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-
-            if not data:
-                logger.error(f"No geocoding data found for {CITY}, {STATE_CODE}")
-                return None, None
-            # print(data[0])
-            latitude = data[0]['lat']
-            longitude = data[0]['lon']
-            if latitude is not None and longitude is not None:  
-                return latitude,longitude
+        # pooled keep-alive session shared with the rest of the process
+        response = get_http_session().get(url)
+        if response.status_code != 200:
+            logger.error(f"Geocoding request failed with status {response.status_code}")
+            return None, None
+
+        data = response.json()
+
+        if not data:
+            logger.error(f"No geocoding data found for {CITY}, {STATE_CODE}")
+            return None, None
+        # print(data[0])
+        latitude = data[0]['lat']
+        longitude = data[0]['lon']
+        if latitude is not None and longitude is not None:  
+            return latitude,longitude
+        return None, None
     except requests.exceptions.RequestException as e:
         logger.error(f"Error getting geocodes: {str(e)}")
         return None, None
 
-def get_weather_data(LATITUDE, LONGITUDE):
+def get_weather_data(LATITUDE, LONGITUDE, forecast_days=1, consumers=None):
+    http_client = timed_import("functions.http_client")
+    variables = timed_import("functions.variables")
     try:
-        # Setup the Open-Meteo API client with cache and retry on error
-        cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
-        retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-        openmeteo = openmeteo_requests.Client(session = retry_session)
+        # Shared Open-Meteo client with cache and retry on error, see functions/http_client.py
+        openmeteo = http_client.get_openmeteo_client()
 
         # Validate input parameters
         if not isinstance(LATITUDE, (int, float)) or not isinstance(LONGITUDE, (int, float)):
             raise ValueError("Latitude and longitude must be numeric values")
 
-        # The order of variables in hourly or daily is important to assign them correctly below
+        # only the variables the enabled outputs read, see functions/variables.py
         url = "https://api.open-meteo.com/v1/forecast"
         params = {
             "latitude": LATITUDE,
             "longitude": LONGITUDE,
-            "hourly": ["temperature_2m", "precipitation"],
-            "daily": ["temperature_2m_max", "temperature_2m_min", "sunrise", "sunset", "daylight_duration", "uv_index_max", "precipitation_hours", "precipitation_probability_max"],
+            **variables.request_variables(consumers or variables.DEFAULT_CONSUMERS),
             "temperature_unit": "fahrenheit",
             "wind_speed_unit": "mph",
             "timezone": "America/Los_Angeles",
-            "forecast_days": 1
+            "forecast_days": forecast_days
         }
         responses = openmeteo.weather_api(url, params=params)
+        http_client.trim_forecast_cache()
         if not responses:
             raise ValueError("No data received from Open Mateo API")
         
@@ -104,238 +130,414 @@ def get_weather_data(LATITUDE, LONGITUDE):
         logger.error(f"Unexpected error in get_weather_data: {str(e)}")
         raise
 
-def generate_daily_df(response):
-    daily = response.Daily()
-    daily_temperature_2m_max = daily.Variables(0).ValuesAsNumpy()
-    daily_temperature_2m_min = daily.Variables(1).ValuesAsNumpy()
-    daily_sunrise = daily.Variables(2).ValuesAsNumpy()
-    daily_sunset = daily.Variables(3).ValuesAsNumpy()
-    daily_daylight_duration = daily.Variables(4).ValuesAsNumpy()
-    daily_uv_index_max = daily.Variables(5).ValuesAsNumpy()
-    daily_precipitation_hours = daily.Variables(6).ValuesAsNumpy()
-    daily_precipitation_probability_max = daily.Variables(7).ValuesAsNumpy()
-
-    daily_data = {"date": pd.date_range(
-        start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-        end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-        freq = pd.Timedelta(seconds = daily.Interval()),
-        inclusive = "left"
-    )}
-    daily_data["temperature_2m_max"] = daily_temperature_2m_max
-    daily_data["temperature_2m_min"] = daily_temperature_2m_min
-    daily_data["sunrise"] = daily_sunrise
-    daily_data["sunset"] = daily_sunset
-    daily_data["daylight_duration"] = daily_daylight_duration
-    daily_data["uv_index_max"] = daily_uv_index_max
-    daily_data["precipitation_hours"] = daily_precipitation_hours
-    daily_data["precipitation_probability_max"] = daily_precipitation_probability_max
-
-    daily_dataframe = pd.DataFrame(data = daily_data)
-    return daily_dataframe
-
-def generate_hourly_df(response):
-    hourly = response.Hourly()
-    hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-    hourly_precipitation = hourly.Variables(1).ValuesAsNumpy()
-
-    hourly_data = {"date": pd.date_range(
-        start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
-        end = pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
-        freq = pd.Timedelta(seconds = hourly.Interval()),
-        inclusive = "left"
-    )}
-    hourly_data["temperature_2m"] = hourly_temperature_2m
-    hourly_data["precipitation"] = hourly_precipitation
-
-    hourly_dataframe = pd.DataFrame(data = hourly_data)
-    return hourly_dataframe
-
-# discord message creation
+# discord message creation, UV/temperature formatting is table driven in functions/forecast_classification.py
 def create_weather_message(user_id, daily_weather_df, NAME):
-    daily_high_temp = round(daily_weather_df.loc[0, "temperature_2m_max"],1)
-    formatted_daily_high_temp = f"{daily_high_temp:.1f}"
-    # print(formatted_daily_high_temp)
-
-    daily_low_temp = round(daily_weather_df.loc[0, "temperature_2m_min"],1)
-    formatted_daily_low_temp = f"{daily_low_temp:.1f}"
-    # print(formatted_daily_low_temp)
-
-    # useless data (nothing here)
-    # daily_sunrise = daily_weather_df.loc[0,'sunrise']
-    # daily_sunset = daily_weather_df.loc[0,'sunset']
-
-    daily_UV_index = round(daily_weather_df.loc[0,'uv_index_max'],1)
-    # print(daily_UV_index)
-
-    if (daily_UV_index < 3):
-        UV_index_string = f"{daily_UV_index:.1f} - Low Risk"
-    elif (daily_UV_index < 6):
-        UV_index_string = f"{daily_UV_index:.1f} - Medium Risk"
-    elif (daily_UV_index < 8):
-        UV_index_string = f"{daily_UV_index:.1f} - High Risk"
-    elif (daily_UV_index < 11):
-        UV_index_string = f"{daily_UV_index:.1f} - Very High Risk"
-    else:
-        UV_index_string = f"{daily_UV_index:.1f} - Extreme Risk"
-    
-
-
-    weather_message = (
-        f"<@{user_id}>\n"
-        f"Good morning {NAME}!\n\n"
-        "Today's forecast:\n"
-        f"- High: {formatted_daily_high_temp} °F\n"
-        f"- Low: {formatted_daily_low_temp} °F\n"
-        f"- UV Index: {UV_index_string}\n"
-        "\n\n"
-    )
-    return weather_message
+    return timed_import("functions.data_processing").create_weather_message(user_id, daily_weather_df, NAME)
 
 # create plots
 def create_temperature_plot(hourly_weather_df):
+    sns, plt = load_plotting()
     date = hourly_weather_df['date'].dt.date.iloc[0]
 
-    # Define precipitation thresholds and colors
-    def get_precipitation_color(precip):
-        if precip == 0:
-            return '#1f77b4'  # blue
-        elif precip <= 2.5:
-            return '#2ecc71'  # green
-        elif precip <= 7.6:
-            return '#f1c40f'  # yellow
-        elif precip <= 50:
-            return '#e74c3c'  # red
-        else:
-            return '#c0392b'  # dark red
-    
-    # Apply color mapping to precipitation
-    hourly_weather_df['point_color'] = hourly_weather_df['precipitation'].apply(get_precipitation_color)
-
-    sns.set_theme(style="whitegrid")
-    fig, ax = plt.subplots(figsize=(8,6))
-    sns.lineplot(
-        x='hour',
-        y='temperature_2m',
-        data=hourly_weather_df,
-        color='gray',
-        alpha=0.5
-    )
-    sns.scatterplot(
-        x='hour',
-        y='temperature_2m',
-        data=hourly_weather_df,
-        color=hourly_weather_df['point_color'],
-        s=100,
-        ax=ax
-    )
-
-    # Add color legend for precipitation
-    legend_elements = [
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#1f77b4', label='No precipitation', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#2ecc71', label='Light (≤2.5mm)', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#f1c40f', label='Medium (≤7.6mm)', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#e74c3c', label='Heavy (≤50mm)', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#c0392b', label='Extreme (>50mm)', markersize=10),
-    ]
-    ax.legend(handles=legend_elements, title='Precipitation', loc='upper right')
-
-
-    ax.set_title(f"Temperature for {date}", fontsize=16, pad=20, fontweight='bold')
-    ax.set_xlabel("Hour of Day", fontsize=13, fontweight='bold', labelpad=15)
-    ax.set_ylabel("Temperature (°F)", fontsize=13, fontweight='bold', labelpad=10)
-
-    ax.set_xticks(range(6, 25, 2))
-    # Set y-axis limits
-    ax.set_ylim(25, 110)
-    ax.tick_params(axis='both', labelsize=12)
-    plt.tight_layout()
+    # Apply color mapping to precipitation (thresholds live in functions/forecast_classification.py)
+    # into a local array, the caller's DataFrame is left as it was
+    forecast_classification = timed_import("functions.forecast_classification")
+    point_colors = forecast_classification.precipitation_colors(hourly_weather_df['precipitation'].to_numpy())
+
+    # the seaborn theme only applies while this chart is drawn, see functions/data_plot_creation.py
+    with timed_import("functions.data_plot_creation").plot_theme():
+        fig, ax = plt.subplots(figsize=(8,6))
+        sns.lineplot(
+            x='hour',
+            y='temperature_2m',
+            data=hourly_weather_df,
+            color='gray',
+            alpha=0.5
+        )
+        sns.scatterplot(
+            x='hour',
+            y='temperature_2m',
+            data=hourly_weather_df,
+            color=point_colors,
+            s=100,
+            ax=ax
+        )
+
+        # Add color legend for precipitation
+        legend_elements = [
+            plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=color, label=label, markersize=10)
+            for _, color, label in forecast_classification.PRECIPITATION_LEVELS
+        ]
+        ax.legend(handles=legend_elements, title='Precipitation', loc='upper right')
+
+
+        ax.set_title(f"Temperature for {date}", fontsize=16, pad=20, fontweight='bold')
+        ax.set_xlabel("Hour of Day", fontsize=13, fontweight='bold', labelpad=15)
+        ax.set_ylabel("Temperature (°F)", fontsize=13, fontweight='bold', labelpad=10)
+
+        ax.set_xticks(range(6, 25, 2))
+        # Set y-axis limits
+        ax.set_ylim(25, 110)
+        ax.tick_params(axis='both', labelsize=12)
+        fig.tight_layout()
 
     return fig
 
-def save_plot_to_buffer(fig):
-    buffer = BytesIO()
-    fig.savefig(buffer, format='png')
-    buffer.seek(0) # move to the start of buffer
-    plt.close(fig) # close the figure to free memory
-    return buffer
-
-async def start_discord_weather_bot(user_id, weather_message, hourly_weather_df):
+# dpi, palette, compression and webp options live in functions/data_plot_creation.py
+def save_plot_to_buffer(fig, **plot_options):
+    load_plotting()
+    return timed_import("functions.data_plot_creation").save_plot_to_buffer(fig, **plot_options)
+
+def plot_options_from_args(args):
+    return {key: value for key, value in (("format", args.plot_format), ("dpi", args.plot_dpi), ("colors", args.plot_colors)) if value is not None}
+
+# delivery: "rest" posts straight to Discord's HTTP API (functions/discord_rest.py), "client" goes through discord.py
+async def start_discord_weather_batch(jobs, delivery=DISCORD_DELIVERY):
+    # jobs are written to the delivery outbox before the first attempt: a failed DM is retried from
+    # there (with backoff, honouring Discord's retry_after) and never needs the pipeline rerun
+    # discord.py is only imported for the client path, the REST sender loads it only if a send fails
+    if delivery == "rest":
+        send_outbox = timed_import("functions.discord_rest").send_outbox
+    else:
+        send_outbox = timed_import("functions.discord_bot").send_outbox
+    outbox_module = timed_import("functions.outbox")
+    outbox = outbox_module.DeliveryOutbox()
     try:
-        # Set up Discord client
-        intents = discord.Intents.default()
-        intents.message_content = True
-        client = discord.Client(intents=intents)
-        
-        # Create plot
-        fig = create_temperature_plot(hourly_weather_df)
-        buffer = save_plot_to_buffer(fig)
-        
-        @client.event
-        async def on_ready():
-            try:
-                logger.info(f'Logged in as {client.user}')
-                user = await client.fetch_user(int(user_id))
-                await user.send(weather_message, file=discord.File(buffer, 'plot.png'))
-                logger.info("Weather message and plot sent successfully")
-                await client.close()
-            except discord.errors.NotFound:
-                logger.error(f"User with ID {user_id} not found")
-                await client.close()
-            except discord.errors.Forbidden:
-                logger.error("Bot doesn't have permission to send messages to this user")
-                await client.close()
-            except Exception as e:
-                logger.error(f"Error in on_ready: {str(e)}")
-                await client.close()
-        
-        # Get bot token and validate
-        bot_token = os.getenv("DISCORD_BOT_TOKEN")
-        if not bot_token:
-            raise ValueError("Discord bot token not found in environment variables")
-            
-        # Run the client
-        await client.start(bot_token)        
-    except discord.errors.LoginFailure:
-        logger.error("Failed to login to Discord - invalid token")
-        raise
+        # one row per user and day: a rerun after a crash resends the pending row instead of adding another
+        outbox.enqueue_many(jobs, [outbox_module.dedupe_key(job[0], run_date()) for job in jobs])
+        results = await send_outbox(outbox, BOT_TOKEN)
+        logger.info(f"Outbox: {outbox.stats()}")
+        for result in results:
+            if result["success"]:
+                logger.info(f"Weather message and plot sent successfully to {result['user_id']}")
+            else:
+                logger.error(result["error"])
+        return results
     except Exception as e:
-        logger.error(f"Error in send_weather_discord_message: {str(e)}")
+        # only the discord.py client logs in (discord is already loaded by then)
+        if delivery != "rest" and isinstance(e, timed_import("discord").errors.LoginFailure):
+            logger.error("Failed to login to Discord - invalid token")
+        else:
+            logger.error(f"Error in start_discord_weather_batch: {str(e)}")
         raise
+    finally:
+        outbox.close()
+
+async def start_discord_weather_bot(user_id, weather_message, hourly_weather_df, plot_options=None, weekly=False, delivery=DISCORD_DELIVERY):
+    # text-only fast path: no plot, and the plotting stack is never imported
+    if hourly_weather_df is None:
+        return await start_discord_weather_batch([(user_id, weather_message, None)], delivery)
+
+    try:
+        # Create plot
+        if weekly:
+            # records its own plot_render span
+            fig = timed_import("functions.data_plot_creation").create_weekly_temperature_plot(hourly_weather_df)
+        else:
+            with metrics.span("plot_render"):
+                fig = create_temperature_plot(hourly_weather_df)
+        buffer = save_plot_to_buffer(fig, **(plot_options or {}))
+
+        return await start_discord_weather_batch([(user_id, weather_message, buffer)], delivery)
     finally:
         # Ensure the buffer is closed
         if 'buffer' in locals():
             buffer.close()
 
-def main():
+# forecast arrays stay views of the response buffer, DataFrames are only built for the plot
+# the message is always about today, weekly_days > 1 makes the chart cover that many days of a multi-day response
+def build_forecast_outputs(open_mateo_response, text_only=False, weekly_days=None):
+    forecast = timed_import("functions.forecast")
+    return build_outputs_from_forecasts(forecast.hourly_forecast(open_mateo_response), forecast.daily_forecast(open_mateo_response), text_only, weekly_days)
+
+# same, from the (hourly, daily) Forecast pair any provider returns (functions/providers.py)
+def build_outputs_from_forecasts(hourly, daily, text_only=False, weekly_days=None):
+    daily_forecast = daily.day(0)
+    weather_message = timed_import("functions.data_processing").create_weather_messages(
+        [USER_ID],
+        [NAME],
+        daily_forecast["temperature_2m_max"][:1],
+        daily_forecast["temperature_2m_min"][:1],
+        daily_forecast["uv_index_max"][:1],
+    )[0]
+
+    if text_only:
+        return weather_message, None
+    # local hours come from the response's utc offset, the 6am+ window is a slice (view) of the arrays
+    if weekly_days:
+        hourly_weather_df = hourly.window(0, weekly_days * 86400 // hourly.interval).to_pandas()
+        return weather_message, hourly_weather_df[hourly_weather_df['hour'] >= 6]
+    hourly_weather_df = hourly.day(0).from_hour(6).to_pandas()   # Only hourly weather from 6am and after
+    return weather_message, hourly_weather_df
+
+# one fetch serves the week: --weekly-chart needs at least 7 days in the response
+def forecast_days_from_args(args):
+    return max(args.forecast_days, WEEKLY_CHART_DAYS) if args.weekly_chart else args.forecast_days
+
+def weekly_days_from_args(args):
+    return WEEKLY_CHART_DAYS if args.weekly_chart else None
+
+# a --text-only run has no chart, so the hourly section is not requested at all
+def consumers_from_args(args):
+    return ("message",) if args.text_only else ("message", "temperature_plot")
+
+# same pipeline as main() with geocoding, fetching and sending all on one event loop
+async def run_async_pipeline(args):
+    async_fetch = timed_import("functions.async_fetch")
+    forecast = timed_import("functions.forecast")
+    async with async_fetch.AsyncWeatherFetcher() as fetcher:
+        # --hedge: geocoding and the forecast each go through a primary and a secondary provider
+        geocoders, forecasters = hedged_providers(fetcher) if args.hedge else (None, None)
+        geocode_index = timed_import("functions.geocode_index").GeocodeIndex()
+        try:
+            with metrics.span("geocode"):
+                LATITUDE,LONGITUDE = await geocode_index.lookup_async(CITY, STATE_CODE, api_key=API_KEY, fetch=fetcher.get_geocodes, resolve=geocoders and geocoders.geocode)
+            logger.info(f"Geocode index stats: {geocode_index.stats()}")
+            metrics.record_cache("geocode_index", geocode_index.stats())
+        finally:
+            geocode_index.close()
+
+        if LATITUDE is None or LONGITUDE is None:
+            raise ValueError("Error getting latitude and longitude!")
+
+        with metrics.span("forecast_fetch"):
+            if forecasters is None:
+                open_mateo_response = await fetcher.get_weather_data(LATITUDE, LONGITUDE, forecast_days=forecast_days_from_args(args), consumers=consumers_from_args(args))
+                hourly, daily = forecast.hourly_forecast(open_mateo_response), forecast.daily_forecast(open_mateo_response)
+            else:
+                try:
+                    hourly, daily = await forecasters.fetch_forecast(LATITUDE, LONGITUDE, "America/Los_Angeles", forecast_days_from_args(args), consumers_from_args(args))
+                finally:
+                    logger.info(f"Provider latency: {forecasters.tracker.stats()}")
+                    forecasters.tracker.save()
+
+    with metrics.span("dataframe_build"):
+        weather_message, hourly_weather_df = build_outputs_from_forecasts(hourly, daily, args.text_only, weekly_days_from_args(args))
+    return await start_discord_weather_bot(USER_ID, weather_message, hourly_weather_df, plot_options_from_args(args), weekly=args.weekly_chart, delivery=args.delivery)
+
+# (geocoders, forecasters): OpenWeatherMap then Open-Meteo's geocoding, Open-Meteo then SECONDARY_FORECAST_URL
+# (the forecast is only hedged when one is configured). both share one latency history, kept between runs
+def hedged_providers(fetcher):
+    providers = timed_import("functions.providers")
+    tracker = providers.LatencyTracker().load()
+    geocoders = providers.HedgedProviders([providers.OpenWeatherMapGeocoder(fetcher, API_KEY), providers.OpenMeteoGeocoder(fetcher)], tracker)
+    forecast_providers = [providers.OpenMeteoForecastProvider(fetcher)]
+    if providers.SECONDARY_FORECAST_URL:
+        forecast_providers.append(providers.OpenMeteoForecastProvider(fetcher, providers.SECONDARY_FORECAST_URL, "secondary"))
+    return geocoders, providers.HedgedProviders(forecast_providers, tracker)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send the daily weather forecast over Discord")
+    parser.add_argument("--text-only", action="store_true", help="send the forecast message without a plot (skips the plotting stack entirely)")
+    parser.add_argument("--async-fetch", action="store_true", help="geocode, fetch and send on one asyncio event loop with aiohttp")
+    parser.add_argument("--hedge", action="store_true", help="one-shot --async-fetch runs: ask a secondary geocoder / forecast provider when the primary is slower than its p95 or fails")
+    parser.add_argument("--drain-outbox", action="store_true", help="only resend messages still pending in the delivery outbox from an earlier run")
+    parser.add_argument("--delivery", choices=("rest", "client"), default=DISCORD_DELIVERY, help="send DMs straight over Discord's HTTP API (rest, default) or through a discord.py client")
+    parser.add_argument("--daemon", action="store_true", help="stay resident and send every recipient's forecast at their local send time")
+    parser.add_argument("--watch", action="store_true", help="stay resident, re-poll each subscriber's forecast and send an update when it changes significantly")
+    parser.add_argument("--watch-minutes", type=float, default=30, help="how often --watch re-polls the forecast")
+    parser.add_argument("--high-change", type=float, default=5.0, help="a change in the day's high (°F) that --watch reports")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", 1)), help="number of workers sharing the send: --daemon workers split the forecast cells, one-shot runs send once between them")
+    parser.add_argument("--worker-id", type=int, default=int(os.getenv("WORKER_ID", 0)), help="this worker's index, 0 to --workers - 1")
+    parser.add_argument("--recipients", help="json list of recipients to add to the subscriber registry for --daemon and --watch")
+    parser.add_argument("--subscribers", default=".subscribers.sqlite", help="subscriber registry database for --daemon and --watch (starts out with the single configured user)")
+    parser.add_argument("--send-time", default="07:00", help="local send time (HH:MM) for the default recipient in --daemon mode")
+    parser.add_argument("--forecast-days", type=int, default=int(os.getenv("FORECAST_DAYS", 1)), help="days fetched per forecast call (up to 16); above 1, --daemon keeps them in a forecast store and serves each day from it")
+    parser.add_argument("--weekly-chart", action="store_true", help="send a small-multiples chart of the week's hourly temperatures instead of today's (one-shot runs only)")
+    parser.add_argument("--render-processes", type=int, default=int(os.getenv("RENDER_PROCESSES", 0)), help="--daemon: render each slot's charts in this many worker processes (0 renders them on one thread in-process)")
+    parser.add_argument("--lead-minutes", type=float, default=10, help="fetch and render this many minutes before each send slot")
+    # see benchmark_image_encoding.py for the size/encode time of each setting
+    parser.add_argument("--plot-format", choices=("png", "webp"), default=os.getenv("PLOT_FORMAT"), help="chart encoding (default png)")
+    parser.add_argument("--plot-dpi", type=int, default=os.getenv("PLOT_DPI"), help="chart resolution, the figure is 8x6 inches (default 100 dpi)")
+    parser.add_argument("--plot-colors", type=int, default=os.getenv("PLOT_COLORS"), help="quantize png charts to this many palette colors, e.g. 64")
+    parser.add_argument("--metrics", default=os.getenv("METRICS_PATH"), help="write this run's stage timings and counters here: Prometheus text format for a .prom path, JSON lines (appended) otherwise")
+    args = parser.parse_args(argv)
+    # the resident modes build one daily chart per forecast cell and slot
+    if args.weekly_chart and (args.daemon or args.watch):
+        parser.error("--weekly-chart is not supported with --daemon or --watch")
+    # only the one-shot asyncio path goes through functions/providers.py
+    if args.hedge and (not args.async_fetch or args.daemon or args.watch):
+        parser.error("--hedge requires --async-fetch and is not supported with --daemon or --watch")
+    return args
+
+# subscribers live in the registry, a recipients file is merged into it and
+# an empty registry starts out with the single configured user
+def load_registry(args):
+    registry = timed_import("functions.subscribers").SubscriberRegistry(args.subscribers)
+    if args.recipients:
+        registry.import_json(args.recipients)
+    elif not len(registry):
+        registry.upsert({"user_id": USER_ID, "name": NAME, "city": CITY, "state_code": STATE_CODE, "timezone": "America/Los_Angeles", "send_time": args.send_time})
+
+    geocode_index = timed_import("functions.geocode_index").GeocodeIndex()
+    try:
+        registry.resolve_locations(geocode_index, api_key=API_KEY)
+    finally:
+        geocode_index.close()
+    logger.info(f"Subscriber registry: {registry.stats()}")
+    return registry
+
+# resident modes keep one sender open: a pooled REST session, or a warm gateway connection with --delivery client
+def make_sender(args):
+    if args.delivery == "rest":
+        return timed_import("functions.discord_rest").DiscordRestSender(BOT_TOKEN)
+    return timed_import("functions.discord_bot").WarmDiscordSender(BOT_TOKEN)
+
+def run_daemon(args):
+    scheduler_daemon = timed_import("functions.scheduler_daemon")
+    registry = load_registry(args)
+
+    sender = make_sender(args)
+    forecast_store = None
+    if args.forecast_days > 1:
+        forecast_store = timed_import("functions.forecast_store").MultiDayForecastStore(days=args.forecast_days)
+    work = None
+    if args.workers > 1:
+        # every worker loads the same registry and works on the forecast cells that hash to it
+        work = timed_import("functions.work_leases").ShardedWork(args.worker_id, args.workers)
+        logger.info(f"Worker {args.worker_id} of {args.workers}")
+    render_pool = None
+    if args.render_processes:
+        # warmed before the first slot, so no send waits on a worker importing matplotlib
+        render_pool = timed_import("functions.render_pool").PlotRenderPool(args.render_processes).warm()
+    daemon = scheduler_daemon.WeatherDaemon(registry, sender, lead_time=scheduler_daemon.timedelta(minutes=args.lead_minutes), plot_options=plot_options_from_args(args),
+                                            forecast_store=forecast_store, work=work, render_pool=render_pool)
+
+    import asyncio
+    try:
+        asyncio.run(daemon.run())
+    finally:
+        if render_pool is not None:
+            render_pool.close()
+
+# re-poll every forecast cell and DM an update only where the forecast changed past a threshold
+def run_watch(args):
+    registry = load_registry(args)
+    forecast_watch = timed_import("functions.forecast_watch")
+
+    async def watch():
+        async with timed_import("functions.async_fetch").AsyncWeatherFetcher() as fetcher:
+            watcher = forecast_watch.ForecastWatcher(
+                registry.forecast_groups(),
+                fetcher,
+                make_sender(args),
+                interval=args.watch_minutes * 60,
+                high_temperature_change=args.high_change,
+                plot_options=plot_options_from_args(args),
+            )
+            await watcher.run()
+
+    import asyncio
+    asyncio.run(watch())
+
+# today in the one-shot run's time zone: the date its forecast is for
+def run_date():
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+
+    return datetime.now(ZoneInfo('America/Los_Angeles')).date()
+
+# one-shot runs started on several workers for the same morning: only the run that claims today's lease
+# sends, the others exit. a run that dies keeps the lease until it expires, then a later run can retry
+def claim_run_lease(args):
+    if args.workers <= 1:
+        return None
+
+    store = timed_import("functions.work_leases").LeaseStore(worker_id=args.worker_id)
+    batch = f"{run_date().isoformat()}|{USER_ID}"
+    if not store.claim(batch):
+        store.close()
+        return False
+    return store, batch
+
+def finish_run_lease(run_lease, done):
+    if not run_lease:
+        return
+    store, batch = run_lease
+    if done:
+        store.complete([batch])
+    else:
+        store.release([batch])
+    store.close()
+
+def write_run_metrics(path=None):
+    logger.info(f"Stage timings: {metrics.run_metrics.summary()}")
+    if path:
+        try:
+            logger.info(f"Run metrics written to {metrics.run_metrics.write(path)}")
+        except OSError as e:
+            logger.error(f"Could not write run metrics to {path}: {str(e)}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.daemon:
+        logger.info("Starting weather daemon...")
+        try:
+            run_daemon(args)
+        except Exception as e:
+            logger.error(f"Daemon failed: {str(e)}")
+            sys.exit(1)
+        return
+
+    if args.watch:
+        logger.info("Starting forecast watch...")
+        try:
+            run_watch(args)
+        except Exception as e:
+            logger.error(f"Forecast watch failed: {str(e)}")
+            sys.exit(1)
+        return
+
+    run_lease = None
     try:
         logger.info("Starting weather update application...")
 
-        # city to geocode first (lat and lon)
-        URL=f"http://api.openweathermap.org/geo/1.0/direct?q={CITY},{STATE_CODE}&limit=2&appid={API_KEY}"
-
-        LATITUDE,LONGITUDE = get_geocodes(URL)
+        if args.drain_outbox:
+            import asyncio
+            asyncio.run(start_discord_weather_batch([], args.delivery))
+            return
+
+        run_lease = claim_run_lease(args)
+        if run_lease is False:
+            logger.info("Another worker already claimed today's forecast, nothing to send")
+            return
+
+        if args.async_fetch:
+            import asyncio
+            asyncio.run(run_async_pipeline(args))
+            finish_run_lease(run_lease, done=True)
+            return
+
+        # city to geocode first (lat and lon), only index misses call OpenWeatherMap
+        geocode_index = timed_import("functions.geocode_index").GeocodeIndex()
+        try:
+            with metrics.span("geocode"):
+                LATITUDE,LONGITUDE = geocode_index.lookup(CITY, STATE_CODE, api_key=API_KEY, fetch=get_geocodes)
+            logger.info(f"Geocode index stats: {geocode_index.stats()}")
+            metrics.record_cache("geocode_index", geocode_index.stats())
+        finally:
+            geocode_index.close()
 
         if LATITUDE is None or LONGITUDE is None:
-            sys.exit("Error getting latitude and longitude!")
+            # raised, not sys.exit: the handler below has to release the run lease
+            raise ValueError("Error getting latitude and longitude!")
 
-        open_mateo_response = get_weather_data(LATITUDE, LONGITUDE)
-        
-        daily_weather_df = generate_daily_df(open_mateo_response)
-        hourly_weather_df = generate_hourly_df(open_mateo_response)
-        # print(hourly_weather_df)
-        # print(daily_weather_df)
+        with metrics.span("forecast_fetch"):
+            open_mateo_response = get_weather_data(LATITUDE, LONGITUDE, forecast_days=forecast_days_from_args(args), consumers=consumers_from_args(args))
 
-        hourly_weather_df['date'] = pd.to_datetime(hourly_weather_df['date']).dt.tz_convert('America/Los_Angeles')  # convert to PST time zone
-        hourly_weather_df['hour'] = hourly_weather_df['date'].dt.hour       # separate hourly column for plot creation purposes
-        hourly_weather_df = hourly_weather_df[hourly_weather_df['hour'] >= 6]   # Only hourly weather from 6am and after
-
-        weather_message = create_weather_message(USER_ID, daily_weather_df, NAME)
+        with metrics.span("dataframe_build"):
+            weather_message, hourly_weather_df = build_forecast_outputs(open_mateo_response, args.text_only, weekly_days_from_args(args))
 
         import asyncio
-        asyncio.run(start_discord_weather_bot(USER_ID, weather_message, hourly_weather_df))
+        asyncio.run(start_discord_weather_bot(USER_ID, weather_message, hourly_weather_df, plot_options_from_args(args), weekly=args.weekly_chart, delivery=args.delivery))
+        finish_run_lease(run_lease, done=True)
     except Exception as e:
+        finish_run_lease(run_lease, done=False)
         logger.error(f"Main process failed: {str(e)}")
         sys.exit(1)
+    finally:
+        logger.info(f"Startup import timings:\n{startup_timing_report()}")
+        write_run_metrics(args.metrics)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,118 @@
+# local stand-in for the parts of the Discord HTTP API the bot uses (login, open DM, send message),
+# plus the geocode and forecast endpoints served from fixtures, for offline benchmarks
+import asyncio
+import itertools
+import json
+import os
+
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+GEOCODE_FIXTURE = os.path.join(FIXTURES_DIR, "geocode_milpitas.json")
+FORECAST_FIXTURE = os.path.join(FIXTURES_DIR, "open_meteo_forecast.bin")
+
+BOT_USER = {"id": "100000000000000001", "username": "weather-bot", "discriminator": "0", "avatar": None, "bot": True}
+
+
+# discord.py only decodes bodies whose content-type is exactly application/json (no charset)
+def json_response(data):
+    return web.Response(body=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+
+def user_json(user_id):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "avatar": None}
+
+class FakeDiscordServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, keep_messages=True):
+        self.host = host
+        self.port = port
+        self.latency = latency  # seconds added to every Discord call
+        self.ids = itertools.count(200000000000000000)
+        self.channels = {}  # channel id -> recipient id
+        self.messages = []  # (recipient id, content, attachment bytes)
+        self.keep_messages = keep_messages  # False: only count them, for runs that must not grow (benchmark_soak.py)
+        self.counts = {"login": 0, "open_dm": 0, "message": 0, "geocode": 0, "forecast": 0}
+        self.runner = None
+
+        with open(GEOCODE_FIXTURE, encoding="utf-8") as file:
+            self.geocode_body = file.read()
+        with open(FORECAST_FIXTURE, "rb") as file:
+            self.forecast_payload = file.read()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_get("/api/v10/users/@me", self.login)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self.application_info)
+        app.router.add_post("/api/v10/users/@me/channels", self.open_dm)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages", self.send_message)
+        app.router.add_get("/geo/1.0/direct", self.geocode)
+        app.router.add_get("/v1/forecast", self.forecast)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def login(self, request):
+        self.counts["login"] += 1
+        return json_response(BOT_USER)
+
+    async def application_info(self, request):
+        return json_response({
+            "id": BOT_USER["id"], "name": BOT_USER["username"], "description": "", "icon": None,
+            "bot_public": False, "bot_require_code_grant": False, "owner": user_json(100000000000000002), "verify_key": "",
+        })
+
+    async def open_dm(self, request):
+        self.counts["open_dm"] += 1
+        await asyncio.sleep(self.latency)
+        recipient_id = (await request.json())["recipient_id"]
+        channel_id = str(next(self.ids))
+        self.channels[channel_id] = str(recipient_id)
+        return json_response({"id": channel_id, "type": 1, "last_message_id": None, "recipients": [user_json(recipient_id)]})
+
+    async def send_message(self, request):
+        self.counts["message"] += 1
+        await asyncio.sleep(self.latency)
+        channel_id = request.match_info["channel_id"]
+        content, attachment = "", b""
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "payload_json":
+                    content = json.loads(await part.text()).get("content", "")
+                else:
+                    attachment = await part.read()
+        else:
+            content = (await request.json()).get("content", "")
+        if self.keep_messages:
+            self.messages.append((self.channels.get(channel_id), content, attachment))
+        return json_response({
+            "id": str(next(self.ids)), "channel_id": channel_id, "type": 0, "content": content,
+            "author": BOT_USER, "timestamp": "2026-01-01T07:00:00.000000+00:00", "edited_timestamp": None,
+            "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+            "embeds": [], "pinned": False,
+        })
+
+    async def geocode(self, request):
+        self.counts["geocode"] += 1
+        return web.Response(text=self.geocode_body, content_type="application/json")
+
+    # one copy of the recorded payload per requested point, like the real batched api
+    async def forecast(self, request):
+        self.counts["forecast"] += 1
+        points = len(request.query.getall("latitude", [])) or 1
+        return web.Response(body=self.forecast_payload * points, content_type="application/octet-stream")
+
+# point discord.py's HTTP client at the stand-in server
+def use_fake_discord(base_url):
+    import discord.http
+    discord.http.Route.BASE = f"{base_url}/api/v10"
@@ -1,5 +1,50 @@
-from .open_weather_api import get_geocodes
-from .open_mateo_api import get_weather_data, generate_daily_df, generate_hourly_df
-from .data_processing import create_weather_message
-from .data_plot_creation import create_temperature_plot, save_plot_to_buffer
-from .discord_bot import start_bot
\ No newline at end of file
+# submodules are only imported the first time one of their names is used,
+# so e.g. geocoding never pays for pandas, seaborn or discord
+import importlib
+
+_EXPORTS = {
+    "get_geocodes": ".open_weather_api",
+    "build_geocode_url": ".open_weather_api",
+    "GeocodeIndex": ".geocode_index",
+    "get_weather_data": ".open_mateo_api",
+    "get_weather_data_batch": ".open_mateo_api",
+    "generate_daily_df": ".open_mateo_api",
+    "generate_hourly_df": ".open_mateo_api",
+    "AsyncWeatherFetcher": ".async_fetch",
+    "ForecastCache": ".forecast_cache",
+    "HedgedProviders": ".providers",
+    "Forecast": ".forecast",
+    "hourly_forecast": ".forecast",
+    "daily_forecast": ".forecast",
+    "create_weather_message": ".data_processing",
+    "create_weather_messages": ".data_processing",
+    "classify_forecasts": ".forecast_classification",
+    "create_temperature_plot": ".data_plot_creation",
+    "save_plot_to_buffer": ".data_plot_creation",
+    "TemperaturePlotRenderer": ".data_plot_creation",
+    "create_weekly_temperature_plot": ".data_plot_creation",
+    "PlotCache": ".plot_cache",
+    "PlotRenderPool": ".render_pool",
+    "start_bot": ".discord_bot",
+    "start_batch_bot": ".discord_bot",
+    "send_weather_batch": ".discord_bot",
+    "WarmDiscordSender": ".discord_bot",
+    "send_outbox": ".discord_bot",
+    "DiscordRestSender": ".discord_rest",
+    "DeliveryOutbox": ".outbox",
+    "WeatherDaemon": ".scheduler_daemon",
+    "SubscriberRegistry": ".subscribers",
+    "ForecastWatcher": ".forecast_watch",
+    "ShardedWork": ".work_leases",
+    "LeaseStore": ".work_leases",
+    "MultiDayForecastStore": ".forecast_store",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
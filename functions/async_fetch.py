@@ -0,0 +1,166 @@
+# async geocode and forecast fetchers on one shared aiohttp session, so fetching, decoding and
+# sending for many recipients can overlap in a single event loop
+import asyncio
+import hashlib
+import json
+import logging
+from urllib.parse import urlencode
+
+import aiohttp
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+
+from functions import metrics
+from functions.http_client import snap_to_grid
+from functions.open_mateo_api import OPEN_MATEO_URL, DEFAULT_TIMEZONE, MAX_URL_LENGTH, chunk_coordinates, forecast_params, validate_coordinates
+from functions.variables import DEFAULT_CONSUMERS
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS_PER_HOST = 8
+REQUEST_TIMEOUT = 10  # seconds for a whole request, connect included
+# same retry policy as the requests based client: connection errors and 500/502/504, with backoff
+RETRIES = 5
+BACKOFF_FACTOR = 0.2
+RETRY_STATUSES = (500, 502, 504)
+
+
+class OpenMeteoError(Exception):
+    pass
+
+# Open-Meteo flatbuffers framing: each response is a little endian int32 length, then the message
+def decode_weather_responses(data):
+    responses = []
+    position = 0
+    while position < len(data):
+        length = int.from_bytes(data[position:position + 4], byteorder="little")
+        responses.append(WeatherApiResponse.GetRootAs(data, position + 4))
+        position += length + 4
+    return responses
+
+class AsyncWeatherFetcher:
+    def __init__(self, max_connections_per_host=MAX_CONNECTIONS_PER_HOST, timeout=REQUEST_TIMEOUT, retries=RETRIES):
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            # limit_per_host caps concurrent connections (and so requests) against each api host
+            connector = aiohttp.TCPConnector(limit_per_host=self.max_connections_per_host)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    # returns (status, body bytes), retrying connection errors, timeouts and 5xx answers
+    async def get(self, url, params=None):
+        status, body, _ = await self.request(url, params)
+        return status, body
+
+    # same as get, plus the response headers and optional request headers (conditional requests)
+    async def request(self, url, params=None, headers=None):
+        if params:
+            # lists become repeated keys, like requests does (Open-Meteo accepts both forms)
+            url = f"{url}?{urlencode(params, doseq=True)}"
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    body = await response.read()
+                    metrics.count("http_response_bytes", len(body), host=response.url.host)
+                    if response.status not in RETRY_STATUSES or attempt == self.retries:
+                        return response.status, body, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+    # async get_geocodes: (None, None) on any failure, same as the blocking version
+    async def get_geocodes(self, url):
+        try:
+            status, body = await self.get(url)
+            if status != 200:
+                logger.error(f"Geocoding request failed with status {status}")
+                return None, None
+            data = json.loads(body)
+            if not data:
+                logger.error("No geocoding data found for inputted area")
+                return None, None
+            latitude = data[0]['lat']
+            longitude = data[0]['lon']
+            if latitude is not None and longitude is not None:
+                return latitude, longitude
+            return None, None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Error getting geocodes: {str(e)}")
+            return None, None
+
+    async def fetch_weather(self, params):
+        return decode_weather_responses(await self.fetch_weather_payload(params))
+
+    # the raw flatbuffers payload, for callers that keep it (functions/forecast_store.py).
+    # url: another Open-Meteo compatible endpoint, e.g. a secondary provider (functions/providers.py)
+    async def fetch_weather_payload(self, params, url=None):
+        params = dict(params, format="flatbuffers")
+        status, body = await self.get(url or OPEN_MATEO_URL, params)
+        if status in (400, 429):
+            raise OpenMeteoError(body.decode(errors="replace"))
+        if status != 200:
+            raise OpenMeteoError(f"Open Mateo API returned status {status}")
+        return body
+
+    # conditional re-poll: (responses, etag, digest), with responses None when nothing changed.
+    # a 304 for the etag we sent, or a body whose sha256 matches the last one, skips decoding entirely
+    async def fetch_weather_if_changed(self, params, etag=None, digest=None):
+        params = dict(params, format="flatbuffers")
+        status, body, headers = await self.request(OPEN_MATEO_URL, params, {"If-None-Match": etag} if etag else None)
+        if status == 304:
+            metrics.count("forecast_polls", result="not_modified")
+            return None, etag, digest
+        if status in (400, 429):
+            raise OpenMeteoError(body.decode(errors="replace"))
+        if status != 200:
+            raise OpenMeteoError(f"Open Mateo API returned status {status}")
+        body_digest = hashlib.sha256(body).hexdigest()
+        if body_digest == digest:
+            metrics.count("forecast_polls", result="same_payload")
+            return None, headers.get("ETag"), digest
+        metrics.count("forecast_polls", result="changed")
+        return decode_weather_responses(body), headers.get("ETag"), body_digest
+
+    async def get_weather_data(self, LATITUDE, LONGITUDE, timezone=DEFAULT_TIMEZONE, forecast_days=1, consumers=DEFAULT_CONSUMERS):
+        validate_coordinates(LATITUDE, LONGITUDE)
+        responses = await self.fetch_weather(forecast_params(LATITUDE, LONGITUDE, timezone, forecast_days, consumers))
+        if not responses:
+            raise ValueError("No data received from Open Mateo API")
+        return responses[0]
+
+    # async get_weather_data_batch: url-safe chunks fetched concurrently, one response per input
+    async def get_weather_data_batch(self, coordinates, timezone=DEFAULT_TIMEZONE, max_url_length=MAX_URL_LENGTH, consumers=DEFAULT_CONSUMERS):
+        coordinates = list(coordinates)
+        for LATITUDE, LONGITUDE in coordinates:
+            validate_coordinates(LATITUDE, LONGITUDE)
+        # one fetch per grid cell, at the exact point of its first input
+        grid_coordinates = [snap_to_grid(LATITUDE, LONGITUDE) for LATITUDE, LONGITUDE in coordinates]
+        cell_points = dict(zip(reversed(grid_coordinates), reversed(coordinates)))
+        unique_cells = list(dict.fromkeys(grid_coordinates))
+        chunks = chunk_coordinates([cell_points[cell] for cell in unique_cells], max_url_length, timezone)
+
+        async def fetch_chunk(chunk):
+            responses = await self.fetch_weather(forecast_params([lat for lat, _ in chunk], [lon for _, lon in chunk], timezone, consumers=consumers))
+            if len(responses) != len(chunk):
+                raise ValueError(f"Expected {len(chunk)} responses from Open Mateo API, got {len(responses)}")
+            return responses
+
+        chunk_responses = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+        responses_by_cell = dict(zip(unique_cells, (response for responses in chunk_responses for response in responses)))
+        return [responses_by_cell[cell] for cell in grid_coordinates]
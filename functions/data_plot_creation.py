@@ -4,72 +4,226 @@ import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
 from io import BytesIO
+from contextlib import contextmanager
+import numpy as np
+
+from functions import metrics
+from functions.forecast_classification import PRECIPITATION_LEVELS, precipitation_colors
+
+HOUR_TICKS = range(6, 25, 2)
+
+# upload encodings, see save_plot_to_buffer and benchmark_image_encoding.py
+PLOT_FORMATS = ('png', 'webp')
+# small multiples per row in the weekly chart
+WEEKLY_COLUMNS = 4
+PLOT_STYLE = "whitegrid"
+
+# rcParams that sns.set_theme(style=PLOT_STYLE) would change, worked out once
+_theme_rc = None
+
+
+# the charts' seaborn theme, applied only while a chart is drawn: a long-running process renders
+# thousands of charts and nothing else in it should see (or keep paying for) a global theme change
+@contextmanager
+def plot_theme():
+    global _theme_rc
+    if _theme_rc is None:
+        defaults = dict(matplotlib.rcParams)
+        with matplotlib.rc_context():
+            sns.set_theme(style=PLOT_STYLE)
+            _theme_rc = {key: value for key, value in matplotlib.rcParams.items() if value != defaults[key]}
+    with matplotlib.rc_context(_theme_rc):
+        yield
 
 
 # create plot
 def create_temperature_plot(hourly_weather_df):
+    with metrics.span("plot_render"):
+        return draw_temperature_plot(hourly_weather_df)
+
+def draw_temperature_plot(hourly_weather_df):
+    with plot_theme():
+        fig, ax = plt.subplots(figsize=(8,6))
+        draw_temperature_axes(ax, hourly_weather_df)
+        fig.tight_layout()
+
+    return fig
+
+# the daily chart's line, points, legend and labels on any axes; compact is the small-multiples size.
+# the caller's DataFrame is only read, never written to
+def draw_temperature_axes(ax, hourly_weather_df, title=None, legend=True, compact=False):
     date = hourly_weather_df['date'].dt.date.iloc[0]
 
-    # Define precipitation thresholds and colors
-    def get_precipitation_color(precip):
-        if precip == 0:
-            return '#1f77b4'  # blue
-        elif precip <= 2.5:
-            return '#2ecc71'  # green
-        elif precip <= 7.6:
-            return '#f1c40f'  # yellow
-        elif precip <= 50:
-            return '#e74c3c'  # red
-        else:
-            return '#c0392b'  # dark red
-    
-    # Apply color mapping to precipitation
-    hourly_weather_df['point_color'] = hourly_weather_df['precipitation'].apply(get_precipitation_color)
-
-    sns.set_theme(style="whitegrid")
-    fig, ax = plt.subplots(figsize=(8,6))
+    # Apply color mapping to precipitation (thresholds live in functions/forecast_classification.py)
+    point_colors = precipitation_colors(hourly_weather_df['precipitation'].to_numpy())
+
     sns.lineplot(
         x='hour',
         y='temperature_2m',
         data=hourly_weather_df,
         color='gray',
-        alpha=0.5
+        alpha=0.5,
+        ax=ax
     )
     sns.scatterplot(
         x='hour',
         y='temperature_2m',
         data=hourly_weather_df,
-        color=hourly_weather_df['point_color'],
-        s=100,
+        color=point_colors,
+        s=40 if compact else 100,
         ax=ax
     )
 
     # Add color legend for precipitation
+    if legend:
+        add_precipitation_legend(ax)
+
+    ax.set_title(title or f"Temperature for {date}", fontsize=12 if compact else 16, pad=10 if compact else 20, fontweight='bold')
+    ax.set_xlabel("Hour of Day", fontsize=10 if compact else 13, fontweight='bold', labelpad=8 if compact else 15)
+    ax.set_ylabel("Temperature (°F)", fontsize=10 if compact else 13, fontweight='bold', labelpad=10)
+
+    ax.set_xticks(HOUR_TICKS)
+    # Set y-axis limits
+    ax.set_ylim(25, 110)
+    ax.tick_params(axis='both', labelsize=9 if compact else 12)
+    return ax
+
+def add_precipitation_legend(ax, **legend_options):
     legend_elements = [
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#1f77b4', label='No precipitation', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#2ecc71', label='Light (≤2.5mm)', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#f1c40f', label='Medium (≤7.6mm)', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#e74c3c', label='Heavy (≤50mm)', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='#c0392b', label='Extreme (>50mm)', markersize=10),
+        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=color, label=label, markersize=10)
+        for _, color, label in PRECIPITATION_LEVELS
     ]
-    ax.legend(handles=legend_elements, title='Precipitation', loc='upper right')
+    return ax.legend(handles=legend_elements, title='Precipitation', **dict({"loc": 'upper right'}, **legend_options))
 
+# week at a glance: one small daily chart per local date (up to days of them), sharing the y axis,
+# with the precipitation legend in the spare panel
+def create_weekly_temperature_plot(hourly_weather_df, days=7, columns=WEEKLY_COLUMNS):
+    with metrics.span("plot_render"):
+        dates = hourly_weather_df['date'].dt.date
+        week = list(dict.fromkeys(dates))[:days]
+        rows = -(-len(week) // columns)
 
-    ax.set_title(f"Temperature for {date}", fontsize=16, pad=20, fontweight='bold')
-    ax.set_xlabel("Hour of Day", fontsize=13, fontweight='bold', labelpad=15)
-    ax.set_ylabel("Temperature (°F)", fontsize=13, fontweight='bold', labelpad=10)
+        with plot_theme():
+            fig, axes = plt.subplots(rows, columns, figsize=(4 * columns, 3.5 * rows), sharey=True, squeeze=False)
+            for index, (ax, date) in enumerate(zip(axes.flat, week)):
+                draw_temperature_axes(ax, hourly_weather_df[dates == date], title=f"{date:%a %b %d}", legend=False, compact=True)
+                # hour labels under the lowest chart of each column, temperature labels on the first column
+                if index + columns < len(week):
+                    ax.set_xlabel('')
+                    ax.tick_params(labelbottom=False)
+                if index % columns:
+                    ax.set_ylabel('')
+            spare = axes.flat[len(week):]
+            for ax in spare:
+                ax.axis('off')
+            if len(spare):
+                add_precipitation_legend(spare[0], loc='center')
+            else:
+                add_precipitation_legend(axes.flat[-1], fontsize=8, title_fontsize=9)
+            fig.suptitle("Temperature this week", fontsize=16, fontweight='bold')
+            fig.tight_layout()
+        return fig
 
-    ax.set_xticks(range(6, 25, 2))
-    # Set y-axis limits
-    ax.set_ylim(25, 110)
-    ax.tick_params(axis='both', labelsize=12)
-    plt.tight_layout()
+# format: 'png' or 'webp'. dpi scales the 8x6 inch figure (None keeps the figure's 100 dpi, 800x600 px).
+# colors quantizes a png to a palette of that many colors, compress_level is zlib's 0-9 for png,
+# quality is 1-100 for lossy webp (None means lossless webp). Defaults give matplotlib's own png.
+def encode_figure(fig, buffer, format='png', dpi=None, colors=None, compress_level=None, quality=None):
+    if format not in PLOT_FORMATS:
+        raise ValueError(f"Unsupported plot format {format!r}, expected one of {PLOT_FORMATS}")
+    if format == 'png' and colors is None and compress_level is None:
+        fig.savefig(buffer, format='png', dpi=dpi)
+        return buffer
 
-    return fig
+    from PIL import Image
 
-def save_plot_to_buffer(fig):
+    # draw once to raw RGBA at the target dpi and let Pillow do the encoding
+    dpi = dpi or fig.dpi
+    raw = BytesIO()
+    fig.savefig(raw, format='rgba', dpi=dpi)
+    width = int(fig.get_figwidth() * dpi)
+    image = Image.frombuffer('RGBA', (width, len(raw.getbuffer()) // (4 * width)), raw.getbuffer(), 'raw', 'RGBA', 0, 1).convert('RGB')
+    if format == 'webp':
+        options = {'lossless': True} if quality is None else {'quality': quality}
+        image.save(buffer, format='WEBP', method=4, **options)
+        return buffer
+    if colors is not None:
+        # a line chart has a few flat colors plus antialiasing, a small palette keeps it visually the same
+        image = image.quantize(colors=colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    image.save(buffer, format='PNG', compress_level=6 if compress_level is None else compress_level)
+    return buffer
+
+def save_plot_to_buffer(fig, **options):
     buffer = BytesIO()
-    fig.savefig(buffer, format='png')
+    with metrics.span("png_encode") as span:
+        encode_figure(fig, buffer, **options)
+        span["bytes"] = buffer.tell()
     buffer.seek(0) # move to the start of buffer
     plt.close(fig) # close the figure to free memory
-    return buffer
\ No newline at end of file
+    return buffer
+
+
+# renders the same chart as create_temperature_plot, but the figure, axes, legend,
+# ticks and layout are built once and only the line/scatter data is swapped per chart
+# not thread safe: one renderer per thread (or process)
+class TemperaturePlotRenderer:
+    def __init__(self):
+        self.fig = None
+
+    # the first chart builds the template with the real seaborn calls, so artists match exactly
+    def build(self, hourly_weather_df):
+        self.fig = create_temperature_plot(hourly_weather_df)
+        self.ax = self.fig.axes[0]
+        self.line = self.ax.lines[0]
+        self.scatter = self.ax.collections[-1]
+        self.xlim = self.ax.get_xlim()
+
+    def render(self, hourly_weather_df):
+        if self.fig is None:
+            self.build(hourly_weather_df)
+            return self.fig
+        return self.render_arrays(
+            hourly_weather_df['hour'].to_numpy(),
+            hourly_weather_df['temperature_2m'].to_numpy(),
+            hourly_weather_df['precipitation'].to_numpy(),
+            hourly_weather_df['date'].dt.date.iloc[0],
+        )
+
+    def render_arrays(self, hours, temperatures, precipitation, date):
+        if self.fig is None:
+            raise ValueError("Renderer template not built yet, call render() with a DataFrame first")
+        with metrics.span("plot_render"):
+            return self.update(hours, temperatures, precipitation, date)
+
+    def update(self, hours, temperatures, precipitation, date):
+
+        # seaborn's lineplot draws the points sorted by x
+        order = np.argsort(hours, kind='stable')
+        self.line.set_data(hours[order], temperatures[order])
+        self.scatter.set_offsets(np.column_stack([hours, temperatures]))
+        self.scatter.set_facecolor(precipitation_colors(precipitation))
+        self.ax.set_title(f"Temperature for {date}", fontsize=16, pad=20, fontweight='bold')
+
+        # same x limits as a fresh plot: data plus margins, widened to cover the ticks
+        self.ax.relim()
+        self.ax.autoscale_view(scaley=False)
+        self.ax.set_xticks(HOUR_TICKS)
+        if self.ax.get_xlim() != self.xlim:
+            self.xlim = self.ax.get_xlim()
+            with plot_theme():
+                self.fig.tight_layout()
+        return self.fig
+
+    # fresh buffer per chart, the figure itself stays open for the next one
+    def render_png(self, hourly_weather_df, **options):
+        fig = self.render(hourly_weather_df)
+        buffer = BytesIO()
+        with metrics.span("png_encode") as span:
+            encode_figure(fig, buffer, **options)
+            span["bytes"] = buffer.tell()
+        buffer.seek(0)
+        return buffer
+
+    def close(self):
+        if self.fig is not None:
+            plt.close(self.fig)
+            self.fig = None
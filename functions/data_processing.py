@@ -1,43 +1,73 @@
-# seaborn and pandas data manipulation:
-import pandas as pd
+import numpy as np
 
+from functions.forecast_classification import PRECIPITATION_LEVELS, format_temperatures, format_uv_index
 
-def create_weather_message(user_id, daily_weather_df, NAME):
-    daily_high_temp = round(daily_weather_df.loc[0, "temperature_2m_max"],1)
-    formatted_daily_high_temp = f"{daily_high_temp:.1f}"
-    # print(formatted_daily_high_temp)
+PRECIPITATION_LABELS = np.array([label for _, _, label in PRECIPITATION_LEVELS])
+
+UNIT_SYMBOLS = {"fahrenheit": "°F", "celsius": "°C"}
+
+WEATHER_MESSAGE_TEMPLATE = (
+    "<@{user_id}>\n"
+    "Good morning {name}!\n\n"
+    "Today's forecast:\n"
+    "- High: {high} {unit}\n"
+    "- Low: {low} {unit}\n"
+    "- UV Index: {uv_index}\n"
+    "\n\n"
+)
 
-    daily_low_temp = round(daily_weather_df.loc[0, "temperature_2m_min"],1)
-    formatted_daily_low_temp = f"{daily_low_temp:.1f}"
-    # print(formatted_daily_low_temp)
 
+def create_weather_message(user_id, daily_weather_df, NAME):
     # useless data (nothing here)
     # daily_sunrise = daily_weather_df.loc[0,'sunrise']
     # daily_sunset = daily_weather_df.loc[0,'sunset']
 
-    daily_UV_index = round(daily_weather_df.loc[0,'uv_index_max'],1)
-    # print(daily_UV_index)
-
-    if (daily_UV_index < 3):
-        UV_index_string = f"{daily_UV_index:.1f} - Low Risk"
-    elif (daily_UV_index < 6):
-        UV_index_string = f"{daily_UV_index:.1f} - Medium Risk"
-    elif (daily_UV_index < 8):
-        UV_index_string = f"{daily_UV_index:.1f} - High Risk"
-    elif (daily_UV_index < 11):
-        UV_index_string = f"{daily_UV_index:.1f} - Very High Risk"
-    else:
-        UV_index_string = f"{daily_UV_index:.1f} - Extreme Risk"
-    
-
-
-    weather_message = (
-        f"<@{user_id}>\n"
-        f"Good morning {NAME}!\n\n"
-        "Today's forecast:\n"
-        f"- High: {formatted_daily_high_temp} °F\n"
-        f"- Low: {formatted_daily_low_temp} °F\n"
-        f"- UV Index: {UV_index_string}\n"
-        "\n\n"
-    )
-    return weather_message
\ No newline at end of file
+    return create_weather_messages(
+        [user_id],
+        [NAME],
+        daily_weather_df.loc[[0], "temperature_2m_max"].to_numpy(),
+        daily_weather_df.loc[[0], "temperature_2m_min"].to_numpy(),
+        daily_weather_df.loc[[0], "uv_index_max"].to_numpy(),
+    )[0]
+
+# one message per location, the daily arrays hold each location's day: shape (N,)
+# rounding, formatting and UV bucketing happen in one vectorized pass (functions/forecast_classification.py)
+# forecasts are fetched in fahrenheit, units (one per message, default fahrenheit) converts for celsius readers
+def create_weather_messages(user_ids, names, daily_high_temps, daily_low_temps, daily_UV_indexes, units=None):
+    units = ["fahrenheit"] * len(user_ids) if units is None else list(units)
+    celsius = np.array([unit == "celsius" for unit in units], dtype=bool)
+    if celsius.any():
+        daily_high_temps = np.where(celsius, (np.asarray(daily_high_temps) - 32) * 5 / 9, daily_high_temps)
+        daily_low_temps = np.where(celsius, (np.asarray(daily_low_temps) - 32) * 5 / 9, daily_low_temps)
+
+    formatted_high_temps = format_temperatures(daily_high_temps)
+    formatted_low_temps = format_temperatures(daily_low_temps)
+    UV_index_strings = format_uv_index(daily_UV_indexes)
+
+    return [
+        WEATHER_MESSAGE_TEMPLATE.format(user_id=user_id, name=name, high=high, low=low, unit=UNIT_SYMBOLS[unit], uv_index=uv_index)
+        for user_id, name, high, low, unit, uv_index in zip(user_ids, names, formatted_high_temps, formatted_low_temps, units, UV_index_strings)
+    ]
+
+UPDATE_MESSAGE_TEMPLATE = (
+    "<@{user_id}>\n"
+    "Forecast update for {name}:\n"
+    "{lines}\n"
+    "\n\n"
+)
+
+def to_units(temperature, unit):
+    return (temperature - 32) * 5 / 9 if unit == "celsius" else temperature
+
+# changes come from functions/forecast_watch.forecast_changes, hours are epoch seconds
+def create_update_message(user_id, name, changes, utc_offset_seconds, unit="fahrenheit"):
+    lines = []
+    for change in changes:
+        if change["type"] == "precipitation":
+            local_hours = (change["times"] + utc_offset_seconds) // 3600 % 24
+            labels = PRECIPITATION_LABELS[change["levels"]]
+            lines.append("- Precipitation now expected: " + ", ".join(f"{hour:02d}:00 {label}" for hour, label in zip(local_hours, labels)))
+        elif change["type"] == "high_temperature":
+            current, previous = format_temperatures([to_units(change["current"], unit), to_units(change["previous"], unit)])
+            lines.append(f"- High now {current} {UNIT_SYMBOLS[unit]} (was {previous} {UNIT_SYMBOLS[unit]})")
+    return UPDATE_MESSAGE_TEMPLATE.format(user_id=user_id, name=name, lines="\n".join(lines))
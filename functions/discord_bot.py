@@ -1,7 +1,13 @@
 # discord messaging
+import asyncio
 import discord
 import os
-from functions import create_temperature_plot,save_plot_to_buffer
+import time
+from io import BytesIO
+
+from functions import metrics
+from functions.outbox import MAX_CONCURRENT_SENDS
+from functions.plot_cache import plot_filename
 
 BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
@@ -17,6 +23,9 @@ client = discord.Client(intents=intents)
 
 # function to send message
 async def send_dm_to_user(user_id, weather_message, hourly_weather_df):
+    # plotting stack is only imported when a plot is actually sent
+    from functions.data_plot_creation import create_temperature_plot, save_plot_to_buffer
+
     fig = create_temperature_plot(hourly_weather_df)
     buffer = save_plot_to_buffer(fig)
 
@@ -51,4 +60,158 @@ def start_bot(user_id, message, hourly_df):
     weather_message = message
     hourly_weather_df = hourly_df
 
-    client.run(BOT_TOKEN)
\ No newline at end of file
+    client.run(BOT_TOKEN)
+
+# fan-out delivery: log in once and send many (user_id, message, plot) jobs
+# discord.py keeps its own per-route rate limit buckets (and sleeps on 429s),
+# the semaphore (MAX_CONCURRENT_SENDS) just bounds how many DMs are in flight against those buckets
+
+def plot_to_file(plot, filename=None):
+    # every send gets its own buffer so concurrent uploads never share a read position
+    if not isinstance(plot, (bytes, bytearray)):
+        plot.seek(0)
+        plot = plot.read()
+    return discord.File(BytesIO(plot), filename or plot_filename(plot))
+
+# one DM, errors are raised to the caller
+async def deliver(client, user_id, message, plot):
+    with metrics.span("dm_send") as span:
+        # create_dm skips the extra fetch_user round trip per recipient
+        channel = await client.create_dm(discord.Object(id=int(user_id)))
+        if plot is None:
+            await channel.send(message)
+        else:
+            file = plot_to_file(plot)
+            span["bytes"] = file.fp.getbuffer().nbytes
+            await channel.send(message, file=file)
+
+async def send_job(client, semaphore, job):
+    user_id, message, plot = job
+    async with semaphore:
+        try:
+            await deliver(client, user_id, message, plot)
+            return {"user_id": user_id, "success": True, "error": None}
+        except discord.errors.NotFound:
+            error = f"User with ID {user_id} not found"
+        except discord.errors.Forbidden:
+            error = f"Bot doesn't have permission to send messages to user {user_id}"
+        except Exception as e:
+            error = f"Failed to send message to user {user_id}: {e}"
+        return {"user_id": user_id, "success": False, "error": error}
+
+# jobs is a list, or an async iterable when charts are still rendering (see functions/render_pool.py):
+# each job's send starts as soon as it arrives instead of after the whole batch
+async def send_jobs(client, semaphore, jobs):
+    if not hasattr(jobs, "__aiter__"):
+        return await asyncio.gather(*(send_job(client, semaphore, job) for job in jobs))
+    tasks = [asyncio.ensure_future(send_job(client, semaphore, job)) async for job in jobs]
+    return await asyncio.gather(*tasks)
+
+async def send_weather_batch(jobs, bot_token=None, max_concurrent_sends=MAX_CONCURRENT_SENDS, connect_gateway=True):
+    bot_token = bot_token or os.getenv("DISCORD_BOT_TOKEN")
+    if not bot_token:
+        raise ValueError("Discord bot token not found in environment variables")
+
+    batch_client = discord.Client(intents=discord.Intents.default())
+
+    # DMs only need the HTTP API: without the gateway the client just logs in over HTTP,
+    # which is also what lets it run against a local stand-in Discord server
+    if not connect_gateway:
+        async with batch_client:
+            with metrics.span("discord_login"):
+                await batch_client.login(bot_token)
+            semaphore = asyncio.Semaphore(max_concurrent_sends)
+            return await send_jobs(batch_client, semaphore, jobs)
+
+    results = []
+    fanned_out = False
+    # the gateway login finishes in on_ready, so this span is closed by hand
+    login_started = time.perf_counter()
+
+    @batch_client.event
+    async def on_ready():
+        # on_ready fires again after a gateway reconnect, only fan out once
+        nonlocal fanned_out
+        if fanned_out:
+            return
+        fanned_out = True
+        metrics.record("discord_login", time.perf_counter() - login_started)
+        print(f'We have logged in as {batch_client.user}')
+        try:
+            semaphore = asyncio.Semaphore(max_concurrent_sends)
+            results.extend(await send_jobs(batch_client, semaphore, jobs))
+        finally:
+            await batch_client.close()
+
+    await batch_client.start(bot_token)
+    return results
+
+# deliver whatever is due in a DeliveryOutbox (functions/outbox.py), over HTTP only.
+# rest=True skips discord.py entirely and posts through DiscordRestSender (functions/discord_rest.py)
+async def send_outbox(outbox, bot_token=None, max_concurrent_sends=MAX_CONCURRENT_SENDS, timeout=None, rest=False):
+    from functions.outbox import OUTBOX_DRAIN_TIMEOUT
+
+    bot_token = bot_token or os.getenv("DISCORD_BOT_TOKEN")
+    if not bot_token:
+        raise ValueError("Discord bot token not found in environment variables")
+    timeout = OUTBOX_DRAIN_TIMEOUT if timeout is None else timeout
+
+    if rest:
+        from functions.discord_rest import send_outbox as send_outbox_rest
+
+        return await send_outbox_rest(outbox, bot_token, max_concurrent_sends, timeout)
+
+    # long rate limits raise RateLimited instead of sleeping inside discord.py,
+    # so the outbox reschedules that item and keeps sending the others
+    outbox_client = discord.Client(intents=discord.Intents.default(), max_ratelimit_timeout=30)
+    async with outbox_client:
+        with metrics.span("discord_login"):
+            await outbox_client.login(bot_token)
+
+        async def send(user_id, message, plot):
+            await deliver(outbox_client, user_id, message, plot)
+
+        return await outbox.drain(send, max_concurrent_sends, timeout)
+
+# blocking wrapper, same shape as start_bot but for many recipients
+def start_batch_bot(jobs, max_concurrent_sends=MAX_CONCURRENT_SENDS):
+    results = asyncio.run(send_weather_batch(jobs, max_concurrent_sends=max_concurrent_sends))
+    for result in results:
+        if result["success"]:
+            print(f"Message sent to {result['user_id']}!")
+        else:
+            print(result["error"])
+    return results
+
+# long-running sender for the daemon: the gateway connection is opened once and kept warm,
+# so a scheduled DM goes out without paying for login at send time
+class WarmDiscordSender:
+    def __init__(self, bot_token=None, max_concurrent_sends=MAX_CONCURRENT_SENDS):
+        self.bot_token = bot_token or os.getenv("DISCORD_BOT_TOKEN")
+        self.semaphore = asyncio.Semaphore(max_concurrent_sends)
+        self.client = None
+        self.task = None
+
+    async def start(self):
+        if not self.bot_token:
+            raise ValueError("Discord bot token not found in environment variables")
+        self.client = discord.Client(intents=discord.Intents.default())
+        with metrics.span("discord_login"):
+            self.task = asyncio.create_task(self.client.start(self.bot_token))
+            ready = asyncio.create_task(self.client.wait_until_ready())
+            # a bad token ends client.start before the client is ever ready
+            await asyncio.wait({self.task, ready}, return_when=asyncio.FIRST_COMPLETED)
+        if self.task.done():
+            ready.cancel()
+            self.task.result()
+            raise RuntimeError("Discord client stopped before it was ready")
+        print(f'We have logged in as {self.client.user}')
+
+    async def send(self, jobs):
+        return await send_jobs(self.client, self.semaphore, jobs)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+        if self.task is not None:
+            await asyncio.gather(self.task, return_exceptions=True)
@@ -0,0 +1,194 @@
+# gateway-free delivery: DMs go straight to Discord's HTTP API over one pooled aiohttp session.
+# no websocket handshake, no on_ready and no login round trip, and each user's DM channel id is
+# opened once and cached (in sqlite across runs), so a one-shot send is a single POST. a cached channel
+# that answers 403/404 is dropped and the DM reopened once. discord.py is only imported for its exception
+# types once a request fails, so a run that delivers over REST never pays for importing it
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import aiohttp
+
+from functions import metrics
+from functions.outbox import MAX_CONCURRENT_SENDS, OUTBOX_DRAIN_TIMEOUT, describe_error
+from functions.plot_cache import plot_filename
+
+DISCORD_API_BASE = os.getenv("DISCORD_API_BASE", "https://discord.com/api/v10")
+DM_CHANNELS_PATH = '.dm_channels.sqlite'
+USER_AGENT = f"DiscordBot (https://github.com/antonclayton/daily-weather-bot, 1.0) Python/{sys.version_info[0]}.{sys.version_info[1]} aiohttp/{aiohttp.__version__}"
+# rate limits up to this long are waited out here, longer ones raise discord.RateLimited for the caller
+# (the outbox reschedules those), same as discord.py's max_ratelimit_timeout
+MAX_RATELIMIT_TIMEOUT = 30
+# attempts per request for 429s and 5xx
+MAX_REQUEST_ATTEMPTS = 5
+
+
+class DiscordRestSender:
+    # same start / send / close shape as WarmDiscordSender, so it plugs into the daemon and watch mode too
+    def __init__(self, bot_token=None, max_concurrent_sends=MAX_CONCURRENT_SENDS, api_base=None, channels_path=DM_CHANNELS_PATH,
+                 max_ratelimit_timeout=MAX_RATELIMIT_TIMEOUT):
+        self.bot_token = bot_token or os.getenv("DISCORD_BOT_TOKEN")
+        self.max_concurrent_sends = max_concurrent_sends
+        self.api_base = (api_base or DISCORD_API_BASE).rstrip("/")
+        self.max_ratelimit_timeout = max_ratelimit_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrent_sends)
+        self.session = None
+        self.channels = {}  # user id -> DM channel id
+        self.channel_locks = {}  # user id -> lock, concurrent sends to one user open one channel
+        self.route_resets = {}  # route -> loop time its rate limit bucket resets, when it is used up
+        self.global_reset = 0.0
+        self.connection = None
+        if channels_path:
+            self.connection = sqlite3.connect(channels_path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS dm_channels (user_id TEXT PRIMARY KEY, channel_id TEXT NOT NULL, opened_at REAL NOT NULL)")
+            self.connection.commit()
+            self.channels.update(self.connection.execute("SELECT user_id, channel_id FROM dm_channels"))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        if not self.bot_token:
+            raise ValueError("Discord bot token not found in environment variables")
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrent_sends),
+                headers={"Authorization": f"Bot {self.bot_token}", "User-Agent": USER_AGENT},
+            )
+
+    # body() builds the request kwargs per attempt, a multipart form can only be sent once
+    async def request(self, method, path, route, body):
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, MAX_REQUEST_ATTEMPTS + 1):
+            wait = max(self.global_reset, self.route_resets.get(route, 0.0)) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            async with self.session.request(method, f"{self.api_base}{path}", **body()) as response:
+                if response.content_type == "application/json":
+                    data = await response.json()
+                else:
+                    data = await response.text()
+                # the bucket is used up: hold the route's next request until it resets instead of earning a 429
+                if response.headers.get("X-RateLimit-Remaining") == "0":
+                    self.route_resets[route] = loop.time() + float(response.headers.get("X-RateLimit-Reset-After", 0))
+                if 200 <= response.status < 300:
+                    return data
+
+                import discord
+
+                if response.status == 429:
+                    retry_after = float((data if isinstance(data, dict) else {}).get("retry_after", response.headers.get("Retry-After", 1)))
+                    if retry_after > self.max_ratelimit_timeout:
+                        raise discord.RateLimited(retry_after)
+                    if isinstance(data, dict) and data.get("global"):
+                        self.global_reset = loop.time() + retry_after
+                    else:
+                        self.route_resets[route] = loop.time() + retry_after
+                    if attempt < MAX_REQUEST_ATTEMPTS:
+                        continue
+                elif response.status >= 500 and attempt < MAX_REQUEST_ATTEMPTS:
+                    await asyncio.sleep(1 + attempt * 2)
+                    continue
+
+                if response.status == 403:
+                    raise discord.Forbidden(response, data)
+                if response.status == 404:
+                    raise discord.NotFound(response, data)
+                if response.status >= 500:
+                    raise discord.DiscordServerError(response, data)
+                raise discord.HTTPException(response, data)
+
+    async def dm_channel(self, user_id):
+        user_id = str(user_id)
+        channel_id = self.channels.get(user_id)
+        if channel_id is not None:
+            metrics.count("cache_events", cache="dm_channel", event="hit")
+            return channel_id
+        async with self.channel_locks.setdefault(user_id, asyncio.Lock()):
+            if user_id not in self.channels:
+                metrics.count("cache_events", cache="dm_channel", event="miss")
+                channel = await self.request("POST", "/users/@me/channels", "open_dm", lambda: {"json": {"recipient_id": user_id}})
+                self.channels[user_id] = channel["id"]
+                if self.connection is not None:
+                    with self.connection:
+                        self.connection.execute("INSERT OR REPLACE INTO dm_channels VALUES (?, ?, ?)", (user_id, channel["id"], time.time()))
+            return self.channels[user_id]
+
+    # drop a DM channel id that stopped working, unless a concurrent send already replaced it
+    def forget_dm_channel(self, user_id, channel_id):
+        user_id = str(user_id)
+        if self.channels.get(user_id) != channel_id:
+            return
+        del self.channels[user_id]
+        if self.connection is not None:
+            with self.connection:
+                self.connection.execute("DELETE FROM dm_channels WHERE user_id = ? AND channel_id = ?", (user_id, channel_id))
+
+    # one DM, errors are raised to the caller (same contract as discord_bot.deliver)
+    async def deliver(self, user_id, message, plot):
+        with metrics.span("dm_send") as span:
+            cached = str(user_id) in self.channels
+            channel_id = await self.dm_channel(user_id)
+            if plot is None:
+                body = lambda: {"json": {"content": message}}
+            else:
+                if not isinstance(plot, (bytes, bytearray)):
+                    plot.seek(0)
+                    plot = plot.read()
+                span["bytes"] = len(plot)
+                filename = plot_filename(plot)
+
+                def body():
+                    form = aiohttp.FormData()
+                    form.add_field("payload_json", json.dumps({"content": message, "attachments": [{"id": 0, "filename": filename}]}), content_type="application/json")
+                    form.add_field("files[0]", plot, filename=filename, content_type="application/octet-stream")
+                    return {"data": form}
+            try:
+                await self.request("POST", f"/channels/{channel_id}/messages", f"messages:{channel_id}", body)
+            except Exception as e:
+                import discord
+
+                if not cached or not isinstance(e, (discord.Forbidden, discord.NotFound)):
+                    raise
+                # the cached channel may be gone (deleted, or cached by an older bot token): reopen the DM once
+                metrics.count("cache_events", cache="dm_channel", event="invalidated")
+                self.forget_dm_channel(user_id, channel_id)
+                channel_id = await self.dm_channel(user_id)
+                await self.request("POST", f"/channels/{channel_id}/messages", f"messages:{channel_id}", body)
+
+    async def send_job(self, job):
+        user_id, message, plot = job
+        async with self.semaphore:
+            try:
+                await self.deliver(user_id, message, plot)
+                return {"user_id": user_id, "success": True, "error": None}
+            except Exception as e:
+                return {"user_id": user_id, "success": False, "error": describe_error(user_id, e)}
+
+    # jobs is a list or an async iterable, like discord_bot.send_jobs
+    async def send(self, jobs):
+        if not hasattr(jobs, "__aiter__"):
+            return await asyncio.gather(*(self.send_job(job) for job in jobs))
+        tasks = [asyncio.ensure_future(self.send_job(job)) async for job in jobs]
+        return await asyncio.gather(*tasks)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+# deliver whatever is due in a DeliveryOutbox (functions/outbox.py) over one DiscordRestSender
+async def send_outbox(outbox, bot_token=None, max_concurrent_sends=MAX_CONCURRENT_SENDS, timeout=None):
+    async with DiscordRestSender(bot_token, max_concurrent_sends) as sender:
+        return await outbox.drain(sender.deliver, max_concurrent_sends, OUTBOX_DRAIN_TIMEOUT if timeout is None else timeout)
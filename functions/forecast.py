@@ -0,0 +1,110 @@
+# lightweight forecast container: keeps the FlatBuffers-backed numpy arrays as they come out of the
+# Open-Meteo response (no copies), derives local hours arithmetically and slices windows as views
+from datetime import date as calendar_date, timedelta
+
+import numpy as np
+
+from functions.variables import decode_section
+
+
+EPOCH_DATE = calendar_date(1970, 1, 1)
+
+
+class Forecast:
+    __slots__ = ("time", "interval", "utc_offset_seconds", "timezone", "variables")
+
+    def __init__(self, time, interval, utc_offset_seconds, timezone, variables):
+        self.time = time  # epoch seconds of the first value
+        self.interval = interval  # seconds between values
+        self.utc_offset_seconds = utc_offset_seconds
+        self.timezone = timezone
+        self.variables = variables  # name -> numpy array, all the same length
+
+    # kind is "hourly" or "daily". every registered variable in the section (or just names) is decoded by
+    # its tags, a section that was not requested at all gives an empty forecast
+    @classmethod
+    def from_section(cls, section, kind, utc_offset_seconds, timezone, names=None):
+        variables = decode_section(section, kind, names)
+        if section is None:
+            return cls(0, 3600 if kind == "hourly" else 86400, utc_offset_seconds, timezone, variables)
+        return cls(section.Time(), section.Interval(), utc_offset_seconds, timezone, variables)
+
+    def __len__(self):
+        return len(next(iter(self.variables.values()), ()))
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    @property
+    def times(self):
+        return self.time + self.interval * np.arange(len(self), dtype=np.int64)
+
+    @property
+    def local_hours(self):
+        return (self.times + self.utc_offset_seconds) // 3600 % 24
+
+    # local calendar day of every value, as days since 1970-01-01.
+    # Open-Meteo applies one utc offset to the whole response, so a multi-day answer splits the same way
+    @property
+    def local_days(self):
+        return (self.times + self.utc_offset_seconds) // 86400
+
+    @property
+    def dates(self):
+        return [EPOCH_DATE + timedelta(days=int(day)) for day in np.unique(self.local_days)]
+
+    # positional window, every variable is sliced as a view of the response buffer
+    def window(self, start, stop=None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return Forecast(
+            self.time + self.interval * start,
+            self.interval,
+            self.utc_offset_seconds,
+            self.timezone,
+            {name: values[start:stop] for name, values in self.variables.items()},
+        )
+
+    # the 6am+ window of a one day forecast, same rows as filtering hour >= 6
+    def from_hour(self, hour):
+        indexes = np.flatnonzero(self.local_hours >= hour)
+        if len(indexes) == 0:
+            return self.window(0, 0)
+        return self.window(indexes[0], indexes[-1] + 1)
+
+    # one local day out of a multi-day forecast, same views as window()
+    def for_date(self, date):
+        indexes = np.flatnonzero(self.local_days == (date - EPOCH_DATE).days)
+        if len(indexes) == 0:
+            return self.window(0, 0)
+        return self.window(indexes[0], indexes[-1] + 1)
+
+    # day 0 is the first local day of the forecast (today for a fresh fetch)
+    def day(self, index):
+        if len(self) == 0:
+            return self
+        first = int(self.local_days[0])
+        return self.for_date(EPOCH_DATE + timedelta(days=first + index))
+
+    # escape hatch: the DataFrame the plotting code expects, dates in local time plus an hour column
+    def to_pandas(self):
+        import pandas as pd
+
+        dates = pd.to_datetime(self.times, unit="s", utc=True)
+        if self.timezone:
+            dates = dates.tz_convert(self.timezone)
+        data = {"date": dates}
+        data.update(self.variables)
+        dataframe = pd.DataFrame(data=data)
+        if self.interval < 86400:
+            dataframe["hour"] = dataframe["date"].dt.hour
+        return dataframe
+
+def response_timezone(response):
+    timezone = response.Timezone()
+    return timezone.decode() if isinstance(timezone, bytes) else timezone
+
+def hourly_forecast(response, names=None):
+    return Forecast.from_section(response.Hourly(), "hourly", response.UtcOffsetSeconds(), response_timezone(response), names)
+
+def daily_forecast(response, names=None):
+    return Forecast.from_section(response.Daily(), "daily", response.UtcOffsetSeconds(), response_timezone(response), names)
@@ -0,0 +1,94 @@
+# stale-while-revalidate forecast cache
+# fresher than soft_ttl: served as is. between soft and hard ttl: served stale while one background
+# refresh runs. older than hard_ttl (or missing): the caller waits for the fetch.
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from functions.http_client import snap_to_grid
+
+FORECAST_SOFT_TTL = int(os.getenv("FORECAST_SOFT_TTL", 1800))
+FORECAST_HARD_TTL = int(os.getenv("FORECAST_HARD_TTL", 3 * 3600))
+FORECAST_CACHE_MAX_KEYS = 10000
+
+
+class StaleWhileRevalidateCache:
+    def __init__(self, fetch, soft_ttl=FORECAST_SOFT_TTL, hard_ttl=FORECAST_HARD_TTL, max_keys=FORECAST_CACHE_MAX_KEYS, clock=time.monotonic):
+        if soft_ttl > hard_ttl:
+            raise ValueError("soft_ttl must not be longer than hard_ttl")
+        self.fetch = fetch  # async callable taking the key parts (or get_as' args)
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.max_keys = max_keys
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (value, fetched_at), least recently fetched first
+        self.inflight = {}  # key -> refresh task, so concurrent refreshes of a key share one fetch
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    async def get(self, *key):
+        return await self.get_as(key, key)
+
+    # stored under key, fetched with fetch(*args) when it has to be (the first caller's args win)
+    async def get_as(self, key, args):
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = self.clock() - fetched_at
+            if age < self.soft_ttl:
+                self.hits += 1
+                return value
+            if age < self.hard_ttl:
+                self.stale_hits += 1
+                self.refresh(key, args)
+                return value
+        self.misses += 1
+        # shield: a cancelled caller must not cancel the fetch other callers are waiting on
+        return await asyncio.shield(self.refresh(key, args))
+
+    def refresh(self, key, args):
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch_and_store(key, args))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self.refresh_done(key, done))
+        return task
+
+    def refresh_done(self, key, task):
+        self.inflight.pop(key, None)
+        # background refresh errors are counted in fetch_and_store, retrieving them here keeps asyncio quiet
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch_and_store(self, key, args):
+        self.refreshes += 1
+        try:
+            value = await self.fetch(*args)
+        except Exception:
+            self.failures += 1
+            raise
+        self.entries.pop(key, None)
+        self.entries[key] = (value, self.clock())
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "entries": len(self.entries),
+            "inflight": len(self.inflight),
+        }
+
+# forecasts keyed by grid cell and timezone, fetched for the exact point by any async (lat, lon, timezone) fetcher
+class ForecastCache(StaleWhileRevalidateCache):
+    async def get_weather_data(self, LATITUDE, LONGITUDE, timezone):
+        return await self.get_as(snap_to_grid(LATITUDE, LONGITUDE) + (timezone,), (LATITUDE, LONGITUDE, timezone))
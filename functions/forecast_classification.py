@@ -0,0 +1,60 @@
+# vectorized forecast classification: precipitation colours, UV risk labels and high/low fields
+# for N locations x H hours in one pass, with every threshold kept in the tables below
+import numpy as np
+
+# precipitation (mm): exactly 0 is "none", otherwise the first row whose bound is >= the value
+PRECIPITATION_LEVELS = [
+    (0.0, '#1f77b4', 'No precipitation'),  # blue
+    (2.5, '#2ecc71', 'Light (≤2.5mm)'),    # green
+    (7.6, '#f1c40f', 'Medium (≤7.6mm)'),   # yellow
+    (50.0, '#e74c3c', 'Heavy (≤50mm)'),    # red
+    (np.inf, '#c0392b', 'Extreme (>50mm)'), # dark red
+]
+
+# uv index (rounded to 1 decimal): the first row whose bound is > the value
+UV_RISK_LEVELS = [
+    (3, 'Low Risk'),
+    (6, 'Medium Risk'),
+    (8, 'High Risk'),
+    (11, 'Very High Risk'),
+    (np.inf, 'Extreme Risk'),
+]
+
+PRECIPITATION_BOUNDS = np.array([bound for bound, _, _ in PRECIPITATION_LEVELS[:-1]])
+PRECIPITATION_COLORS = np.array([color for _, color, _ in PRECIPITATION_LEVELS])
+UV_RISK_BOUNDS = np.array([bound for bound, _ in UV_RISK_LEVELS[:-1]], dtype=float)
+UV_RISK_LABELS = np.array([label for _, label in UV_RISK_LEVELS])
+
+# NaN sorts past every bound, so it lands in the last row just like the old if/elif chains
+
+
+def precipitation_levels(precipitation):
+    precipitation = np.asarray(precipitation)
+    return np.where(precipitation == 0, 0, np.searchsorted(PRECIPITATION_BOUNDS[1:], precipitation, side='left') + 1)
+
+def precipitation_colors(precipitation):
+    return PRECIPITATION_COLORS[precipitation_levels(precipitation)]
+
+def uv_risk_levels(uv_index):
+    return np.searchsorted(UV_RISK_BOUNDS, np.round(np.asarray(uv_index), 1), side='right')
+
+def format_temperatures(temperatures):
+    return np.char.mod('%.1f', np.round(np.asarray(temperatures), 1))
+
+# "7.3 - High Risk", the UV line of the weather message
+def format_uv_index(uv_index):
+    uv_index = np.round(np.asarray(uv_index), 1)
+    return np.char.add(np.char.add(np.char.mod('%.1f', uv_index), ' - '), UV_RISK_LABELS[uv_risk_levels(uv_index)])
+
+# hourly_precipitation is (N, H), the daily arrays are (N,)
+def classify_forecasts(hourly_precipitation, daily_high, daily_low, daily_uv_index):
+    precipitation_level = precipitation_levels(hourly_precipitation)
+    uv_level = uv_risk_levels(daily_uv_index)
+    return {
+        "precipitation_level": precipitation_level,
+        "precipitation_color": PRECIPITATION_COLORS[precipitation_level],
+        "uv_risk_level": uv_level,
+        "uv_index": format_uv_index(daily_uv_index),
+        "high": format_temperatures(daily_high),
+        "low": format_temperatures(daily_low),
+    }
@@ -0,0 +1,116 @@
+# fetch once, serve the week: a 16 day Open-Meteo payload per forecast cell is kept in sqlite and each
+# day's forecast is a slice of it. the next couple of days are refreshed on their own shorter schedule,
+# and when a refresh fails the stored payload still answers, so sends go on while the api is down
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from functions.async_fetch import decode_weather_responses
+from functions.forecast import daily_forecast, hourly_forecast
+from functions.http_client import get_forecast_session, snap_to_grid
+from functions.open_mateo_api import MAX_FORECAST_DAYS, OPEN_MATEO_URL, forecast_params
+
+logger = logging.getLogger(__name__)
+
+FORECAST_STORE_PATH = '.forecast_store.sqlite'
+# the full window is refetched daily, the near-term window (today and tomorrow) more often
+NEAR_TERM_DAYS = 2
+FULL_REFRESH = int(os.getenv("FORECAST_FULL_REFRESH", 24 * 3600))
+NEAR_TERM_REFRESH = int(os.getenv("FORECAST_NEAR_TERM_REFRESH", 6 * 3600))
+
+
+# default fetcher: the raw flatbuffers payload through the shared cached + retrying session, off the event loop
+async def fetch_forecast_payload(LATITUDE, LONGITUDE, timezone, forecast_days):
+    def fetch():
+        params = dict(forecast_params(LATITUDE, LONGITUDE, timezone, forecast_days), format="flatbuffers")
+        response = get_forecast_session().get(OPEN_MATEO_URL, params=params)
+        response.raise_for_status()
+        return response.content
+    return await asyncio.to_thread(fetch)
+
+class MultiDayForecastStore:
+    def __init__(self, path=FORECAST_STORE_PATH, fetch=fetch_forecast_payload, days=MAX_FORECAST_DAYS, near_term_days=NEAR_TERM_DAYS,
+                 full_refresh=FULL_REFRESH, near_term_refresh=NEAR_TERM_REFRESH, clock=time.time):
+        self.fetch = fetch  # async (latitude, longitude, timezone, forecast_days) -> payload bytes
+        self.days = days
+        self.near_term_days = near_term_days  # 0 turns the near-term refresh off: one call per cell per full_refresh
+        self.full_refresh = full_refresh
+        self.near_term_refresh = near_term_refresh
+        self.clock = clock
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS payloads ("
+            "cell TEXT NOT NULL, window TEXT NOT NULL, payload BLOB NOT NULL, fetched_at REAL NOT NULL, "
+            "PRIMARY KEY (cell, window))"
+        )
+        self.connection.commit()
+        self.decoded = {}  # (cell, window) -> (fetched_at, response), each payload is decoded once
+        self.locks = {}  # (cell, window) -> lock, concurrent sends for a cell share one refresh
+        self.fetches = 0
+        self.fallbacks = 0
+
+    def load(self, cell, window):
+        stored = self.decoded.get((cell, window))
+        if stored is None:
+            row = self.connection.execute("SELECT payload, fetched_at FROM payloads WHERE cell = ? AND window = ?", (cell, window)).fetchone()
+            if row is None:
+                return None
+            stored = self.decoded[(cell, window)] = (row[1], decode_weather_responses(row[0])[0])
+        return stored
+
+    async def refresh(self, LATITUDE, LONGITUDE, timezone, cell, window):
+        self.fetches += 1
+        payload = await self.fetch(LATITUDE, LONGITUDE, timezone, self.days if window == "full" else self.near_term_days)
+        fetched_at = self.clock()
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO payloads VALUES (?, ?, ?, ?)", (cell, window, payload, fetched_at))
+        stored = self.decoded[(cell, window)] = (fetched_at, decode_weather_responses(payload)[0])
+        return stored
+
+    # the stored (fetched_at, response) if younger than max_age, else a fresh one;
+    # a failed refresh falls back to whatever is stored, however old
+    async def ensure(self, LATITUDE, LONGITUDE, timezone, window, max_age):
+        cell = "{},{},{}".format(*snap_to_grid(LATITUDE, LONGITUDE), timezone)
+        async with self.locks.setdefault((cell, window), asyncio.Lock()):
+            stored = self.load(cell, window)
+            if stored is not None and self.clock() - stored[0] < max_age:
+                return stored
+            try:
+                return await self.refresh(LATITUDE, LONGITUDE, timezone, cell, window)
+            except Exception as e:
+                if stored is None:
+                    raise
+                self.fallbacks += 1
+                logger.warning(f"Forecast refresh for {cell} ({window}) failed, using the one from {datetime.fromtimestamp(stored[0]).isoformat()}: {str(e)}")
+                return stored
+
+    # (hourly, daily) Forecasts for one local date, sliced out of the freshest stored payload that covers it
+    async def get_day(self, LATITUDE, LONGITUDE, timezone, date):
+        today = datetime.fromtimestamp(self.clock(), ZoneInfo(timezone)).date()
+        candidates = []
+        if self.near_term_days and today <= date < today + timedelta(days=self.near_term_days):
+            try:
+                candidates.append(await self.ensure(LATITUDE, LONGITUDE, timezone, "near", self.near_term_refresh))
+            except Exception as e:
+                logger.warning(f"Near-term forecast unavailable, using the full window: {str(e)}")
+        try:
+            candidates.append(await self.ensure(LATITUDE, LONGITUDE, timezone, "full", self.full_refresh))
+        except Exception:
+            if not candidates:
+                raise
+
+        for _, response in sorted(candidates, key=lambda stored: stored[0], reverse=True):
+            hourly = hourly_forecast(response).for_date(date)
+            if len(hourly):
+                return hourly, daily_forecast(response).for_date(date)
+        raise LookupError(f"No stored forecast covers {date} for {LATITUDE}, {LONGITUDE}")
+
+    def stats(self):
+        return {"fetches": self.fetches, "fallbacks": self.fallbacks, "payloads": len(self.decoded)}
+
+    def close(self):
+        self.connection.close()
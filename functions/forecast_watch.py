@@ -0,0 +1,199 @@
+# intraday watch mode: re-poll each forecast cell on an interval and DM an update only when the
+# forecast moved past a threshold since the last thing its subscribers were sent.
+# conditional polls (etag / payload hash) skip decoding unchanged payloads, and cells without a
+# significant change skip rendering and sending entirely
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+
+from functions.forecast_classification import precipitation_levels
+
+logger = logging.getLogger(__name__)
+
+WATCH_SNAPSHOTS_PATH = '.forecast_snapshots.sqlite'
+WATCH_INTERVAL = 30 * 60
+# an update goes out when an upcoming hour moves up a precipitation level, or the high moves this much (°F)
+HIGH_TEMPERATURE_CHANGE = 5.0
+# what a poll reads: the snapshot, and the chart sent with an update (see functions/variables.py)
+WATCH_CONSUMERS = ("forecast_watch", "temperature_plot")
+
+
+# the parts of a forecast an update is judged on, as plain arrays
+def take_snapshot(hourly, daily):
+    return {
+        "date": datetime.fromtimestamp(daily.time + daily.utc_offset_seconds, tz=dt_timezone.utc).date().isoformat(),
+        "time": int(hourly.time),
+        "interval": int(hourly.interval),
+        "utc_offset_seconds": int(hourly.utc_offset_seconds),
+        "precipitation": np.asarray(hourly["precipitation"], dtype=np.float32),
+        "high": float(daily["temperature_2m_max"][0]),
+    }
+
+# [{"type": ...}] for every threshold crossed between the last-sent snapshot and the current one
+def forecast_changes(previous, current, now, high_temperature_change=HIGH_TEMPERATURE_CHANGE):
+    changes = []
+
+    # both snapshots are hourly, so lining them up by timestamp is an index offset
+    offset = (current["time"] - previous["time"]) // current["interval"]
+    previous_precipitation = previous["precipitation"][max(offset, 0):]
+    current_precipitation = current["precipitation"][max(-offset, 0):]
+    length = min(len(previous_precipitation), len(current_precipitation))
+    times = current["time"] + current["interval"] * (np.arange(length) + max(-offset, 0))
+    current_precipitation = current_precipitation[:length]
+    levels = precipitation_levels(current_precipitation)
+    # NaN (no model data for the hour) would classify as extreme: an hour without data now is never
+    # reported, one that had none before is compared as dry
+    previous_levels = precipitation_levels(np.nan_to_num(previous_precipitation[:length], nan=0.0))
+    wetter = (times >= now) & ~np.isnan(current_precipitation) & (levels > previous_levels)
+    if wetter.any():
+        changes.append({"type": "precipitation", "times": times[wetter], "levels": levels[wetter]})
+
+    # a NaN high on either side compares False, it is never reported
+    if abs(current["high"] - previous["high"]) >= high_temperature_change:
+        changes.append({"type": "high_temperature", "previous": previous["high"], "current": current["high"]})
+    return changes
+
+# per forecast cell: the last-sent snapshot, plus the etag and payload hash of the last poll
+class SnapshotStore:
+    def __init__(self, path=WATCH_SNAPSHOTS_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "cell TEXT PRIMARY KEY, forecast_date TEXT NOT NULL, time INTEGER NOT NULL, interval INTEGER NOT NULL, "
+            "utc_offset_seconds INTEGER NOT NULL, precipitation BLOB NOT NULL, high REAL NOT NULL, "
+            "etag TEXT, digest TEXT, updated_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get(self, cell):
+        row = self.connection.execute(
+            "SELECT forecast_date, time, interval, utc_offset_seconds, precipitation, high, etag, digest FROM snapshots WHERE cell = ?", (cell,)
+        ).fetchone()
+        if row is None:
+            return None
+        forecast_date, start, interval, utc_offset_seconds, precipitation, high, etag, digest = row
+        return {
+            "date": forecast_date,
+            "time": start,
+            "interval": interval,
+            "utc_offset_seconds": utc_offset_seconds,
+            "precipitation": np.frombuffer(precipitation, dtype=np.float32),
+            "high": high,
+            "etag": etag,
+            "digest": digest,
+        }
+
+    def put(self, cell, snapshot, etag=None, digest=None):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cell, snapshot["date"], snapshot["time"], snapshot["interval"], snapshot["utc_offset_seconds"],
+                 snapshot["precipitation"].tobytes(), snapshot["high"], etag, digest, time.time()),
+            )
+
+    # the payload was polled but not sent: remember it so the next identical poll is skipped early
+    def set_validators(self, cell, etag, digest):
+        with self.connection:
+            self.connection.execute("UPDATE snapshots SET etag = ?, digest = ? WHERE cell = ?", (etag, digest, cell))
+
+    def close(self):
+        self.connection.close()
+
+class ForecastWatcher:
+    # groups: {(latitude, longitude, timezone): [subscribers]}, see SubscriberRegistry.forecast_groups
+    def __init__(self, groups, fetcher, sender, store=None, plot_cache=None, interval=WATCH_INTERVAL,
+                 high_temperature_change=HIGH_TEMPERATURE_CHANGE, plot_options=None, clock=time.time):
+        from functions.plot_cache import PlotCache
+
+        self.groups = groups
+        self.fetcher = fetcher  # AsyncWeatherFetcher
+        self.sender = sender
+        self.store = store or SnapshotStore()
+        self.plot_cache = plot_cache or PlotCache()
+        self.interval = interval
+        self.high_temperature_change = high_temperature_change
+        self.plot_options = plot_options or {}
+        self.clock = clock
+        # matplotlib is not thread safe, every render goes through this one thread
+        self.render_executor = ThreadPoolExecutor(max_workers=1)
+        self.polls = 0
+        self.unchanged = 0
+        self.updates = 0
+
+    # one poll of one cell, returns the number of update DMs sent
+    async def poll_group(self, key, subscribers):
+        from functions.forecast import daily_forecast, hourly_forecast
+        from functions.open_mateo_api import forecast_params
+
+        LATITUDE, LONGITUDE, timezone = key
+        cell = f"{LATITUDE},{LONGITUDE},{timezone}"
+        snapshot = self.store.get(cell)
+        self.polls += 1
+        responses, etag, digest = await self.fetcher.fetch_weather_if_changed(
+            forecast_params(LATITUDE, LONGITUDE, timezone, consumers=WATCH_CONSUMERS), snapshot and snapshot["etag"], snapshot and snapshot["digest"]
+        )
+        if responses is None:
+            self.unchanged += 1
+            return 0
+
+        response = responses[0]
+        hourly = hourly_forecast(response).day(0)
+        current = take_snapshot(hourly, daily_forecast(response).day(0))
+        # first poll of the day: the morning message already covered this forecast, it becomes the baseline
+        if snapshot is None or snapshot["date"] != current["date"]:
+            self.store.put(cell, current, etag, digest)
+            return 0
+
+        changes = forecast_changes(snapshot, current, self.clock(), self.high_temperature_change)
+        if not changes:
+            self.unchanged += 1
+            self.store.set_validators(cell, etag, digest)
+            return 0
+
+        from functions.data_processing import create_update_message
+
+        loop = asyncio.get_running_loop()
+        hourly_weather_df = hourly.from_hour(6).to_pandas()
+        plot = (await loop.run_in_executor(self.render_executor, lambda: self.plot_cache.get_or_render(hourly_weather_df, **self.plot_options))).getvalue()
+        jobs = [
+            (subscriber["user_id"], create_update_message(subscriber["user_id"], subscriber["name"], changes, current["utc_offset_seconds"], subscriber.get("units") or "fahrenheit"), plot)
+            for subscriber in subscribers
+        ]
+        results = await self.sender.send(jobs)
+        for result in results:
+            if not result["success"]:
+                logger.error(result["error"])
+        sent = sum(result["success"] for result in results)
+        # what was sent is the new baseline, so the same change is never announced twice
+        if sent:
+            self.store.put(cell, current, etag, digest)
+            self.updates += 1
+        return sent
+
+    async def poll_once(self):
+        results = await asyncio.gather(*(self.poll_group(key, subscribers) for key, subscribers in self.groups.items()), return_exceptions=True)
+        for key, result in zip(self.groups, results):
+            if isinstance(result, Exception):
+                logger.error(f"Polling forecast cell {key} failed: {str(result)}")
+        return sum(result for result in results if not isinstance(result, Exception))
+
+    async def run(self):
+        await self.sender.start()
+        try:
+            while True:
+                started = time.monotonic()
+                sent = await self.poll_once()
+                logger.info(f"Watch poll: {sent} update(s) sent, {self.stats()}")
+                await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
+        finally:
+            await self.sender.close()
+            self.render_executor.shutdown(wait=False)
+            self.store.close()
+
+    def stats(self):
+        return {"cells": len(self.groups), "polls": self.polls, "unchanged": self.unchanged, "updates": self.updates}
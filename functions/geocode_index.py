@@ -0,0 +1,109 @@
+# on-disk geocode index so OpenWeatherMap is only asked about cities we have never seen
+import csv
+import json
+import sqlite3
+import time
+
+from functions.open_weather_api import build_geocode_url, get_geocodes
+
+GEOCODE_INDEX_PATH = '.geocode_index.sqlite'
+
+
+# "Milpitas ", "06" and "milpitas", "06" should land on the same row
+def normalize_location(city, state_code=None, country_code=None):
+    return tuple(" ".join(str(part).split()).casefold() if part else "" for part in (city, state_code, country_code))
+
+class GeocodeIndex:
+    def __init__(self, path=GEOCODE_INDEX_PATH, ttl=None):
+        self.path = path
+        self.ttl = ttl  # seconds, None means entries never expire
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            "city TEXT NOT NULL, state TEXT NOT NULL, country TEXT NOT NULL, "
+            "latitude REAL NOT NULL, longitude REAL NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (city, state, country))"
+        )
+        self.connection.commit()
+
+        # the whole index is tiny, keep it in a dict so repeat lookups never touch sqlite
+        self.entries = {
+            (city, state, country): (latitude, longitude, updated_at)
+            for city, state, country, latitude, longitude, updated_at
+            in self.connection.execute("SELECT city, state, country, latitude, longitude, updated_at FROM geocodes")
+        }
+
+    def is_expired(self, entry):
+        return self.ttl is not None and time.time() - entry[2] > self.ttl
+
+    def get(self, city, state_code=None, country_code=None):
+        entry = self.entries.get(normalize_location(city, state_code, country_code))
+        if entry is None or self.is_expired(entry):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put_many(self, rows):
+        # rows of (city, state_code, country_code, latitude, longitude), written in one transaction
+        now = time.time()
+        records = [normalize_location(city, state, country) + (float(lat), float(lon), now) for city, state, country, lat, lon in rows]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?)", records)
+        for city, state, country, latitude, longitude, updated_at in records:
+            self.entries[(city, state, country)] = (latitude, longitude, updated_at)
+        return len(records)
+
+    def put(self, city, state_code, country_code, latitude, longitude):
+        self.put_many([(city, state_code, country_code, latitude, longitude)])
+
+    # gazetteer rows need city, lat/latitude and lon/longitude columns; state and country are optional
+    def prefill_from_rows(self, rows):
+        return self.put_many(
+            (row["city"], row.get("state"), row.get("country"), row.get("lat", row.get("latitude")), row.get("lon", row.get("longitude")))
+            for row in rows
+        )
+
+    def prefill_from_csv(self, path):
+        with open(path, newline='', encoding='utf-8') as file:
+            return self.prefill_from_rows(csv.DictReader(file))
+
+    def prefill_from_json(self, path):
+        with open(path, encoding='utf-8') as file:
+            return self.prefill_from_rows(json.load(file))
+
+    # answer from the index, only misses go out to the geocoding api
+    def lookup(self, city, state_code=None, country_code=None, api_key=None, fetch=get_geocodes):
+        cached = self.get(city, state_code, country_code)
+        if cached is not None:
+            return cached
+
+        latitude, longitude = fetch(build_geocode_url(city, state_code, country_code, api_key))
+        if latitude is not None and longitude is not None:
+            self.put(city, state_code, country_code, latitude, longitude)
+        return latitude, longitude
+
+    # same as lookup, for an async fetch such as AsyncWeatherFetcher.get_geocodes.
+    # resolve: an async (city, state_code, country_code) -> (latitude, longitude) used instead of fetch,
+    # e.g. HedgedProviders.geocode (functions/providers.py)
+    async def lookup_async(self, city, state_code=None, country_code=None, api_key=None, fetch=None, resolve=None):
+        cached = self.get(city, state_code, country_code)
+        if cached is not None:
+            return cached
+
+        if resolve is not None:
+            latitude, longitude = await resolve(city, state_code, country_code)
+        else:
+            latitude, longitude = await fetch(build_geocode_url(city, state_code, country_code, api_key))
+        if latitude is not None and longitude is not None:
+            self.put(city, state_code, country_code, latitude, longitude)
+        return latitude, longitude
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,126 @@
+# process-wide http clients shared by open_weather_api and open_mateo_api
+# building a session per call pays a TLS handshake (and a sqlite cache open) every time
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from functions import metrics
+
+# keep-alive connections kept per host. blocking fetches run on asyncio.to_thread's default executor
+# (min(32, cpus + 4) threads, see functions/scheduler_daemon.py and functions/forecast_store.py): a pool
+# smaller than that discards a connection after every concurrent burst and pays a new TLS handshake
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", min(32, (os.cpu_count() or 1) + 4)))
+
+# forecast cache, backend is any requests_cache backend name: sqlite, memory, filesystem, ...
+FORECAST_CACHE_NAME = os.getenv("FORECAST_CACHE_NAME", ".cache")
+FORECAST_CACHE_BACKEND = os.getenv("FORECAST_CACHE_BACKEND", "sqlite")
+FORECAST_CACHE_EXPIRE = int(os.getenv("FORECAST_CACHE_EXPIRE", 3600))
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", 1000))
+
+# cache and dedupe keys round coordinates to this grid, requests always ask for the exact point.
+# 0.01 degree (~1.1 km) is finer than the finest models Open-Meteo serves (AROME ~1.3 km, ICON-D2 ~2 km,
+# HRRR ~3 km), so points sharing a key are answered from the same or a neighbouring model cell
+FORECAST_GRID_DEGREES = float(os.getenv("FORECAST_GRID_DEGREES", 0.01))
+
+_lock = threading.Lock()
+_http_session = None
+_forecast_session = None
+_openmeteo_client = None
+
+
+def mount_pooled_adapter(session, max_retries=0):
+    adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE, max_retries=max_retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# response hook: body bytes per host, and hit/miss for cached sessions (requests_cache runs hooks on hits too)
+def record_response(response, *args, **kwargs):
+    host = urlsplit(response.url).hostname
+    metrics.count("http_response_bytes", len(response.content), host=host)
+    from_cache = getattr(response, "from_cache", None)
+    if from_cache is not None:
+        metrics.count("cache_events", cache="http", event="hit" if from_cache else "miss")
+    return response
+
+# plain pooled session, used for geocoding
+def get_http_session():
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            _http_session = mount_pooled_adapter(requests.Session())
+            _http_session.hooks["response"].append(record_response)
+        return _http_session
+
+# cached + retrying pooled session, used for forecasts
+def get_forecast_session():
+    global _forecast_session
+    with _lock:
+        if _forecast_session is None:
+            # forecast-only dependencies, imported on first use
+            import requests_cache
+            from retry_requests import retry
+
+            cache_session = requests_cache.CachedSession(FORECAST_CACHE_NAME, backend=FORECAST_CACHE_BACKEND, expire_after=FORECAST_CACHE_EXPIRE, key_fn=forecast_cache_key)
+            retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
+            # retry() mounts a default adapter (10 connections per host), swap in one sized to POOL_MAXSIZE with the same retry policy
+            _forecast_session = mount_pooled_adapter(retry_session, retry_session.get_adapter('https://').max_retries)
+            _forecast_session.hooks["response"].append(record_response)
+        return _forecast_session
+
+def get_openmeteo_client():
+    global _openmeteo_client
+    session = get_forecast_session()
+    with _lock:
+        # the client closes its session when garbage collected, so keep the one instance alive
+        if _openmeteo_client is None:
+            import openmeteo_requests
+            _openmeteo_client = openmeteo_requests.Client(session = session)
+        return _openmeteo_client
+
+def snap_coordinate(value, grid_degrees=FORECAST_GRID_DEGREES):
+    if not grid_degrees:
+        return value
+    return round(round(value / grid_degrees) * grid_degrees, 4)
+
+# the grid cell a point falls in, for cache and dedupe keys only (never sent to Open-Meteo)
+def snap_to_grid(LATITUDE, LONGITUDE, grid_degrees=FORECAST_GRID_DEGREES):
+    return snap_coordinate(LATITUDE, grid_degrees), snap_coordinate(LONGITUDE, grid_degrees)
+
+# requests_cache key_fn: the request as sent, but with latitude/longitude rounded to the grid,
+# so nearby points share a cache entry while every miss still fetches its own exact point
+def forecast_cache_key(request, **kwargs):
+    from requests_cache import create_key
+
+    url = urlsplit(request.url)
+    query = [
+        (name, snap_coordinate(float(value)) if name in ("latitude", "longitude") else value)
+        for name, value in parse_qsl(url.query, keep_blank_values=True)
+    ]
+    request = request.copy()
+    request.url = url._replace(query=urlencode(query)).geturl()
+    return create_key(request, **kwargs)
+
+# drop expired entries first, then the oldest ones until the cache is back under its cap
+def trim_forecast_cache(max_entries=FORECAST_CACHE_MAX_ENTRIES):
+    cache = get_forecast_session().cache
+    if not max_entries or len(cache.responses) <= max_entries:
+        return 0
+    before = len(cache.responses)
+    cache.delete(expired=True)
+    overflow = len(cache.responses) - max_entries
+    if overflow > 0:
+        oldest = sorted(cache.filter(), key=lambda response: response.created_at)[:overflow]
+        cache.delete(*[response.cache_key for response in oldest])
+    return before - len(cache.responses)
+
+def close_http_clients():
+    global _http_session, _forecast_session, _openmeteo_client
+    with _lock:
+        for session in (_http_session, _forecast_session):
+            if session is not None:
+                session.close()
+        _http_session = _forecast_session = _openmeteo_client = None
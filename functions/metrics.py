@@ -0,0 +1,152 @@
+# per-stage timing spans, byte counts and cache counters for one run, so a slow morning run
+# shows which stage was slow without attaching a profiler
+# a run is exported as JSON lines (one record per stage/counter) or a Prometheus text-format file
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_PREFIX = "weather_bot"
+
+# cache_events counters share one event vocabulary across caches, so they aggregate by event:
+# hit, miss, stale_hit (served stale while refreshing), disk_hit, refresh, failure (a refresh that raised),
+# invalidated (a cached entry found to be unusable and dropped). stats() dict keys map onto it here,
+# gauges (entries, bytes, ...) are not exported as events
+CACHE_EVENTS = {"hits": "hit", "misses": "miss", "stale_hits": "stale_hit", "disk_hits": "disk_hit", "refreshes": "refresh", "failures": "failure"}
+
+# pipeline stages in the order they run, other stage names are allowed and exported after these
+STAGES = ("geocode", "forecast_fetch", "dataframe_build", "plot_render", "png_encode", "discord_login", "dm_send")
+
+
+class RunMetrics:
+    def __init__(self, run_id=None, clock=time.perf_counter):
+        self.run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+        self.started_at = time.time()
+        self.clock = clock
+        # spans are aggregated as they close, so 10,000 DMs cost 10,000 additions and not 10,000 records
+        self.stages = {}  # stage -> {"count", "seconds", "max_seconds", "bytes", "errors"}
+        self.counters = {}  # (name, sorted label items) -> value
+        self.lock = threading.Lock()
+
+    # the yielded dict takes a byte count: with metrics.span("png_encode") as span: span["bytes"] = ...
+    @contextmanager
+    def span(self, stage):
+        span = {"bytes": 0}
+        start = self.clock()
+        failed = False
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record(stage, self.clock() - start, span["bytes"], failed)
+
+    def record(self, stage, seconds, nbytes=0, failed=False):
+        with self.lock:
+            totals = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "errors": 0})
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["bytes"] += nbytes
+            totals["errors"] += failed
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # hit/miss style stats() dicts from GeocodeIndex, PlotCache and ForecastCache
+    def record_cache(self, cache, stats):
+        for name, value in stats.items():
+            if name in CACHE_EVENTS:
+                self.count("cache_events", value, cache=cache, event=CACHE_EVENTS[name])
+
+    def stage_items(self):
+        with self.lock:
+            order = sorted(self.stages, key=lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES))
+            return [(stage, dict(self.stages[stage])) for stage in order]
+
+    def counter_items(self):
+        with self.lock:
+            return sorted(self.counters.items())
+
+    # one line for the log: stage seconds, slowest stage first
+    def summary(self):
+        stages = sorted(self.stage_items(), key=lambda item: item[1]["seconds"], reverse=True)
+        return ", ".join(f"{stage} {totals['seconds'] * 1000:.1f} ms" + (f" ({totals['count']}x)" if totals["count"] > 1 else "") for stage, totals in stages)
+
+    def json_lines(self):
+        lines = []
+        for stage, totals in self.stage_items():
+            record = {"run_id": self.run_id, "started_at": self.started_at, "type": "stage", "stage": stage}
+            record.update(totals)
+            record["seconds"] = round(record["seconds"], 6)
+            record["max_seconds"] = round(record["max_seconds"], 6)
+            lines.append(json.dumps(record))
+        for (name, labels), value in self.counter_items():
+            lines.append(json.dumps({"run_id": self.run_id, "started_at": self.started_at, "type": "counter", "name": name, "labels": dict(labels), "value": value}))
+        return "\n".join(lines) + "\n"
+
+    def prometheus_text(self):
+        stages = self.stage_items()
+        lines = []
+
+        def family(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels)
+                lines.append(f"{METRICS_PREFIX}_{name}{{{label_text}}} {value}")
+
+        family("stage_seconds_total", "counter", "Seconds spent in each pipeline stage, summed over its spans.", [((("stage", stage),), round(totals["seconds"], 6)) for stage, totals in stages])
+        family("stage_max_seconds", "gauge", "Slowest single span of each pipeline stage.", [((("stage", stage),), round(totals["max_seconds"], 6)) for stage, totals in stages])
+        family("stage_spans_total", "counter", "Spans recorded for each pipeline stage.", [((("stage", stage),), totals["count"]) for stage, totals in stages])
+        family("stage_errors_total", "counter", "Spans of each pipeline stage that raised.", [((("stage", stage),), totals["errors"]) for stage, totals in stages])
+        family("stage_bytes_total", "counter", "Bytes produced or transferred by each pipeline stage.", [((("stage", stage),), totals["bytes"]) for stage, totals in stages])
+
+        names = sorted({name for (name, _), _ in self.counter_items()})
+        for name in names:
+            family(f"{name}_total", "counter", f"{name.replace('_', ' ').capitalize()}.", [(labels, value) for (counter, labels), value in self.counter_items() if counter == name])
+
+        family("run_start_timestamp_seconds", "gauge", "Unix time the run started.", [((("run_id", self.run_id),), round(self.started_at, 3))])
+        return "\n".join(lines) + "\n"
+
+    # .prom files are rewritten whole (node_exporter's textfile collector reads the latest run),
+    # anything else gets this run's JSON lines appended
+    def write(self, path):
+        if path.endswith(".prom"):
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(self.prometheus_text())
+            os.replace(temporary_path, path)
+        else:
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(self.json_lines())
+        return path
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# process-wide run, so stages in different modules land in the same export
+run_metrics = RunMetrics()
+
+def span(stage):
+    return run_metrics.span(stage)
+
+def record(stage, seconds, nbytes=0, failed=False):
+    run_metrics.record(stage, seconds, nbytes, failed)
+
+def count(name, value=1, **labels):
+    run_metrics.count(name, value, **labels)
+
+def record_cache(cache, stats):
+    run_metrics.record_cache(cache, stats)
+
+# start a fresh run and return the finished one
+def reset(run_id=None):
+    global run_metrics
+    finished, run_metrics = run_metrics, RunMetrics(run_id)
+    return finished
@@ -1,33 +1,51 @@
-import openmeteo_requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 
-import requests_cache
-import pandas as pd
-from retry_requests import retry
+from functions.http_client import get_openmeteo_client, snap_to_grid, trim_forecast_cache
+from functions.variables import CONSUMERS, DEFAULT_CONSUMERS, decode_section, request_variables, variables_for
 
-def get_weather_data(LATITUDE, LONGITUDE):
+OPEN_MATEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+# every registered variable (functions/variables.py), requests only ask for what their consumers read
+HOURLY_VARIABLES = variables_for(CONSUMERS, "hourly")
+DAILY_VARIABLES = variables_for(CONSUMERS, "daily")
+
+# keep every batched request line well under the usual 8KB server/proxy limit
+MAX_URL_LENGTH = 4000
+MAX_BATCH_WORKERS = 4
+
+DEFAULT_TIMEZONE = "America/Los_Angeles"
+# Open-Meteo serves up to 16 days in one response, see functions/forecast_store.py
+MAX_FORECAST_DAYS = 16
+
+# consumers: the outputs that will read this response, see CONSUMERS in functions/variables.py
+def forecast_params(LATITUDE, LONGITUDE, timezone=DEFAULT_TIMEZONE, forecast_days=1, consumers=DEFAULT_CONSUMERS):
+    if not 1 <= forecast_days <= MAX_FORECAST_DAYS:
+        raise ValueError(f"forecast_days must be between 1 and {MAX_FORECAST_DAYS}")
+    return {
+        "latitude": LATITUDE,
+        "longitude": LONGITUDE,
+        **request_variables(consumers),
+        "temperature_unit": "fahrenheit",
+        "wind_speed_unit": "mph",
+        "timezone": timezone,
+        "forecast_days": forecast_days
+    }
+
+def validate_coordinates(LATITUDE, LONGITUDE):
+    if not isinstance(LATITUDE, (int, float)) or not isinstance(LONGITUDE, (int, float)):
+        raise ValueError("Latitude and longitude must be numeric values")
+
+def get_weather_data(LATITUDE, LONGITUDE, timezone=DEFAULT_TIMEZONE, forecast_days=1, consumers=DEFAULT_CONSUMERS):
     try:
-        # Setup the Open-Meteo API client with cache and retry on error
-        cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
-        retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-        openmeteo = openmeteo_requests.Client(session = retry_session)
+        # Shared Open-Meteo client, cached and retrying, see functions/http_client.py
+        openmeteo = get_openmeteo_client()
 
         # Validate input parameters
-        if not isinstance(LATITUDE, (int, float)) or not isinstance(LONGITUDE, (int, float)):
-            raise ValueError("Latitude and longitude must be numeric values")
-
-        # The order of variables in hourly or daily is important to assign them correctly below
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": LATITUDE,
-            "longitude": LONGITUDE,
-            "hourly": ["temperature_2m", "precipitation"],
-            "daily": ["temperature_2m_max", "temperature_2m_min", "sunrise", "sunset", "daylight_duration", "uv_index_max", "precipitation_hours", "precipitation_probability_max"],
-            "temperature_unit": "fahrenheit",
-            "wind_speed_unit": "mph",
-            "timezone": "America/Los_Angeles",
-            "forecast_days": 1
-        }
-        responses = openmeteo.weather_api(url, params=params)
+        validate_coordinates(LATITUDE, LONGITUDE)
+
+        responses = openmeteo.weather_api(OPEN_MATEO_URL, params=forecast_params(LATITUDE, LONGITUDE, timezone, forecast_days, consumers))
+        trim_forecast_cache()
         if not responses:
             raise ValueError("No data received from Open Mateo API")
         
@@ -40,48 +58,92 @@ def get_weather_data(LATITUDE, LONGITUDE):
         print(f"Unexpected error in get_weather_data: {str(e)}")
         raise
 
+# split coordinates so that no request url goes over max_url_length
+def chunk_coordinates(coordinates, max_url_length=MAX_URL_LENGTH, timezone=DEFAULT_TIMEZONE):
+    # the client adds format=flatbuffers to every request
+    base_params = dict(forecast_params([], [], timezone), format="flatbuffers")
+    base_length = len(OPEN_MATEO_URL) + 1 + len(urlencode(base_params, doseq=True))
+
+    chunks = []
+    chunk = []
+    length = base_length
+    for LATITUDE, LONGITUDE in coordinates:
+        # requests encodes a list as repeated keys: &latitude=..&longitude=..
+        cost = len(urlencode({"latitude": LATITUDE, "longitude": LONGITUDE})) + 2
+        if chunk and length + cost > max_url_length:
+            chunks.append(chunk)
+            chunk = []
+            length = base_length
+        chunk.append((LATITUDE, LONGITUDE))
+        length += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def fetch_weather_chunk(openmeteo, chunk, timezone=DEFAULT_TIMEZONE):
+    params = forecast_params([lat for lat, _ in chunk], [lon for _, lon in chunk], timezone)
+    responses = openmeteo.weather_api(OPEN_MATEO_URL, params=params)
+    # Open-Meteo answers with one response per point, in request order
+    if len(responses) != len(chunk):
+        raise ValueError(f"Expected {len(chunk)} responses from Open Mateo API, got {len(responses)}")
+    return responses
+
+# batch version of get_weather_data: one response per input coordinate, same order
+def get_weather_data_batch(coordinates, timezone=DEFAULT_TIMEZONE, max_url_length=MAX_URL_LENGTH, max_workers=MAX_BATCH_WORKERS):
+    try:
+        coordinates = list(coordinates)
+        for LATITUDE, LONGITUDE in coordinates:
+            validate_coordinates(LATITUDE, LONGITUDE)
+
+        # subscribers often share a location (or a grid cell), only ask for each cell once,
+        # at the exact point of its first input
+        grid_coordinates = [snap_to_grid(LATITUDE, LONGITUDE) for LATITUDE, LONGITUDE in coordinates]
+        cell_points = dict(zip(reversed(grid_coordinates), reversed(coordinates)))
+        unique_cells = list(dict.fromkeys(grid_coordinates))
+        chunks = chunk_coordinates([cell_points[cell] for cell in unique_cells], max_url_length, timezone)
+
+        openmeteo = get_openmeteo_client()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            chunk_responses = list(executor.map(lambda chunk: fetch_weather_chunk(openmeteo, chunk, timezone), chunks))
+        trim_forecast_cache()
+
+        responses_by_cell = dict(zip(unique_cells, (response for responses in chunk_responses for response in responses)))
+        return [responses_by_cell[cell] for cell in grid_coordinates]
+    except ValueError as e:
+        print(f"Validation Error: {str(e)}")
+        raise
+    except Exception as e:
+        print(f"Unexpected error in get_weather_data_batch: {str(e)}")
+        raise
+
 def generate_hourly_df(response):
-    hourly = response.Hourly()
-    hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-    hourly_precipitation = hourly.Variables(1).ValuesAsNumpy()
+    # pandas is only needed for the DataFrame builders, see functions/forecast.py for the array path
+    import pandas as pd
 
+    hourly = response.Hourly()
     hourly_data = {"date": pd.date_range(
         start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
         end = pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
         freq = pd.Timedelta(seconds = hourly.Interval()),
         inclusive = "left"
     )}
-    hourly_data["temperature_2m"] = hourly_temperature_2m
-    hourly_data["precipitation"] = hourly_precipitation
+    # one column per variable the response carries, matched by name rather than position
+    hourly_data.update(decode_section(hourly, "hourly"))
 
     hourly_dataframe = pd.DataFrame(data = hourly_data)
     return hourly_dataframe
 
 def generate_daily_df(response):
-    daily = response.Daily()
-    daily_temperature_2m_max = daily.Variables(0).ValuesAsNumpy()
-    daily_temperature_2m_min = daily.Variables(1).ValuesAsNumpy()
-    daily_sunrise = daily.Variables(2).ValuesAsNumpy()
-    daily_sunset = daily.Variables(3).ValuesAsNumpy()
-    daily_daylight_duration = daily.Variables(4).ValuesAsNumpy()
-    daily_uv_index_max = daily.Variables(5).ValuesAsNumpy()
-    daily_precipitation_hours = daily.Variables(6).ValuesAsNumpy()
-    daily_precipitation_probability_max = daily.Variables(7).ValuesAsNumpy()
+    import pandas as pd
 
+    daily = response.Daily()
     daily_data = {"date": pd.date_range(
         start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
         end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
         freq = pd.Timedelta(seconds = daily.Interval()),
         inclusive = "left"
     )}
-    daily_data["temperature_2m_max"] = daily_temperature_2m_max
-    daily_data["temperature_2m_min"] = daily_temperature_2m_min
-    daily_data["sunrise"] = daily_sunrise
-    daily_data["sunset"] = daily_sunset
-    daily_data["daylight_duration"] = daily_daylight_duration
-    daily_data["uv_index_max"] = daily_uv_index_max
-    daily_data["precipitation_hours"] = daily_precipitation_hours
-    daily_data["precipitation_probability_max"] = daily_precipitation_probability_max
+    daily_data.update(decode_section(daily, "daily"))
 
     daily_dataframe = pd.DataFrame(data = daily_data)
     return daily_dataframe
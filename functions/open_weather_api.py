@@ -1,19 +1,32 @@
 import requests
 
+from functions.http_client import get_http_session
+
+GEOCODE_URL = "http://api.openweathermap.org/geo/1.0/direct"
+
+def build_geocode_url(city, state_code=None, country_code=None, api_key=None, limit=2):
+    query = ",".join(str(part) for part in (city, state_code, country_code) if part)
+    return f"{GEOCODE_URL}?q={query}&limit={limit}&appid={api_key}"
+
 def get_geocodes(url):
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
+        # pooled keep-alive session shared with the rest of the process
+        response = get_http_session().get(url)
+        if response.status_code != 200:
+            print(f"Geocoding request failed with status {response.status_code}")
+            return None, None
+
+        data = response.json()
 
-            if not data:
-                print(f"No geocoding data found for inputted area")
-                return None, None
-            # print(data[0])
-            latitude = data[0]['lat']
-            longitude = data[0]['lon']
-            if latitude is not None and longitude is not None:  
-                return latitude,longitude
+        if not data:
+            print(f"No geocoding data found for inputted area")
+            return None, None
+        # print(data[0])
+        latitude = data[0]['lat']
+        longitude = data[0]['lon']
+        if latitude is not None and longitude is not None:  
+            return latitude,longitude
+        return None, None
     except requests.exceptions.RequestException as e:
         print(f"Error getting geocodes: {str(e)}")
-        return None, None
\ No newline at end of file
+        return None, None
@@ -0,0 +1,190 @@
+# durable delivery outbox: the prepared message and chart bytes are written to sqlite before the
+# first send attempt, so a failed DM costs one resend instead of a geocode + fetch + render rerun
+import asyncio
+import logging
+import random
+import sqlite3
+import time
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = '.outbox.sqlite'
+OUTBOX_MAX_ATTEMPTS = 8
+# exponential backoff for 5xx and connection errors, rate limits wait exactly what Discord asks for
+OUTBOX_BASE_DELAY = 2
+OUTBOX_MAX_DELAY = 15 * 60
+# a forecast nobody received within this long is stale, it is expired instead of sent
+OUTBOX_MAX_AGE = 12 * 3600
+# finished rows (delivered, failed, expired) are kept this long for inspection, then deleted
+OUTBOX_RETENTION = 7 * 24 * 3600
+# how long one drain keeps retrying before leaving the rest for the next run (--drain-outbox)
+OUTBOX_DRAIN_TIMEOUT = 300
+# DMs in flight at once per sender, discord.py and DiscordRestSender keep the per-route rate limit buckets
+MAX_CONCURRENT_SENDS = 5
+
+
+# seconds to wait before the next attempt, None when retrying cannot help.
+# discord.py is only imported once a send has failed, a REST delivery that goes through never loads it
+def retry_delay(error, attempts):
+    import discord
+
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, (discord.NotFound, discord.Forbidden)):
+        return None
+    if isinstance(error, discord.HTTPException):
+        if error.status == 429:
+            retry_after = error.response.headers.get('Retry-After')
+            if retry_after is not None:
+                return float(retry_after)
+        elif error.status < 500:
+            return None
+    elif not isinstance(error, (OSError, aiohttp.ClientError, asyncio.TimeoutError)):
+        return None
+    # jitter keeps a batch of failed sends from retrying in lockstep
+    return min(OUTBOX_MAX_DELAY, OUTBOX_BASE_DELAY * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+# one forecast per user and local send date, same key as the daemon's SendLedger: a rerun after a crash
+# between the send and its ack finds the row already there instead of queueing the forecast twice
+def dedupe_key(user_id, send_date):
+    return f"{user_id}|{send_date.isoformat()}"
+
+def describe_error(user_id, error):
+    import discord
+
+    if isinstance(error, discord.NotFound):
+        return f"User with ID {user_id} not found"
+    if isinstance(error, discord.Forbidden):
+        return f"Bot doesn't have permission to send messages to user {user_id}"
+    return f"Failed to send message to user {user_id}: {error}"
+
+class DeliveryOutbox:
+    def __init__(self, path=OUTBOX_PATH, max_attempts=OUTBOX_MAX_ATTEMPTS, max_age=OUTBOX_MAX_AGE, clock=time.time):
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.clock = clock
+        self.connection = sqlite3.connect(path)
+        # status: pending -> delivered, or failed (permanent error / out of attempts) or expired
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY, dedupe_key TEXT UNIQUE, user_id TEXT NOT NULL, message TEXT NOT NULL, plot BLOB, "
+            "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, "
+            "last_error TEXT, created_at REAL NOT NULL, delivered_at REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+        self.connection.commit()
+
+    # jobs are (user_id, message, plot) with plot as bytes, a file-like object or None.
+    # a dedupe key (see dedupe_key) makes re-enqueueing a pending or delivered forecast a no-op,
+    # a failed or expired one is queued again with the new content
+    def enqueue_many(self, jobs, dedupe_keys=None):
+        now = self.clock()
+        rows = []
+        for index, (user_id, message, plot) in enumerate(jobs):
+            if plot is not None and not isinstance(plot, (bytes, bytearray)):
+                plot.seek(0)
+                plot = plot.read()
+            dedupe_key = dedupe_keys[index] if dedupe_keys else None
+            rows.append((dedupe_key, str(user_id), message, plot, now, now))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO outbox (dedupe_key, user_id, message, plot, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (dedupe_key) DO UPDATE SET message = excluded.message, plot = excluded.plot, status = 'pending', attempts = 0, "
+                "next_attempt_at = excluded.next_attempt_at, last_error = NULL, created_at = excluded.created_at "
+                "WHERE outbox.status IN ('failed', 'expired')",
+                rows,
+            )
+        return len(rows)
+
+    def enqueue(self, user_id, message, plot=None, dedupe_key=None):
+        self.enqueue_many([(user_id, message, plot)], [dedupe_key] if dedupe_key else None)
+
+    def expire_stale(self, now=None):
+        now = now or self.clock()
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE outbox SET status = 'expired' WHERE status = 'pending' AND created_at < ?", (now - self.max_age,)
+            )
+            self.connection.execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (now - OUTBOX_RETENTION,))
+        return cursor.rowcount
+
+    # [(id, user_id, message, plot bytes or None, attempts)] that are due now
+    def due(self, now=None, limit=500):
+        return self.connection.execute(
+            "SELECT id, user_id, message, plot, attempts FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (now or self.clock(), limit),
+        ).fetchall()
+
+    def next_attempt_at(self):
+        return self.connection.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def mark_delivered(self, item_id):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE outbox SET status = 'delivered', attempts = attempts + 1, delivered_at = ?, plot = NULL WHERE id = ?",
+                (self.clock(), item_id),
+            )
+
+    def mark_failed(self, item_id, error):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?", (error, item_id)
+            )
+
+    def reschedule(self, item_id, error, delay):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                (error, self.clock() + delay, item_id),
+            )
+
+    def stats(self):
+        counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "delivered", "failed", "expired")}
+
+    # send every due item through send(user_id, message, plot), retrying until each one is delivered,
+    # fails for good, or the timeout is up. returns one {"user_id", "success", "error"} per item attempted
+    async def drain(self, send, max_concurrent_sends=5, timeout=OUTBOX_DRAIN_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        semaphore = asyncio.Semaphore(max_concurrent_sends)
+        outcomes = {}  # id -> result, the last attempt of each item wins
+
+        async def attempt(item):
+            item_id, user_id, message, plot, attempts = item
+            async with semaphore:
+                try:
+                    await send(user_id, message, plot)
+                except Exception as e:
+                    error = describe_error(user_id, e)
+                    delay = retry_delay(e, attempts + 1)
+                    if delay is None or attempts + 1 >= self.max_attempts:
+                        self.mark_failed(item_id, error)
+                    else:
+                        self.reschedule(item_id, error, delay)
+                        error = f"{error} (retrying in {delay:.1f}s)"
+                    outcomes[item_id] = {"user_id": user_id, "success": False, "error": error}
+                    return
+                self.mark_delivered(item_id)
+                outcomes[item_id] = {"user_id": user_id, "success": True, "error": None}
+
+        self.expire_stale()
+        while True:
+            items = self.due()
+            if items:
+                await asyncio.gather(*(attempt(item) for item in items))
+                continue
+            next_attempt_at = self.next_attempt_at()
+            if next_attempt_at is None:
+                break
+            wait = next_attempt_at - self.clock()
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Outbox drain timed out, {self.stats()['pending']} message(s) left for the next drain")
+                break
+            await asyncio.sleep(max(wait, 0))
+        return list(outcomes.values())
+
+    def close(self):
+        self.connection.close()
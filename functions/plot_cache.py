@@ -0,0 +1,180 @@
+# content-addressed cache of rendered forecast PNGs
+# recipients that share a location share a chart, so each chart is rendered and encoded once
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+
+PLOT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# the spill directory is capped too, least recently used files are deleted past this
+PLOT_SPILL_MAX_BYTES = 512 * 1024 * 1024
+SPILL_EXTENSIONS = ('png', 'webp')
+
+
+# everything that changes the pixels goes into the key: the hourly arrays, the date in the title
+# and the render options (dtype is hashed too so float32 and float64 bytes never collide)
+def plot_cache_key(hours, temperatures, precipitation, date, **options):
+    digest = hashlib.sha256()
+    for values in (hours, temperatures, precipitation):
+        values = np.ascontiguousarray(values)
+        digest.update(values.dtype.str.encode())
+        digest.update(values.tobytes())
+    digest.update(str(date).encode())
+    digest.update(repr(sorted(options.items())).encode())
+    return digest.hexdigest()
+
+def plot_cache_key_for_df(hourly_weather_df, **options):
+    return plot_cache_key(
+        hourly_weather_df['hour'].to_numpy(),
+        hourly_weather_df['temperature_2m'].to_numpy(),
+        hourly_weather_df['precipitation'].to_numpy(),
+        hourly_weather_df['date'].dt.date.iloc[0],
+        **options,
+    )
+
+# file extension of an encoded chart, save_plot_to_buffer writes png or webp
+def image_extension(image):
+    if image[:4] == b'RIFF' and image[8:12] == b'WEBP':
+        return 'webp'
+    return 'png'
+
+# Discord picks the preview from the extension, so it has to match the encoding (see save_plot_to_buffer)
+def plot_filename(image):
+    return f"plot.{image_extension(image)}"
+
+def render_png_bytes(hourly_weather_df, **options):
+    from functions.data_plot_creation import create_temperature_plot, save_plot_to_buffer
+    return save_plot_to_buffer(create_temperature_plot(hourly_weather_df), **options).getvalue()
+
+class PlotCache:
+    def __init__(self, max_bytes=PLOT_CACHE_MAX_BYTES, spill_dir=None, spill_max_bytes=PLOT_SPILL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir  # evicted charts are written here instead of dropped
+        self.spill_max_bytes = spill_max_bytes
+        self.entries = OrderedDict()  # key -> png bytes, least recently used first
+        self.total_bytes = 0
+        self.spilled = OrderedDict()  # key -> (path, size) of the spill files, least recently used first
+        self.spill_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self.load_spilled()
+
+    # pick up what an earlier run spilled, oldest first, and trim it to the cap
+    def load_spilled(self):
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            key, _, extension = entry.name.rpartition('.')
+            if extension in SPILL_EXTENSIONS and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, key, entry.path, stat.st_size))
+        for _, key, path, size in sorted(files):
+            self.spilled[key] = (path, size)
+            self.spill_bytes += size
+        self.trim_spilled()
+
+    def spill_path(self, key, image):
+        return os.path.join(self.spill_dir, f"{key}.{image_extension(image)}")
+
+    def get(self, key):
+        with self.lock:
+            png = self.entries.get(key)
+            if png is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return png
+            spilled = self.spilled.get(key)
+            if spilled is not None:
+                self.spilled.move_to_end(key)
+        if spilled is not None:
+            try:
+                with open(spilled[0], 'rb') as file:
+                    png = file.read()
+            except FileNotFoundError:
+                png = None
+            if png is not None:
+                with self.lock:
+                    self.disk_hits += 1
+                self.put(key, png)
+                return png
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, png):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= len(self.entries.pop(key))
+            self.entries[key] = png
+            self.total_bytes += len(png)
+            evicted = []
+            while self.total_bytes > self.max_bytes and self.entries:
+                evicted_key, evicted_png = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted_png)
+                evicted.append((evicted_key, evicted_png))
+        for evicted_key, evicted_png in evicted:
+            self.spill(evicted_key, evicted_png)
+
+    def spill(self, key, png):
+        if not self.spill_dir:
+            return
+        with self.lock:
+            if key in self.spilled:
+                self.spilled.move_to_end(key)
+                return
+        # write then rename so a reader never sees half a file
+        path = self.spill_path(key, png)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(png)
+        os.replace(temporary_path, path)
+        with self.lock:
+            if key not in self.spilled:
+                self.spilled[key] = (path, len(png))
+                self.spill_bytes += len(png)
+        self.trim_spilled()
+
+    def trim_spilled(self):
+        with self.lock:
+            removed = []
+            while self.spill_bytes > self.spill_max_bytes and self.spilled:
+                _, (path, size) = self.spilled.popitem(last=False)
+                self.spill_bytes -= size
+                removed.append(path)
+        for path in removed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    # every caller gets its own BytesIO over the shared bytes, so senders never share a read position
+    def get_or_render(self, hourly_weather_df, render=render_png_bytes, **options):
+        key = plot_cache_key_for_df(hourly_weather_df, **options)
+        png = self.get(key)
+        if png is None:
+            # concurrent misses on the same chart wait for the first render instead of repeating it
+            with self.lock:
+                key_lock = self.key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                with self.lock:
+                    png = self.entries.get(key)
+                if png is None:
+                    png = render(hourly_weather_df, **options)
+                    if isinstance(png, BytesIO):
+                        png = png.getvalue()
+                    self.put(key, png)
+            with self.lock:
+                self.key_locks.pop(key, None)
+        return BytesIO(png)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.total_bytes,
+                    "spilled": len(self.spilled), "spill_bytes": self.spill_bytes}
@@ -0,0 +1,204 @@
+# forecast and geocode providers behind one interface, with hedged requests: when the provider asked
+# first is slower than its own recent p95, the next one is asked as well and the first valid answer wins.
+# a failed or invalid answer moves on to the next provider right away. forecasts always come back as
+# the same (hourly, daily) Forecast pair (functions/forecast.py), whichever provider answered
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from functions import metrics
+from functions.open_mateo_api import forecast_params
+from functions.open_weather_api import build_geocode_url
+from functions.variables import DEFAULT_CONSUMERS, request_variables
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_LATENCY_PATH = '.provider_latency.json'
+# recent latencies kept per provider, and how many it takes before its p95 is trusted
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+# hedge delay for a provider without enough samples yet
+DEFAULT_HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", 1.0))
+# an Open-Meteo compatible endpoint to hedge the forecast against (self-hosted, or the customer api)
+SECONDARY_FORECAST_URL = os.getenv("SECONDARY_FORECAST_URL")
+OPEN_METEO_GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+
+
+class ProviderError(Exception):
+    pass
+
+class LatencyTracker:
+    def __init__(self, window=LATENCY_WINDOW, min_samples=MIN_LATENCY_SAMPLES, default_delay=DEFAULT_HEDGE_DELAY):
+        self.window = window
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.samples = {}  # provider name -> deque of seconds
+        self.failures = {}
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def record_failure(self, name):
+        self.failures[name] = self.failures.get(name, 0) + 1
+
+    def p95(self, name):
+        samples = self.samples.get(name)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return float(np.percentile(samples, 95))
+
+    # how long a provider gets before the next one is asked too
+    def hedge_delay(self, name):
+        p95 = self.p95(name)
+        return self.default_delay if p95 is None else p95
+
+    # one-shot runs start with no history, so the window is kept between runs
+    def load(self, path=PROVIDER_LATENCY_PATH):
+        try:
+            with open(path, encoding='utf-8') as file:
+                for name, samples in json.load(file).items():
+                    self.samples[name] = deque(samples, maxlen=self.window)
+        except (OSError, ValueError):
+            pass
+        return self
+
+    def save(self, path=PROVIDER_LATENCY_PATH):
+        with open(path, "w", encoding='utf-8') as file:
+            json.dump({name: [round(seconds, 4) for seconds in samples] for name, samples in self.samples.items()}, file)
+
+    def stats(self):
+        return {
+            name: {"samples": len(samples), "p50": round(float(np.percentile(samples, 50)), 4), "p95": self.p95(name), "failures": self.failures.get(name, 0)}
+            for name, samples in self.samples.items()
+        }
+
+# Open-Meteo, or any endpoint that speaks its api (the url decides which)
+class OpenMeteoForecastProvider:
+    def __init__(self, fetcher, url=None, name="open-meteo"):
+        self.fetcher = fetcher  # AsyncWeatherFetcher
+        self.url = url
+        self.name = name
+
+    async def fetch_forecast(self, LATITUDE, LONGITUDE, timezone, forecast_days=1, consumers=DEFAULT_CONSUMERS):
+        from functions.async_fetch import decode_weather_responses
+        from functions.forecast import daily_forecast, hourly_forecast
+
+        payload = await self.fetcher.fetch_weather_payload(forecast_params(LATITUDE, LONGITUDE, timezone, forecast_days, consumers), url=self.url)
+        response = decode_weather_responses(payload)[0]
+        return hourly_forecast(response), daily_forecast(response)
+
+class OpenWeatherMapGeocoder:
+    def __init__(self, fetcher, api_key=None, name="openweathermap"):
+        self.fetcher = fetcher
+        self.api_key = api_key
+        self.name = name
+
+    async def geocode(self, city, state_code=None, country_code=None):
+        return await self.fetcher.get_geocodes(build_geocode_url(city, state_code, country_code, self.api_key))
+
+# Open-Meteo's geocoding api searches by name only, results are narrowed to the country when one is given
+class OpenMeteoGeocoder:
+    def __init__(self, fetcher, url=OPEN_METEO_GEOCODING_URL, name="open-meteo-geocoding"):
+        self.fetcher = fetcher
+        self.url = url
+        self.name = name
+
+    async def geocode(self, city, state_code=None, country_code=None):
+        status, body = await self.fetcher.get(self.url, {"name": city, "count": 10, "language": "en", "format": "json"})
+        if status != 200:
+            raise ProviderError(f"{self.name} returned status {status}")
+        results = json.loads(body).get("results") or []
+        if country_code:
+            results = [result for result in results if result.get("country_code", "").upper() == country_code.upper()]
+        if not results:
+            return None, None
+        return results[0]["latitude"], results[0]["longitude"]
+
+# every requested section came back, with a usable high for today
+def valid_forecast(result, consumers=DEFAULT_CONSUMERS):
+    hourly, daily = result
+    sections = request_variables(consumers)
+    if "hourly" in sections and len(hourly) == 0:
+        return False
+    if "daily" in sections and len(daily) == 0:
+        return False
+    return "temperature_2m_max" not in sections.get("daily", ()) or bool(np.isfinite(daily["temperature_2m_max"][:1]).all())
+
+def valid_geocode(result):
+    latitude, longitude = result
+    return latitude is not None and longitude is not None
+
+class HedgedProviders:
+    # providers in order of preference, e.g. [OpenMeteoForecastProvider(fetcher), OpenMeteoForecastProvider(fetcher, SECONDARY_FORECAST_URL, "secondary")]
+    def __init__(self, providers, tracker=None, hedge=True):
+        if not providers:
+            raise ValueError("At least one provider is needed")
+        self.providers = providers
+        self.tracker = tracker or LatencyTracker()
+        self.hedge = hedge  # False: only fall back on failure, never ask two providers at once
+
+    # the first valid result of getattr(provider, method)(*args), asking the next provider when the last
+    # one asked is past its p95 (hedge) or has failed (fallback). the losers are cancelled
+    async def call(self, method, *args, valid=None):
+        remaining = list(self.providers)
+        pending = {}  # task -> (provider, started)
+        errors = []
+        last_started = None
+
+        def launch():
+            nonlocal last_started
+            provider = remaining.pop(0)
+            last_started = (provider, time.perf_counter())
+            pending[asyncio.ensure_future(getattr(provider, method)(*args))] = last_started
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if remaining and self.hedge:
+                    provider, started = last_started
+                    timeout = max(0.0, self.tracker.hedge_delay(provider.name) - (time.perf_counter() - started))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.count("provider_requests", provider=remaining[0].name, reason="hedge")
+                    launch()
+                    continue
+
+                for task in done:
+                    provider, started = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self.tracker.record_failure(provider.name)
+                        errors.append(f"{provider.name}: {e}")
+                        continue
+                    self.tracker.record(provider.name, time.perf_counter() - started)
+                    if valid is None or valid(result):
+                        metrics.count("provider_wins", provider=provider.name)
+                        return result
+                    self.tracker.record_failure(provider.name)
+                    errors.append(f"{provider.name}: invalid result")
+                if not pending and remaining:
+                    metrics.count("provider_requests", provider=remaining[0].name, reason="fallback")
+                    launch()
+            raise ProviderError(f"Every provider failed: {'; '.join(errors)}")
+        finally:
+            # a cancelled loser still took at least this long, leaving it out would pull its p95 down
+            for task, (provider, started) in pending.items():
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()
+                    continue
+                task.cancel()
+                self.tracker.record(provider.name, time.perf_counter() - started)
+
+    async def fetch_forecast(self, LATITUDE, LONGITUDE, timezone, forecast_days=1, consumers=DEFAULT_CONSUMERS):
+        return await self.call("fetch_forecast", LATITUDE, LONGITUDE, timezone, forecast_days, consumers, valid=lambda result: valid_forecast(result, consumers))
+
+    async def geocode(self, city, state_code=None, country_code=None):
+        return await self.call("geocode", city, state_code, country_code, valid=valid_geocode)
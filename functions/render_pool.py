@@ -0,0 +1,132 @@
+# multi-core chart rendering: matplotlib holds the GIL while it draws, so a batch of charts
+# only scales across processes. workers are warmed up front (matplotlib, seaborn, the font cache
+# and a TemperaturePlotRenderer template), take compact numpy payloads instead of pickled
+# DataFrames, and hand PNG bytes back as soon as each chart is done
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+
+from functions import metrics
+
+# one chart per core, leave one for the event loop doing the sends
+RENDER_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+
+# per-worker state, set by warm_worker
+_renderer = None
+
+
+# payload layout: (key, hours int8, temperatures float32, precipitation float32, date string, options dict)
+# a day of hourly values pickles to a couple of hundred bytes
+def chart_payload(key, hours, temperatures, precipitation, date, **options):
+    return (
+        key,
+        np.ascontiguousarray(hours, dtype=np.int8),
+        np.ascontiguousarray(temperatures, dtype=np.float32),
+        np.ascontiguousarray(precipitation, dtype=np.float32),
+        str(date),
+        options,
+    )
+
+def chart_payload_for_df(key, hourly_weather_df, **options):
+    return chart_payload(
+        key,
+        hourly_weather_df['hour'].to_numpy(),
+        hourly_weather_df['temperature_2m'].to_numpy(),
+        hourly_weather_df['precipitation'].to_numpy(),
+        hourly_weather_df['date'].dt.date.iloc[0],
+        **options,
+    )
+
+# straight from the Forecast arrays, pandas is never involved
+def chart_payload_for_forecast(key, hourly, **options):
+    date = datetime.fromtimestamp(hourly.time + hourly.utc_offset_seconds, tz=timezone.utc).date()
+    return chart_payload(key, hourly.local_hours, hourly["temperature_2m"], hourly["precipitation"], date, **options)
+
+def warm_worker():
+    global _renderer
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.font_manager  # loads (or builds) the font cache
+    import pandas as pd
+    from functions.data_plot_creation import TemperaturePlotRenderer
+
+    # build the template and draw it once, so glyphs and the first savefig are paid here, not on a chart
+    hours = np.arange(6, 24)
+    _renderer = TemperaturePlotRenderer()
+    _renderer.render_png(pd.DataFrame({
+        "date": pd.date_range("2026-01-01 06:00", periods=len(hours), freq="h"),
+        "hour": hours,
+        "temperature_2m": np.full(len(hours), 60, dtype=np.float32),
+        "precipitation": np.zeros(len(hours), dtype=np.float32),
+    }))
+
+# held long enough that each warm-up task lands on a different worker
+def worker_pid(hold_seconds):
+    time.sleep(hold_seconds)
+    return os.getpid()
+
+# runs in a worker: (key, png bytes, render seconds, encode seconds)
+def render_payload(payload):
+    from functions.data_plot_creation import encode_figure
+
+    key, hours, temperatures, precipitation, date, options = payload
+    start = time.perf_counter()
+    fig = _renderer.render_arrays(hours, temperatures, precipitation, date)
+    rendered = time.perf_counter()
+    buffer = BytesIO()
+    encode_figure(fig, buffer, **options)
+    return key, buffer.getvalue(), rendered - start, time.perf_counter() - rendered
+
+# worker timings land in this process's run metrics
+def record_result(result):
+    key, png, render_seconds, encode_seconds = result
+    metrics.record("plot_render", render_seconds)
+    metrics.record("png_encode", encode_seconds, len(png))
+    return key, png
+
+class PlotRenderPool:
+    def __init__(self, processes=RENDER_PROCESSES, start_method="spawn"):
+        self.processes = processes
+        # spawn: workers never inherit the parent's threads, event loop or open sockets
+        self.executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context(start_method), initializer=warm_worker)
+        self.warmed = False
+
+    def __enter__(self):
+        self.warm()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # start every worker now and wait until each has run warm_worker (a worker only takes tasks after it)
+    def warm(self):
+        pids = set()
+        while not self.warmed:
+            pids.update(self.executor.map(worker_pid, [0.05] * self.processes))
+            self.warmed = len(pids) >= self.processes
+        return self
+
+    def submit(self, payload):
+        return self.executor.submit(render_payload, payload)
+
+    # (key, png bytes) in completion order, not submission order
+    def render_iter(self, payloads):
+        for future in as_completed([self.submit(payload) for payload in payloads]):
+            yield record_result(future.result())
+
+    async def render_async(self, payloads):
+        futures = [asyncio.wrap_future(self.submit(payload)) for payload in payloads]
+        for future in asyncio.as_completed(futures):
+            yield record_result(await future)
+
+    def render_all(self, payloads):
+        return dict(self.render_iter(payloads))
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
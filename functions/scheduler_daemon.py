@@ -0,0 +1,313 @@
+# resident daemon: keeps the http pools and the Discord connection warm and sends every recipient's
+# forecast at their own local send time, fetched and rendered a lead time ahead of the slot
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEND_LEDGER_PATH = '.send_ledger.sqlite'
+DEFAULT_LEAD_TIME = timedelta(minutes=10)
+# after a restart a slot missed by less than this is still sent, older slots wait for the next day
+LATE_SEND_GRACE = timedelta(hours=1)
+RETRY_DELAY = 60
+# long sleeps are chunked so wall clock adjustments cannot push a send far off its slot
+MAX_SLEEP_SECONDS = 60
+# registry mode looks this far past the lead time for due subscribers on each pass
+SLOT_SCAN_SECONDS = 60
+
+
+# one row per (recipient, local date): 'sending' is written before the DM goes out, so a crash
+# between sending and recording can never lead to a second DM after the restart
+class SendLedger:
+    def __init__(self, path=SEND_LEDGER_PATH):
+        # sharded workers share the ledger file, wait for each other's writes
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sends ("
+            "user_id TEXT NOT NULL, send_date TEXT NOT NULL, status TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, send_date))"
+        )
+        self.connection.commit()
+
+    def has_entry(self, user_id, send_date):
+        row = self.connection.execute(
+            "SELECT 1 FROM sends WHERE user_id = ? AND send_date = ?", (str(user_id), send_date.isoformat())
+        ).fetchone()
+        return row is not None
+
+    # False when this slot was already claimed, by this run or an earlier one
+    def claim(self, user_id, send_date):
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO sends VALUES (?, ?, 'sending', ?)", (str(user_id), send_date.isoformat(), time.time())
+            )
+        return cursor.rowcount == 1
+
+    def mark_sent(self, user_id, send_date):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE sends SET status = 'sent', updated_at = ? WHERE user_id = ? AND send_date = ?",
+                (time.time(), str(user_id), send_date.isoformat()),
+            )
+
+    # the send definitely failed, let the slot be retried
+    def release(self, user_id, send_date):
+        with self.connection:
+            self.connection.execute("DELETE FROM sends WHERE user_id = ? AND send_date = ?", (str(user_id), send_date.isoformat()))
+
+    def close(self):
+        self.connection.close()
+
+def utc_now():
+    return datetime.now(dt_timezone.utc)
+
+async def sleep_until(when):
+    while True:
+        remaining = (when - utc_now()).total_seconds()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, MAX_SLEEP_SECONDS))
+
+# the forecast cache's fetcher: prepare_slot asks the cache for every cell of a slot at once, the misses and
+# refreshes that reach this fetcher in the same event loop pass go out as one get_weather_data_batch call per
+# time zone (a few multi-location requests instead of one per cell), run off the event loop.
+# fetch_batch(coordinates, timezone) returns one response per coordinate, in order
+class BatchedForecastFetcher:
+    def __init__(self, fetch_batch=None):
+        if fetch_batch is None:
+            from functions.open_mateo_api import get_weather_data_batch as fetch_batch
+        self.fetch_batch = fetch_batch
+        self.pending = {}  # timezone -> [((LATITUDE, LONGITUDE), future)]
+
+    async def __call__(self, LATITUDE, LONGITUDE, timezone):
+        loop = asyncio.get_running_loop()
+        if not self.pending:
+            loop.call_soon(self.flush)
+        future = loop.create_future()
+        self.pending.setdefault(timezone, []).append(((LATITUDE, LONGITUDE), future))
+        return await future
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        for timezone, waiters in pending.items():
+            asyncio.ensure_future(self.fetch_timezone(timezone, waiters))
+
+    # a failed batch fails every cell in it, the cache keeps serving their stale entries
+    async def fetch_timezone(self, timezone, waiters):
+        try:
+            responses = await asyncio.to_thread(self.fetch_batch, [coordinates for coordinates, _ in waiters], timezone)
+        except Exception as e:
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), response in zip(waiters, responses):
+            if not future.done():
+                future.set_result(response)
+
+# today's hourly and daily Forecasts from an Open-Meteo response
+def day_forecasts(response):
+    from functions.forecast import daily_forecast, hourly_forecast
+
+    return hourly_forecast(response).day(0), daily_forecast(response).day(0)
+
+# one forecast cell's DMs from one day's hourly and daily Forecasts: one vectorized message pass and one
+# chart for all its subscribers. plot is the chart's bytes when it was already rendered elsewhere
+def build_forecast_jobs(subscribers, hourly, daily, plot_cache, plot_options=None, plot=None):
+    from functions.data_processing import create_weather_messages
+
+    count = len(subscribers)
+    messages = create_weather_messages(
+        [subscriber["user_id"] for subscriber in subscribers],
+        [subscriber["name"] for subscriber in subscribers],
+        np.repeat(daily["temperature_2m_max"][:1], count),
+        np.repeat(daily["temperature_2m_min"][:1], count),
+        np.repeat(daily["uv_index_max"][:1], count),
+        units=[subscriber.get("units") or "fahrenheit" for subscriber in subscribers],
+    )
+    if plot is None:
+        plot = plot_cache.get_or_render(hourly.from_hour(6).to_pandas(), **(plot_options or {})).getvalue()
+    return [(subscriber["user_id"], message, plot) for subscriber, message in zip(subscribers, messages)]
+
+class WeatherDaemon:
+    # registry: a SubscriberRegistry (functions/subscribers.py), scanned for due subscribers who are then
+    # fetched and rendered per forecast cell.
+    # forecast_store: a MultiDayForecastStore (functions/forecast_store.py), registry slots are then served
+    # from the stored multi-day forecast instead of a fetch per slot.
+    # work: a ShardedWork (functions/work_leases.py), registry slots are then split with other workers by forecast cell.
+    # render_pool: a warmed PlotRenderPool (functions/render_pool.py), a slot's uncached charts are then rendered
+    # across its processes instead of one by one on the render thread. the caller owns and closes it
+    def __init__(self, registry, sender, lead_time=DEFAULT_LEAD_TIME, ledger_path=SEND_LEDGER_PATH, plot_cache=None, forecast_cache=None, plot_options=None,
+                 forecast_store=None, work=None, render_pool=None):
+        from functions.plot_cache import PlotCache
+        from functions.forecast_cache import ForecastCache
+
+        self.registry = registry
+        self.sender = sender
+        self.lead_time = lead_time
+        self.ledger = SendLedger(ledger_path)
+        self.plot_cache = plot_cache or PlotCache()
+        self.plot_options = plot_options or {}  # save_plot_to_buffer options: format, dpi, colors, ...
+        # stale-while-revalidate: a slow Open-Meteo only delays background refreshes, not sends
+        self.forecast_cache = forecast_cache or ForecastCache(BatchedForecastFetcher())
+        self.forecast_store = forecast_store
+        self.work = work
+        self.render_pool = render_pool
+        # matplotlib is not thread safe, every in-process render goes through this one thread (fetches run in asyncio.to_thread)
+        self.render_executor = ThreadPoolExecutor(max_workers=1)
+
+    # fetch each forecast cell once and build every DM in it on the render thread (with a render pool, its charts
+    # are drawn there first). a cell that fails is logged and left out, so it cannot hold up the others: its
+    # subscribers get no job and send_slot retries them
+    async def prepare_slot(self, subscribers, send_date=None):
+        loop = asyncio.get_running_loop()
+        groups = list(self.registry.forecast_groups(subscribers).items())
+        use_store = self.forecast_store is not None and send_date is not None
+        if use_store:
+            fetches = (self.forecast_store.get_day(LATITUDE, LONGITUDE, timezone, send_date) for (LATITUDE, LONGITUDE, timezone), _ in groups)
+        else:
+            fetches = (self.forecast_cache.get_weather_data(LATITUDE, LONGITUDE, timezone) for (LATITUDE, LONGITUDE, timezone), _ in groups)
+        results = await asyncio.gather(*fetches, return_exceptions=True)
+
+        cells = []
+        for (key, group), result in zip(groups, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                hourly, daily = result if use_store else day_forecasts(result)
+                cells.append((key, group, hourly, daily))
+            except Exception as e:
+                logger.error(f"Preparing forecast cell {key} ({len(group)} subscriber(s)) failed: {str(e)}")
+
+        plots = await self.render_plots(cells) if self.render_pool is not None else {}
+        jobs = []
+        for key, group, hourly, daily in cells:
+            try:
+                jobs.extend(await loop.run_in_executor(self.render_executor, build_forecast_jobs, group, hourly, daily, self.plot_cache, self.plot_options, plots.get(key)))
+            except Exception as e:
+                logger.error(f"Preparing forecast cell {key} ({len(group)} subscriber(s)) failed: {str(e)}")
+        return jobs
+
+    # {cell key: png bytes} for the cells' charts, rendered across the pool's processes when the plot cache
+    # does not have them yet. a chart the pool fails on is left out and build_forecast_jobs renders it in-process
+    async def render_plots(self, cells):
+        from functions.plot_cache import plot_cache_key_for_df
+        from functions.render_pool import chart_payload_for_df
+
+        plots, payloads = {}, []
+        for key, _, hourly, _ in cells:
+            hourly_weather_df = hourly.from_hour(6).to_pandas()
+            cache_key = plot_cache_key_for_df(hourly_weather_df, **self.plot_options)
+            png = self.plot_cache.get(cache_key)
+            if png is None:
+                payloads.append(chart_payload_for_df((key, cache_key), hourly_weather_df, **self.plot_options))
+            else:
+                plots[key] = png
+        try:
+            async for (key, cache_key), png in self.render_pool.render_async(payloads):
+                self.plot_cache.put(cache_key, png)
+                plots[key] = png
+        except Exception as e:
+            logger.error(f"Rendering charts in the render pool failed, rendering the rest in-process: {str(e)}")
+        return plots
+
+    async def run_slot(self, send_at, subscribers):
+        if self.work is None:
+            return await self.send_slot(send_at, subscribers)
+
+        # one batch per forecast cell and slot, the worker the cell hashes to claims it a lead time ahead;
+        # anything still unclaimed or abandoned after the takeover delay is picked up by whoever sees it first
+        slot = send_at.astimezone(dt_timezone.utc).isoformat()
+        batches = {}
+        for (LATITUDE, LONGITUDE, timezone), group in self.registry.forecast_groups(subscribers).items():
+            batches.setdefault((f"{slot}|{timezone}|{LATITUDE},{LONGITUDE}", f"{LATITUDE},{LONGITUDE}"), []).extend(group)
+        groups = {batch: group for (batch, _), group in batches.items()}
+        await sleep_until(send_at - self.lead_time)
+
+        async def send_batches(claimed):
+            if claimed:
+                async with self.work.holding(claimed):
+                    await self.send_slot(send_at, [subscriber for batch in claimed for subscriber in groups[batch]])
+
+        async def take_over(own):
+            await sleep_until(send_at + timedelta(seconds=self.work.takeover_delay))
+            claimed = self.work.claim([(batch, key) for batch, key in batches if batch not in own], takeover=True)
+            if claimed:
+                logger.warning(f"Taking over {len(claimed)} forecast cell(s) of the {send_at.isoformat()} slot from other workers")
+            await send_batches(claimed)
+
+        own = self.work.claim(batches)
+        await asyncio.gather(send_batches(own), take_over(own))
+
+    # every subscriber due at send_at: prepared a lead time ahead, sent together, failures retried within the grace period
+    async def send_slot(self, send_at, subscribers):
+        send_date = send_at.date()
+        by_user = {subscriber["user_id"]: subscriber for subscriber in subscribers}
+        await sleep_until(send_at - self.lead_time)
+        while by_user and utc_now() < send_at + LATE_SEND_GRACE:
+            try:
+                jobs = await self.prepare_slot(list(by_user.values()), send_date)
+            except Exception as e:
+                logger.error(f"Preparing forecasts for the {send_at.isoformat()} slot failed: {str(e)}")
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+
+            await sleep_until(send_at)
+            # anything that cannot be claimed was already sent by an earlier run; subscribers
+            # without a job (their forecast cell failed) stay in by_user for the retry
+            claimed = [job for job in jobs if self.ledger.claim(job[0], send_date)]
+            for user_id in {job[0] for job in jobs} - {job[0] for job in claimed}:
+                by_user.pop(user_id, None)
+            sent = 0
+            for result in await self.sender.send(claimed):
+                if result["success"]:
+                    self.ledger.mark_sent(result["user_id"], send_date)
+                    by_user.pop(result["user_id"], None)
+                    sent += 1
+                else:
+                    self.ledger.release(result["user_id"], send_date)
+                    logger.error(result["error"])
+            logger.info(f"{send_at.isoformat()} slot: {sent} sent, {len(by_user)} to retry, forecast cache: {self.forecast_cache.stats()}")
+            if by_user:
+                await asyncio.sleep(RETRY_DELAY)
+
+    # [(send_at, [subscribers])] for the not yet sent slots in [start, end), one slot per instant and time zone:
+    # aware datetimes compare equal across time zones, but a slot's local date (the ledger key, the forecast
+    # day) comes from its send_at, so subscribers in different zones must never share one
+    def due_slots(self, start, end):
+        by_slot = {}
+        for send_at, subscriber in self.registry.due(start, end):
+            if not self.ledger.has_entry(subscriber["user_id"], send_at.date()):
+                by_slot.setdefault((send_at, subscriber["timezone"]), (send_at, []))[1].append(subscriber)
+        return list(by_slot.values())
+
+    async def run_registry(self):
+        slots = set()
+        # after a restart, slots missed by less than the grace period are still sent
+        scan_from = utc_now() - LATE_SEND_GRACE
+        while True:
+            scan_to = utc_now() + self.lead_time + timedelta(seconds=SLOT_SCAN_SECONDS)
+            for send_at, subscribers in self.due_slots(scan_from, scan_to):
+                logger.info(f"{len(subscribers)} forecast(s) due at {send_at.isoformat()}")
+                task = asyncio.create_task(self.run_slot(send_at, subscribers))
+                slots.add(task)
+                task.add_done_callback(slots.discard)
+            scan_from = scan_to
+            await sleep_until(scan_to - self.lead_time)
+
+    async def run(self):
+        await self.sender.start()
+        try:
+            await self.run_registry()
+        finally:
+            await self.sender.close()
+            self.render_executor.shutdown(wait=False)
+            self.ledger.close()
+            if self.work is not None:
+                self.work.close()
@@ -0,0 +1,200 @@
+# subscriber registry: who gets a forecast, where, in which units and at what local time
+# two in-memory indexes sit over the sqlite table: send-time buckets per time zone answer
+# "who is due now" without scanning everyone, and forecast grid cells group subscribers so each
+# distinct cell is fetched and rendered once
+import json
+import sqlite3
+import time
+from datetime import datetime, time as day_time, timedelta
+from zoneinfo import ZoneInfo
+
+from functions.http_client import FORECAST_GRID_DEGREES, snap_to_grid
+
+SUBSCRIBERS_PATH = '.subscribers.sqlite'
+SEND_BUCKET_MINUTES = 5
+# forecasts are always fetched in fahrenheit (so one fetch serves every subscriber in a cell),
+# the message converts for subscribers who asked for celsius. the chart is shared by the whole cell
+# and stays in °F
+UNITS = ("fahrenheit", "celsius")
+DEFAULT_UNITS = "fahrenheit"
+
+FIELDS = ("user_id", "name", "city", "state_code", "country_code", "latitude", "longitude", "units", "timezone", "send_time")
+
+
+def parse_send_time(send_time):
+    hour, minute = (int(part) for part in send_time.split(":"))
+    return day_time(hour, minute)
+
+class SubscriberRegistry:
+    def __init__(self, path=SUBSCRIBERS_PATH, grid_degrees=FORECAST_GRID_DEGREES, bucket_minutes=SEND_BUCKET_MINUTES):
+        self.grid_degrees = grid_degrees
+        self.bucket_minutes = bucket_minutes
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS subscribers ("
+            "user_id TEXT PRIMARY KEY, name TEXT NOT NULL, city TEXT, state_code TEXT, country_code TEXT, "
+            "latitude REAL, longitude REAL, units TEXT NOT NULL, timezone TEXT NOT NULL, send_time TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+        self.subscribers = {}  # user_id -> subscriber dict
+        self.send_buckets = {}  # timezone -> {bucket: set of user_ids}, bucket = local minute of day // bucket_minutes
+        self.cells = {}  # (cell latitude, cell longitude) -> set of user_ids
+        for row in self.connection.execute(f"SELECT {', '.join(FIELDS)} FROM subscribers"):
+            self.index(dict(zip(FIELDS, row)))
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def __iter__(self):
+        return iter(self.subscribers.values())
+
+    def get(self, user_id):
+        return self.subscribers.get(str(user_id))
+
+    def bucket(self, send_time):
+        return (send_time.hour * 60 + send_time.minute) // self.bucket_minutes
+
+    def cell(self, subscriber):
+        if subscriber.get("latitude") is None or subscriber.get("longitude") is None:
+            return None
+        return snap_to_grid(subscriber["latitude"], subscriber["longitude"], self.grid_degrees)
+
+    def index(self, subscriber):
+        self.subscribers[subscriber["user_id"]] = subscriber
+        buckets = self.send_buckets.setdefault(subscriber["timezone"], {})
+        buckets.setdefault(self.bucket(parse_send_time(subscriber["send_time"])), set()).add(subscriber["user_id"])
+        cell = self.cell(subscriber)
+        if cell is not None:
+            self.cells.setdefault(cell, set()).add(subscriber["user_id"])
+
+    def unindex(self, user_id):
+        subscriber = self.subscribers.pop(user_id, None)
+        if subscriber is None:
+            return
+        buckets = self.send_buckets[subscriber["timezone"]]
+        bucket = self.bucket(parse_send_time(subscriber["send_time"]))
+        buckets[bucket].discard(user_id)
+        if not buckets[bucket]:
+            del buckets[bucket]
+        if not buckets:
+            del self.send_buckets[subscriber["timezone"]]
+        cell = self.cell(subscriber)
+        if cell is not None:
+            self.cells[cell].discard(user_id)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    # same dict shape as a recipients json file, plus optional units, country_code, latitude/longitude
+    def normalize(self, subscriber):
+        record = {field: subscriber.get(field) for field in FIELDS}
+        record["user_id"] = str(record["user_id"])
+        record["units"] = record["units"] or DEFAULT_UNITS
+        if record["units"] not in UNITS:
+            raise ValueError(f"Unknown units {record['units']!r} for user {record['user_id']}, expected one of {UNITS}")
+        ZoneInfo(record["timezone"])  # raises for an unknown time zone
+        parse_send_time(record["send_time"])
+        if record["latitude"] is None and not record["city"]:
+            raise ValueError(f"User {record['user_id']} needs a city or latitude/longitude")
+        return record
+
+    def upsert_many(self, subscribers):
+        records = [self.normalize(subscriber) for subscriber in subscribers]
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO subscribers ({', '.join(FIELDS)}, updated_at) VALUES ({', '.join('?' * (len(FIELDS) + 1))})",
+                [tuple(record[field] for field in FIELDS) + (now,) for record in records],
+            )
+        for record in records:
+            self.unindex(record["user_id"])
+            self.index(record)
+        return len(records)
+
+    def upsert(self, subscriber):
+        self.upsert_many([subscriber])
+
+    def remove(self, user_id):
+        with self.connection:
+            self.connection.execute("DELETE FROM subscribers WHERE user_id = ?", (str(user_id),))
+        self.unindex(str(user_id))
+
+    # a recipients json file: a list of {"user_id", "name", "city", "state_code", "timezone", "send_time": "HH:MM"}
+    def import_json(self, path):
+        with open(path, encoding='utf-8') as file:
+            return self.upsert_many(json.load(file))
+
+    # geocode everyone still missing coordinates, then they join a forecast cell
+    def resolve_locations(self, geocode_index, api_key=None):
+        resolved = []
+        for subscriber in self.subscribers.values():
+            if subscriber["latitude"] is not None and subscriber["longitude"] is not None:
+                continue
+            latitude, longitude = geocode_index.lookup(subscriber["city"], subscriber["state_code"], subscriber["country_code"], api_key=api_key)
+            if latitude is None or longitude is None:
+                raise ValueError(f"Error getting latitude and longitude for {subscriber['city']}")
+            resolved.append(dict(subscriber, latitude=latitude, longitude=longitude))
+        return self.upsert_many(resolved)
+
+    # [(send_at, subscriber)] for every send slot in [start, end), both aware datetimes.
+    # only the buckets the window touches are looked at, per time zone
+    def due(self, start, end):
+        slots = {}
+        for timezone, buckets in self.send_buckets.items():
+            tz = ZoneInfo(timezone)
+            local_start = start.astimezone(tz)
+            local_end = end.astimezone(tz)
+            self.scan_buckets(buckets, tz, local_start, local_end, start, end, slots)
+            # spring forward: a send time in the skipped hour (02:30 when 02:00 jumps to 03:00) lands at the
+            # same wall time in the old offset, i.e. shift later than it reads, so its buckets are looked up too
+            shift = local_start.utcoffset() - (start - timedelta(days=1)).astimezone(tz).utcoffset()
+            if shift > timedelta(0):
+                self.scan_buckets(buckets, tz, local_start - shift, local_end - shift, start, end, slots)
+        return sorted(slots.values(), key=lambda slot: slot[0])
+
+    # adds {(user_id, send_at): (send_at, subscriber)} for the buckets between two local wall times
+    def scan_buckets(self, buckets, tz, local_start, local_end, start, end, slots):
+        local_date = local_start.date()
+        while local_date <= local_end.date():
+            first = self.bucket(local_start.time()) if local_date == local_start.date() else 0
+            last = self.bucket(local_end.time()) if local_date == local_end.date() else (24 * 60 - 1) // self.bucket_minutes
+            for bucket in range(first, last + 1):
+                for user_id in buckets.get(bucket, ()):
+                    subscriber = self.subscribers[user_id]
+                    # combine per date, so the slot stays at 7:00 local across DST changes
+                    # (in the repeated hour of a fall back, the first 01:30 is the slot)
+                    send_at = datetime.combine(local_date, parse_send_time(subscriber["send_time"]), tzinfo=tz)
+                    if start <= send_at < end:
+                        slots[(user_id, send_at)] = (send_at, subscriber)
+            local_date += timedelta(days=1)
+
+    # {(latitude, longitude, timezone): [subscribers]}: one forecast fetch and one chart per grid cell and
+    # time zone (the daily values depend on the time zone). the coordinates are the exact point of the
+    # cell's lowest user id, so every worker fetches the same point for a cell
+    def forecast_groups(self, subscribers=None):
+        groups = {}
+        for subscriber in self.subscribers.values() if subscribers is None else subscribers:
+            cell = self.cell(subscriber)
+            if cell is None:
+                raise ValueError(f"User {subscriber['user_id']} has no location yet, call resolve_locations first")
+            groups.setdefault(cell + (subscriber["timezone"],), []).append(subscriber)
+        points = {}
+        for (_, _, timezone), group in groups.items():
+            first = min(group, key=lambda subscriber: subscriber["user_id"])
+            points[(first["latitude"], first["longitude"], timezone)] = group
+        return points
+
+    def in_cell(self, LATITUDE, LONGITUDE):
+        return [self.subscribers[user_id] for user_id in self.cells.get(snap_to_grid(LATITUDE, LONGITUDE, self.grid_degrees), ())]
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "timezones": len(self.send_buckets),
+            "send_buckets": sum(len(buckets) for buckets in self.send_buckets.values()),
+            "cells": len(self.cells),
+        }
+
+    def close(self):
+        self.connection.close()
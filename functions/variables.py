@@ -0,0 +1,72 @@
+# variable registry: every Open-Meteo variable the bot knows, tagged the way the FlatBuffers response
+# tags each series, and which output reads which variables. request params are built from the outputs
+# that are switched on, and responses are decoded by those tags instead of by position
+from openmeteo_sdk.Aggregation import Aggregation
+from openmeteo_sdk.Unit import Unit
+from openmeteo_sdk.Variable import Variable
+
+# name -> (section, variable, unit, altitude, aggregation, stored as int64)
+VARIABLES = {
+    "temperature_2m": ("hourly", Variable.temperature, Unit.fahrenheit, 2, Aggregation.none, False),
+    "precipitation": ("hourly", Variable.precipitation, Unit.millimetre, 0, Aggregation.none, False),
+    "temperature_2m_max": ("daily", Variable.temperature, Unit.fahrenheit, 2, Aggregation.maximum, False),
+    "temperature_2m_min": ("daily", Variable.temperature, Unit.fahrenheit, 2, Aggregation.minimum, False),
+    # sunrise .. precipitation_probability_max are not read by any output yet: they are decoded when a
+    # response carries them, and requested once a consumer below lists them.
+    # unix timestamps, only readable as int64 (ValuesAsNumpy gives nothing useful for them)
+    "sunrise": ("daily", Variable.sunrise, Unit.unix_time, 0, Aggregation.none, True),
+    "sunset": ("daily", Variable.sunset, Unit.unix_time, 0, Aggregation.none, True),
+    "daylight_duration": ("daily", Variable.daylight_duration, Unit.seconds, 0, Aggregation.none, False),
+    "uv_index_max": ("daily", Variable.uv_index, Unit.dimensionless, 0, Aggregation.maximum, False),
+    "precipitation_hours": ("daily", Variable.precipitation_hours, Unit.hours, 0, Aggregation.none, False),
+    "precipitation_probability_max": ("daily", Variable.precipitation_probability, Unit.percentage, 0, Aggregation.maximum, False),
+}
+
+# output -> the variables it reads
+CONSUMERS = {
+    # data_processing.create_weather_messages
+    "message": ("temperature_2m_max", "temperature_2m_min", "uv_index_max"),
+    # data_plot_creation / render_pool charts
+    "temperature_plot": ("temperature_2m", "precipitation"),
+    # forecast_watch.take_snapshot
+    "forecast_watch": ("precipitation", "temperature_2m_max"),
+}
+DEFAULT_CONSUMERS = ("message", "temperature_plot")
+
+# (section, variable, altitude, aggregation) -> name
+_NAMES = {(section, variable, altitude, aggregation): name for name, (section, variable, _, altitude, aggregation, _) in VARIABLES.items()}
+
+
+# the variables a set of consumers reads, in registry order
+def variables_for(consumers=DEFAULT_CONSUMERS, section=None):
+    wanted = {name for consumer in consumers for name in CONSUMERS[consumer]}
+    return [name for name, fields in VARIABLES.items() if name in wanted and section in (None, fields[0])]
+
+# the "hourly" / "daily" request params, a section nobody reads is left out of the request
+def request_variables(consumers=DEFAULT_CONSUMERS):
+    params = {}
+    for section in ("hourly", "daily"):
+        names = variables_for(consumers, section)
+        if names:
+            params[section] = names
+    return params
+
+# {name: numpy array} for the registered variables in a response section (all of them, or just names),
+# matched by tags so the order they were requested in does not matter
+def decode_section(section, kind, names=None):
+    values = {}
+    if section is None:
+        if names:
+            raise ValueError(f"Response has no {kind} section, needed for {', '.join(names)}")
+        return values
+    wanted = None if names is None else set(names)
+    for index in range(section.VariablesLength()):
+        variable = section.Variables(index)
+        name = _NAMES.get((kind, variable.Variable(), variable.Altitude(), variable.Aggregation()))
+        if name is None or (wanted is not None and name not in wanted):
+            continue
+        values[name] = variable.ValuesInt64AsNumpy() if VARIABLES[name][5] else variable.ValuesAsNumpy()
+    missing = wanted - set(values) if wanted else ()
+    if missing:
+        raise ValueError(f"Response has no {', '.join(sorted(missing))}")
+    return values
@@ -0,0 +1,160 @@
+# sharded runs: several workers share one sqlite lease table and split the forecast cells between them.
+# a consistent hash ring picks each cell's owner, so a cell's forecast and chart caches stay hot on one
+# worker; the owner claims the cell's batch with a lease it keeps renewing while it works. if a worker
+# dies its leases run out, and the other workers take its batches over after a takeover delay
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+WORK_LEASES_PATH = '.work_leases.sqlite'
+LEASE_SECONDS = int(os.getenv("WORK_LEASE_SECONDS", 120))
+# points per worker on the ring, enough for an even split of a few hundred cells
+RING_REPLICAS = 64
+# finished batches are kept this long (a retried slot must still see them as done), then deleted
+LEASE_RETENTION = 2 * 24 * 3600
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+# adding or removing a worker only moves the keys that worker owns (or now owns), every other key stays put
+class HashRing:
+    def __init__(self, workers, replicas=RING_REPLICAS):
+        points = sorted((ring_hash(f"{worker}#{replica}"), str(worker)) for worker in workers for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.workers = [worker for _, worker in points]
+
+    def owner(self, key):
+        index = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.workers[index]
+
+# worker id, host, pid and a random token: two processes started with the same worker id (a misconfigured
+# WORKER_ID, or a restart while the old process still runs) never hold or renew each other's leases
+def lease_owner(worker_id):
+    return f"{worker_id}@{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+# one row per batch: leased by a worker until expires_at, or done
+class LeaseStore:
+    def __init__(self, path=WORK_LEASES_PATH, worker_id="0", lease_seconds=LEASE_SECONDS, clock=time.time):
+        self.worker_id = str(worker_id)
+        self.owner = lease_owner(self.worker_id)
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        # other workers write to the same file, wait for their locks instead of failing
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "batch TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, expires_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    # True when this store now holds the batch: it was unclaimed, already held by this store, or its
+    # lease ran out (a restarted worker waits out its old leases too). a done batch is never claimed again
+    def claim(self, batch):
+        now = self.clock()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO leases VALUES (?, ?, 'leased', ?, ?) "
+                "ON CONFLICT (batch) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at, updated_at = excluded.updated_at "
+                "WHERE leases.status = 'leased' AND (leases.owner = excluded.owner OR leases.expires_at < ?)",
+                (batch, self.owner, now + self.lease_seconds, now, now),
+            )
+        return cursor.rowcount == 1
+
+    def claim_many(self, batches):
+        return [batch for batch in batches if self.claim(batch)]
+
+    # extend our leases, returns the batches we still hold (a lease that ran out may have been taken over)
+    def renew(self, batches):
+        now = self.clock()
+        held = []
+        with self.connection:
+            for batch in batches:
+                cursor = self.connection.execute(
+                    "UPDATE leases SET expires_at = ?, updated_at = ? WHERE batch = ? AND owner = ? AND status = 'leased'",
+                    (now + self.lease_seconds, now, batch, self.owner),
+                )
+                if cursor.rowcount:
+                    held.append(batch)
+        return held
+
+    def complete(self, batches):
+        now = self.clock()
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE leases SET status = 'done', updated_at = ? WHERE batch = ? AND owner = ?", [(now, batch, self.owner) for batch in batches]
+            )
+            self.connection.execute("DELETE FROM leases WHERE status = 'done' AND updated_at < ?", (now - LEASE_RETENTION,))
+
+    # give the batches back right away (e.g. on shutdown), instead of making the others wait out the lease
+    def release(self, batches):
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE leases SET expires_at = 0 WHERE batch = ? AND owner = ? AND status = 'leased'", [(batch, self.owner) for batch in batches]
+            )
+
+    # batches whose lease ran out before they were done, i.e. their worker died
+    def expired(self):
+        return [row[0] for row in self.connection.execute(
+            "SELECT batch FROM leases WHERE status = 'leased' AND expires_at < ?", (self.clock(),)
+        )]
+
+    def stats(self):
+        counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM leases GROUP BY status").fetchall())
+        return {"leased": counts.get("leased", 0), "done": counts.get("done", 0), "expired": len(self.expired())}
+
+    def close(self):
+        self.connection.close()
+
+# the worker's view of a sharded run: which cells it owns and the leases on the batches it works on
+class ShardedWork:
+    def __init__(self, worker_id, workers, store=None, takeover_delay=None):
+        if not 0 <= int(worker_id) < workers:
+            raise ValueError(f"worker id must be between 0 and {workers - 1}")
+        self.worker_id = str(worker_id)
+        self.workers = workers
+        self.ring = HashRing(range(workers))
+        self.store = store or LeaseStore(worker_id=self.worker_id)
+        # a batch of another worker is only taken over this long after its slot (its lease is gone by then)
+        self.takeover_delay = self.store.lease_seconds if takeover_delay is None else takeover_delay
+
+    def owns(self, key):
+        return self.ring.owner(key) == self.worker_id
+
+    # the batches to work on now: our own shard's, or with takeover=True any left unclaimed or abandoned
+    def claim(self, batches, takeover=False):
+        return self.store.claim_many([batch for batch, key in batches if takeover or self.owns(key)])
+
+    # holds the leases while the body runs: renewed in the background, marked done when it returns,
+    # released (to be retried by anyone) when it raises
+    @contextlib.asynccontextmanager
+    async def holding(self, batches):
+        async def renew():
+            while True:
+                await asyncio.sleep(self.store.lease_seconds / 3)
+                lost = set(batches) - set(self.store.renew(batches))
+                if lost:
+                    logger.warning(f"Lost the lease on {sorted(lost)}, another worker may take them over")
+
+        renewer = asyncio.create_task(renew())
+        try:
+            yield
+        except BaseException:
+            self.store.release(batches)
+            raise
+        else:
+            self.store.complete(batches)
+        finally:
+            renewer.cancel()
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,125 @@
+# records the geocode and Open-Meteo fixtures used by benchmark_pipeline.py
+#   python record_fixtures.py --live      record real api answers for CITY/STATE_CODE (needs API_KEY)
+#   python record_fixtures.py             write a deterministic synthetic forecast in the same FlatBuffers format
+import os
+import json
+import argparse
+
+import flatbuffers
+import numpy as np
+from dotenv import load_dotenv
+
+from fake_discord import FIXTURES_DIR, GEOCODE_FIXTURE, FORECAST_FIXTURE
+from functions.open_mateo_api import OPEN_MATEO_URL, HOURLY_VARIABLES, DAILY_VARIABLES, forecast_params
+from functions.open_weather_api import build_geocode_url
+from functions.variables import CONSUMERS, VARIABLES
+
+CITY = "Milpitas"
+STATE_CODE = "06"
+LATITUDE, LONGITUDE = 37.4323, -121.8996
+UTC_OFFSET_SECONDS = -25200
+TIMEZONE = "America/Los_Angeles"
+DAY_START = 1792220400  # 2026-10-17 00:00 in America/Los_Angeles (PDT)
+
+# name -> (variable, unit, altitude, aggregation, stored as int64), from the registry in functions/variables.py
+VARIABLE_FIELDS = {name: fields[1:] for name, fields in VARIABLES.items()}
+
+
+# flatbuffers field slots follow the openmeteo_sdk schema (VariableWithValues, VariablesWithTime, WeatherApiResponse)
+def build_variable(builder, name, values):
+    variable, unit, altitude, aggregation, is_int64 = VARIABLE_FIELDS[name]
+    vector = builder.CreateNumpyVector(np.asarray(values, dtype=np.int64 if is_int64 else np.float32))
+    builder.StartObject(13)
+    builder.PrependUint8Slot(0, variable, 0)
+    builder.PrependUint8Slot(1, unit, 0)
+    builder.PrependUOffsetTRelativeSlot(4 if is_int64 else 3, vector, 0)
+    builder.PrependInt16Slot(5, altitude, 0)
+    builder.PrependUint8Slot(6, aggregation, 0)
+    return builder.EndObject()
+
+def build_section(builder, start, interval, variables):
+    offsets = [build_variable(builder, name, values) for name, values in variables.items()]
+    builder.StartVector(4, len(offsets), 4)
+    for offset in reversed(offsets):
+        builder.PrependUOffsetTRelative(offset)
+    vector = builder.EndVector()
+    length = len(next(iter(variables.values())))
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + interval * length, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+    return builder.EndObject()
+
+# one length-prefixed WeatherApiResponse, the framing the api (and openmeteo_requests) uses
+def encode_weather_response(latitude, longitude, utc_offset_seconds, timezone, daily, hourly, day_start=DAY_START):
+    builder = flatbuffers.Builder(4096)
+    timezone_offset = builder.CreateString(timezone)
+    # a section without variables is left out, the way the api answers when it was not requested
+    daily_offset = build_section(builder, day_start, 86400, daily) if daily else None
+    hourly_offset = build_section(builder, day_start, 3600, hourly) if hourly else None
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(0, latitude, 0)
+    builder.PrependFloat32Slot(1, longitude, 0)
+    builder.PrependInt32Slot(6, utc_offset_seconds, 0)
+    builder.PrependUOffsetTRelativeSlot(7, timezone_offset, 0)
+    if daily_offset is not None:
+        builder.PrependUOffsetTRelativeSlot(10, daily_offset, 0)
+    if hourly_offset is not None:
+        builder.PrependUOffsetTRelativeSlot(11, hourly_offset, 0)
+    builder.Finish(builder.EndObject())
+    message = bytes(builder.Output())
+    return len(message).to_bytes(4, byteorder="little") + message
+
+# a plausible autumn day in Milpitas, the same every run so benchmark numbers are comparable
+def synthetic_forecast(days=1, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = 24 * days
+    temperature = 52 + 18 * np.clip(np.sin((np.arange(hours) % 24 - 7) / 14 * np.pi), 0, None) + rng.normal(0, 0.8, hours)
+    precipitation = np.where(rng.random(hours) < 0.2, rng.choice([0.4, 1.8, 4.2, 12.0], hours), 0.0)
+    daily_temperature = temperature.reshape(days, 24)
+    day_starts = DAY_START + 86400 * np.arange(days)
+    daily = {
+        "temperature_2m_max": daily_temperature.max(axis=1),
+        "temperature_2m_min": daily_temperature.min(axis=1),
+        "sunrise": day_starts + 7 * 3600 + 1200,
+        "sunset": day_starts + 18 * 3600 + 1500,
+        "daylight_duration": np.full(days, 40500.0),
+        "uv_index_max": rng.uniform(2, 7, days),
+        "precipitation_hours": (precipitation.reshape(days, 24) > 0).sum(axis=1).astype(float),
+        "precipitation_probability_max": rng.uniform(0, 60, days).round(),
+    }
+    hourly = {"temperature_2m": temperature, "precipitation": precipitation}
+    return {name: daily[name] for name in DAILY_VARIABLES}, {name: hourly[name] for name in HOURLY_VARIABLES}
+
+def write_synthetic():
+    daily, hourly = synthetic_forecast()
+    with open(FORECAST_FIXTURE, "wb") as file:
+        file.write(encode_weather_response(LATITUDE, LONGITUDE, UTC_OFFSET_SECONDS, TIMEZONE, daily, hourly))
+    with open(GEOCODE_FIXTURE, "w", encoding="utf-8") as file:
+        json.dump([{"name": CITY, "lat": LATITUDE, "lon": LONGITUDE, "country": "US", "state": "California"}], file, indent=2)
+
+def record_live():
+    import requests
+
+    load_dotenv()
+    geocode = requests.get(build_geocode_url(CITY, STATE_CODE, api_key=os.getenv("API_KEY")), timeout=10)
+    geocode.raise_for_status()
+    latitude, longitude = geocode.json()[0]["lat"], geocode.json()[0]["lon"]
+    forecast = requests.get(OPEN_MATEO_URL, params=dict(forecast_params(latitude, longitude, consumers=CONSUMERS), format="flatbuffers"), timeout=10)
+    forecast.raise_for_status()
+    with open(GEOCODE_FIXTURE, "w", encoding="utf-8") as file:
+        file.write(geocode.text)
+    with open(FORECAST_FIXTURE, "wb") as file:
+        file.write(forecast.content)
+
+def main():
+    parser = argparse.ArgumentParser(description="Record benchmark fixtures")
+    parser.add_argument("--live", action="store_true", help="record from the real OpenWeatherMap and Open-Meteo apis")
+    args = parser.parse_args()
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    record_live() if args.live else write_synthetic()
+    print(f"Wrote {GEOCODE_FIXTURE} and {FORECAST_FIXTURE}")
+
+if __name__ == "__main__":
+    main()
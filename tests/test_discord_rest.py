@@ -0,0 +1,65 @@
+import asyncio
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from functions.discord_rest import DiscordRestSender
+
+
+# scripted stand-in for DiscordRestSender.request: channels in gone answer 404, in forbidden 403, every DM opens new_channel
+def script_requests(sender, new_channel, gone=(), forbidden=()):
+    calls = []
+
+    async def request(method, path, route, body):
+        calls.append(path)
+        if path == "/users/@me/channels":
+            return {"id": new_channel}
+        channel_id = path.split("/")[2]
+        if channel_id in gone:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), {"code": 10003, "message": "Unknown Channel"})
+        if channel_id in forbidden:
+            raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), {"code": 50007, "message": "Cannot send messages to this user"})
+        return {"id": "message"}
+
+    sender.request = request
+    return calls
+
+def make_sender(tmp_path, channels):
+    sender = DiscordRestSender(bot_token="token", channels_path=str(tmp_path / "dm_channels.sqlite"))
+    with sender.connection:
+        sender.connection.executemany("INSERT INTO dm_channels VALUES (?, ?, 0)", channels.items())
+    sender.channels.update(channels)
+    return sender
+
+def test_stale_cached_channel_is_evicted_and_reopened(tmp_path):
+    sender = make_sender(tmp_path, {"1": "old"})
+    calls = script_requests(sender, "new", gone={"old"})
+
+    asyncio.run(sender.deliver("1", "message", None))
+    assert calls == ["/channels/old/messages", "/users/@me/channels", "/channels/new/messages"]
+    assert sender.channels["1"] == "new"
+    assert list(sender.connection.execute("SELECT user_id, channel_id FROM dm_channels")) == [("1", "new")]
+
+def test_freshly_opened_channel_is_not_reopened(tmp_path):
+    sender = make_sender(tmp_path, {})
+    calls = script_requests(sender, "new", forbidden={"new"})
+
+    with pytest.raises(discord.Forbidden):
+        asyncio.run(sender.deliver("1", "message", None))
+    assert calls == ["/users/@me/channels", "/channels/new/messages"]
+
+def test_reopened_channel_is_tried_only_once(tmp_path):
+    sender = make_sender(tmp_path, {"1": "old"})
+    calls = script_requests(sender, "new", gone={"old"}, forbidden={"new"})
+
+    result = asyncio.run(sender.send_job(("1", "message", None)))
+    assert not result["success"]
+    assert calls == ["/channels/old/messages", "/users/@me/channels", "/channels/new/messages"]
+
+def test_rest_delivery_does_not_import_discord():
+    # a fresh interpreter: this test module has imported discord already
+    code = "import sys, functions.discord_rest; sys.exit('discord' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
@@ -0,0 +1,72 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fake_discord import FORECAST_FIXTURE
+from functions.async_fetch import decode_weather_responses
+from functions.forecast import daily_forecast, hourly_forecast
+from functions.open_mateo_api import generate_daily_df, generate_hourly_df
+from record_fixtures import LATITUDE, LONGITUDE, TIMEZONE, UTC_OFFSET_SECONDS, encode_weather_response, synthetic_forecast
+
+
+def recorded_response():
+    with open(FORECAST_FIXTURE, "rb") as file:
+        return decode_weather_responses(file.read())[0]
+
+def synthetic_response(days):
+    daily, hourly = synthetic_forecast(days)
+    return decode_weather_responses(encode_weather_response(LATITUDE, LONGITUDE, UTC_OFFSET_SECONDS, TIMEZONE, daily, hourly))[0]
+
+# the DataFrame path the bot used before functions/forecast.py: local dates, an hour column, 6am and later
+def baseline_hourly_df(response):
+    hourly_weather_df = generate_hourly_df(response)
+    hourly_weather_df['date'] = pd.to_datetime(hourly_weather_df['date']).dt.tz_convert(TIMEZONE)
+    hourly_weather_df['hour'] = hourly_weather_df['date'].dt.hour
+    return hourly_weather_df
+
+def test_chart_frame_matches_the_dataframe_path():
+    response = recorded_response()
+    expected = baseline_hourly_df(response)
+    expected = expected[expected['hour'] >= 6].reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(hourly_forecast(response).day(0).from_hour(6).to_pandas(), expected)
+
+def test_daily_values_match_the_dataframe_path():
+    response = recorded_response()
+    daily_weather_df = generate_daily_df(response)
+    daily = daily_forecast(response).day(0)
+
+    assert len(daily) == 1
+    for name in ("temperature_2m_max", "temperature_2m_min", "uv_index_max"):
+        assert daily[name][0] == daily_weather_df.loc[0, name]
+
+def test_local_hours_and_dates():
+    response = recorded_response()
+    hourly = hourly_forecast(response)
+
+    assert np.array_equal(hourly.local_hours, baseline_hourly_df(response)['hour'].to_numpy())
+    assert hourly.dates == sorted(set(baseline_hourly_df(response)['date'].dt.date))
+
+@pytest.mark.parametrize("day", [0, 1, 2])
+def test_each_day_of_a_multi_day_forecast(day):
+    response = synthetic_response(3)
+    expected = baseline_hourly_df(response)
+    local_date = hourly_forecast(response).dates[day]
+    expected = expected[expected['date'].dt.date == local_date].reset_index(drop=True)
+
+    hourly = hourly_forecast(response).day(day)
+    assert hourly.dates == [local_date]
+    pd.testing.assert_frame_equal(hourly.to_pandas(), expected)
+    assert hourly_forecast(response).for_date(local_date).time == hourly.time
+    assert daily_forecast(response).day(day)["temperature_2m_max"][0] == generate_daily_df(response).loc[day, "temperature_2m_max"]
+
+def test_window_is_a_view_of_the_response():
+    hourly = hourly_forecast(recorded_response())
+    window = hourly.window(6, 12)
+
+    assert len(window) == 6
+    assert window.time == hourly.time + 6 * hourly.interval
+    assert np.shares_memory(window["temperature_2m"], hourly["temperature_2m"])
+    assert len(hourly.for_date(date(2000, 1, 1))) == 0
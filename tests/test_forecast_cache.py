@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from functions.forecast_cache import ForecastCache, StaleWhileRevalidateCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# a stand-in fetcher: counts calls, answers "value N" for the Nth, after an optional wait on a gate
+class StubFetcher:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.gate = None
+
+    async def __call__(self, *args):
+        self.calls.append(args)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise ConnectionError("api down")
+        return f"value {len(self.calls)}"
+
+def make_cache(fetch, clock):
+    return StaleWhileRevalidateCache(fetch, soft_ttl=10, hard_ttl=100, clock=clock)
+
+def test_fresh_entry_is_served_without_a_fetch():
+    clock, fetch = Clock(), StubFetcher()
+    cache = make_cache(fetch, clock)
+
+    async def run():
+        first = await cache.get("key")
+        clock.now = 9
+        return first, await cache.get("key")
+
+    assert asyncio.run(run()) == ("value 1", "value 1")
+    assert len(fetch.calls) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_stale_entry_is_served_while_one_background_refresh_runs():
+    clock, fetch = Clock(), StubFetcher()
+    cache = make_cache(fetch, clock)
+
+    async def run():
+        await cache.get("key")
+        clock.now = 50
+        fetch.gate = asyncio.Event()
+        # concurrent stale reads share the one refresh
+        stale = await asyncio.gather(*(cache.get("key") for _ in range(5)))
+        assert len(cache.inflight) == 1
+        fetch.gate.set()
+        await asyncio.gather(*cache.inflight.values())
+        return stale, await cache.get("key")
+
+    stale, refreshed = asyncio.run(run())
+    assert stale == ["value 1"] * 5
+    assert refreshed == "value 2"
+    assert len(fetch.calls) == 2
+    assert cache.stats()["stale_hits"] == 5 and cache.stats()["refreshes"] == 2
+
+def test_expired_entry_blocks_on_the_fetch():
+    clock, fetch = Clock(), StubFetcher()
+    cache = make_cache(fetch, clock)
+
+    async def run():
+        await cache.get("key")
+        clock.now = 100
+        return await cache.get("key")
+
+    assert asyncio.run(run()) == "value 2"
+    assert cache.stats()["misses"] == 2 and cache.stats()["stale_hits"] == 0
+
+def test_concurrent_misses_share_one_fetch():
+    clock, fetch = Clock(), StubFetcher()
+    cache = make_cache(fetch, clock)
+
+    async def run():
+        return await asyncio.gather(*(cache.get("key") for _ in range(5)))
+
+    assert asyncio.run(run()) == ["value 1"] * 5
+    assert len(fetch.calls) == 1
+
+def test_failed_refresh_keeps_serving_the_stale_entry():
+    clock, fetch = Clock(), StubFetcher()
+    cache = make_cache(fetch, clock)
+
+    async def run():
+        await cache.get("key")
+        clock.now = 50
+        fetch.fail = True
+        served = []
+        for _ in range(2):
+            served.append(await cache.get("key"))
+            await asyncio.gather(*cache.inflight.values(), return_exceptions=True)
+        return served
+
+    assert asyncio.run(run()) == ["value 1", "value 1"]
+    assert cache.stats()["failures"] == 2
+
+def test_failed_fetch_without_an_entry_raises():
+    cache = make_cache(StubFetcher(fail=True), Clock())
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.get("key"))
+    assert cache.stats()["failures"] == 1 and cache.stats()["entries"] == 0
+
+def test_oldest_entries_are_dropped_past_max_keys():
+    cache = StaleWhileRevalidateCache(StubFetcher(), soft_ttl=10, hard_ttl=100, max_keys=2, clock=Clock())
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await cache.get(key)
+
+    asyncio.run(run())
+    assert list(cache.entries) == [("b",), ("c",)]
+
+def test_forecast_cache_shares_a_grid_cell_but_fetches_the_exact_point():
+    fetch = StubFetcher()
+    cache = ForecastCache(fetch, clock=Clock())
+
+    async def run():
+        return await cache.get_weather_data(34.0522, -118.2437, "America/Los_Angeles"), await cache.get_weather_data(34.0501, -118.2419, "America/Los_Angeles")
+
+    assert asyncio.run(run()) == ("value 1", "value 1")
+    assert fetch.calls == [(34.0522, -118.2437, "America/Los_Angeles")]
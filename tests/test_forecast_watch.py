@@ -0,0 +1,137 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+
+from functions.async_fetch import decode_weather_responses
+from functions.forecast_watch import ForecastWatcher, SnapshotStore, forecast_changes
+from record_fixtures import DAY_START, TIMEZONE, UTC_OFFSET_SECONDS, encode_weather_response
+
+KEY = (37.4323, -121.8996, TIMEZONE)
+CELL = "37.4323,-121.8996,America/Los_Angeles"
+NOW = DAY_START + 12 * 3600
+
+
+def snapshot(precipitation, high=70.0, start=DAY_START):
+    return {"date": "2026-10-17", "time": start, "interval": 3600, "utc_offset_seconds": UTC_OFFSET_SECONDS,
+            "precipitation": np.asarray(precipitation, dtype=np.float32), "high": high}
+
+def dry():
+    return np.zeros(24, dtype=np.float32)
+
+def wet_at(hour, millimetres=3.0):
+    precipitation = dry()
+    precipitation[hour] = millimetres
+    return precipitation
+
+def test_unchanged_forecast_has_no_changes():
+    assert forecast_changes(snapshot(wet_at(15)), snapshot(wet_at(15)), NOW) == []
+
+def test_high_change_threshold():
+    assert forecast_changes(snapshot(dry(), 70.0), snapshot(dry(), 74.9), NOW) == []
+    assert forecast_changes(snapshot(dry(), 70.0), snapshot(dry(), 75.0), NOW) == [{"type": "high_temperature", "previous": 70.0, "current": 75.0}]
+
+def test_only_upcoming_wetter_hours_are_reported():
+    changes = forecast_changes(snapshot(dry()), snapshot(wet_at(9) + wet_at(15) + wet_at(18, 0.5)), NOW)
+
+    assert [change["type"] for change in changes] == ["precipitation"]
+    # 09:00 has passed, 15:00 went to medium and 18:00 to light
+    assert list(changes[0]["times"]) == [DAY_START + 15 * 3600, DAY_START + 18 * 3600]
+    assert list(changes[0]["levels"]) == [2, 1]
+    # drier is never news
+    assert forecast_changes(snapshot(wet_at(15)), snapshot(dry()), NOW) == []
+
+def test_snapshots_are_lined_up_by_time():
+    # the later poll starts two hours in, its hour 13 is the earlier poll's hour 15
+    assert forecast_changes(snapshot(wet_at(15)), snapshot(wet_at(13), start=DAY_START + 2 * 3600), NOW) == []
+    changes = forecast_changes(snapshot(dry()), snapshot(wet_at(13), start=DAY_START + 2 * 3600), NOW)
+    assert list(changes[0]["times"]) == [DAY_START + 15 * 3600]
+
+def test_missing_data_is_not_reported():
+    missing = dry()
+    missing[15:] = np.nan
+    assert forecast_changes(snapshot(dry()), snapshot(missing), NOW) == []
+    assert forecast_changes(snapshot(dry(), 70.0), snapshot(dry(), np.nan), NOW) == []
+    # an hour that had no data before is compared as dry
+    changes = forecast_changes(snapshot(missing), snapshot(wet_at(15)), NOW)
+    assert list(changes[0]["times"]) == [DAY_START + 15 * 3600]
+
+def test_snapshot_store_round_trip(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite"))
+    store.put(CELL, snapshot(wet_at(15)), "etag-1", "digest-1")
+    store.set_validators(CELL, "etag-2", "digest-2")
+
+    stored = store.get(CELL)
+    assert stored["etag"] == "etag-2" and stored["digest"] == "digest-2"
+    assert np.array_equal(stored["precipitation"], wet_at(15))
+    assert store.get("elsewhere") is None
+
+
+def response(precipitation, high=70.0):
+    daily = {"temperature_2m_max": [high], "temperature_2m_min": [50.0], "uv_index_max": [4.0]}
+    hourly = {"temperature_2m": np.linspace(50, 70, 24), "precipitation": precipitation}
+    return decode_weather_responses(encode_weather_response(KEY[0], KEY[1], UTC_OFFSET_SECONDS, TIMEZONE, daily, hourly))
+
+# stand-in for AsyncWeatherFetcher.fetch_weather_if_changed: answers the scripted polls in order
+class ScriptedFetcher:
+    def __init__(self, *polls):
+        self.polls = list(polls)
+        self.validators = []
+
+    async def fetch_weather_if_changed(self, params, etag=None, digest=None):
+        self.validators.append((etag, digest))
+        return self.polls.pop(0)
+
+class StubSender:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, jobs):
+        self.sent.extend(jobs)
+        return [{"user_id": job[0], "success": True, "error": None} for job in jobs]
+
+class StubPlotCache:
+    def get_or_render(self, hourly_weather_df, **options):
+        return BytesIO(b"png")
+
+def make_watcher(tmp_path, *polls):
+    subscribers = [{"user_id": "1", "name": "Milpitas"}, {"user_id": "2", "name": "San Jose", "units": "celsius"}]
+    return ForecastWatcher({KEY: subscribers}, ScriptedFetcher(*polls), StubSender(), SnapshotStore(str(tmp_path / "snapshots.sqlite")),
+                           StubPlotCache(), clock=lambda: NOW)
+
+def poll(watcher):
+    return asyncio.run(watcher.poll_group(KEY, watcher.groups[KEY]))
+
+def test_first_poll_is_the_baseline(tmp_path):
+    watcher = make_watcher(tmp_path, (response(dry()), "etag-1", "digest-1"))
+
+    assert poll(watcher) == 0
+    assert watcher.sender.sent == []
+    assert watcher.store.get(CELL)["etag"] == "etag-1"
+
+def test_not_modified_poll_skips_decoding(tmp_path):
+    watcher = make_watcher(tmp_path, (response(dry()), "etag-1", "digest-1"), (None, "etag-1", "digest-1"))
+    poll(watcher)
+
+    assert poll(watcher) == 0
+    # the second poll sent the stored validators along
+    assert watcher.fetcher.validators == [(None, None), ("etag-1", "digest-1")]
+    assert watcher.stats()["unchanged"] == 1
+
+def test_change_under_threshold_keeps_the_baseline(tmp_path):
+    watcher = make_watcher(tmp_path, (response(dry(), 70.0), "etag-1", "digest-1"), (response(dry(), 72.0), "etag-2", "digest-2"))
+    poll(watcher)
+
+    assert poll(watcher) == 0
+    stored = watcher.store.get(CELL)
+    assert (stored["high"], stored["etag"], stored["digest"]) == (70.0, "etag-2", "digest-2")
+
+def test_change_over_threshold_updates_every_subscriber(tmp_path):
+    watcher = make_watcher(tmp_path, (response(dry(), 70.0), "etag-1", "digest-1"), (response(wet_at(15), 76.0), "etag-2", "digest-2"))
+    poll(watcher)
+
+    assert poll(watcher) == 2
+    assert [job[0] for job in watcher.sender.sent] == ["1", "2"]
+    assert all(job[2] == b"png" for job in watcher.sender.sent)
+    # what was sent is the new baseline
+    assert watcher.store.get(CELL)["high"] == 76.0
@@ -0,0 +1,24 @@
+import requests
+
+from functions.http_client import forecast_cache_key, snap_to_grid
+from functions.open_mateo_api import OPEN_MATEO_URL
+
+
+def prepared(LATITUDE, LONGITUDE):
+    return requests.Request("GET", OPEN_MATEO_URL, params={"latitude": LATITUDE, "longitude": LONGITUDE, "hourly": "temperature_2m"}).prepare()
+
+def test_snap_to_grid():
+    assert snap_to_grid(34.0522, -118.2437) == (34.05, -118.24)
+    assert snap_to_grid(34.0522, -118.2437, grid_degrees=0) == (34.0522, -118.2437)
+
+def test_nearby_points_share_a_cache_key_but_keep_their_own_url():
+    request = prepared(34.0522, -118.2437)
+
+    assert forecast_cache_key(request) == forecast_cache_key(prepared(34.0501, -118.2419))
+    assert forecast_cache_key(request) != forecast_cache_key(prepared(34.0622, -118.2437))
+    # the key is built from a copy, the request still asks for the exact point
+    assert "latitude=34.0522" in request.url
+
+def test_cache_key_covers_the_other_params():
+    other = requests.Request("GET", OPEN_MATEO_URL, params={"latitude": 34.0522, "longitude": -118.2437, "hourly": "precipitation"}).prepare()
+    assert forecast_cache_key(prepared(34.0522, -118.2437)) != forecast_cache_key(other)
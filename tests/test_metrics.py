@@ -0,0 +1,17 @@
+from functions.metrics import RunMetrics
+
+
+def cache_events(run):
+    return {dict(labels)["cache"] + ":" + dict(labels)["event"]: value for (name, labels), value in run.counter_items() if name == "cache_events"}
+
+def test_cache_stats_share_one_event_vocabulary():
+    run = RunMetrics(run_id="test")
+    run.record_cache("forecast", {"hits": 3, "stale_hits": 2, "misses": 1, "refreshes": 3, "failures": 1, "entries": 5, "inflight": 0})
+    run.record_cache("plot", {"hits": 1, "disk_hits": 1, "misses": 2, "entries": 2, "bytes": 100, "spilled": 1, "spill_bytes": 50})
+    run.count("cache_events", cache="http", event="hit")
+
+    assert cache_events(run) == {
+        "forecast:hit": 3, "forecast:stale_hit": 2, "forecast:miss": 1, "forecast:refresh": 3, "forecast:failure": 1,
+        "plot:hit": 1, "plot:disk_hit": 1, "plot:miss": 2, "http:hit": 1,
+    }
+    assert 'weather_bot_cache_events_total{cache="plot",event="disk_hit"} 1' in run.prometheus_text()
@@ -0,0 +1,52 @@
+from urllib.parse import urlencode
+
+import pytest
+
+import functions.open_mateo_api as open_mateo_api
+from functions.open_mateo_api import OPEN_MATEO_URL, chunk_coordinates, get_weather_data_batch
+
+
+class StubClient:
+    def __init__(self):
+        self.requests = []
+
+    # one "response" per requested point, naming the point it answers
+    def weather_api(self, url, params):
+        self.requests.append(params)
+        return [f"{LATITUDE},{LONGITUDE},{params['timezone']}" for LATITUDE, LONGITUDE in zip(params["latitude"], params["longitude"])]
+
+@pytest.fixture
+def client(monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(open_mateo_api, "get_openmeteo_client", lambda: client)
+    monkeypatch.setattr(open_mateo_api, "trim_forecast_cache", lambda: None)
+    return client
+
+def url_length(chunk, timezone="America/Los_Angeles"):
+    params = dict(open_mateo_api.forecast_params([lat for lat, _ in chunk], [lon for _, lon in chunk], timezone), format="flatbuffers")
+    return len(OPEN_MATEO_URL) + 1 + len(urlencode(params, doseq=True))
+
+def test_chunks_stay_under_the_url_limit_and_keep_order():
+    coordinates = [(30 + index / 100, -120 - index / 100) for index in range(300)]
+    chunks = chunk_coordinates(coordinates, max_url_length=1500)
+
+    assert len(chunks) > 1
+    assert [point for chunk in chunks for point in chunk] == coordinates
+    assert all(url_length(chunk) <= 1500 for chunk in chunks)
+
+def test_a_single_point_over_the_limit_still_gets_a_chunk():
+    assert chunk_coordinates([(34.05, -118.24)], max_url_length=10) == [[(34.05, -118.24)]]
+
+def test_batch_maps_responses_back_to_their_inputs(client):
+    coordinates = [(34.0522, -118.2437), (51.5, -0.12), (34.0501, -118.2419), (34.0522, -118.2437)]
+    responses = get_weather_data_batch(coordinates, "UTC", max_url_length=700)
+
+    # the two Los Angeles points share a grid cell, fetched once at the first one's exact point
+    assert responses == ["34.0522,-118.2437,UTC", "51.5,-0.12,UTC", "34.0522,-118.2437,UTC", "34.0522,-118.2437,UTC"]
+    assert sorted(point for params in client.requests for point in params["latitude"]) == [34.0522, 51.5]
+    assert all(params["timezone"] == "UTC" for params in client.requests)
+
+def test_batch_rejects_a_short_answer(client, monkeypatch):
+    monkeypatch.setattr(client, "weather_api", lambda url, params: ["only one"])
+    with pytest.raises(ValueError):
+        get_weather_data_batch([(34.05, -118.24), (51.5, -0.12)])
@@ -0,0 +1,134 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import functions.outbox as outbox_module
+from functions.outbox import DeliveryOutbox, dedupe_key, retry_delay
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+# a stand-in for a sender's deliver(): raises the scripted errors in order, then succeeds
+class ScriptedSender:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def __call__(self, user_id, message, plot):
+        self.calls.append((user_id, message, plot))
+        if self.errors:
+            raise self.errors.pop(0)
+
+def http_error(cls, status, headers=None):
+    return cls(SimpleNamespace(status=status, reason="", headers=headers or {}), {"message": "error"})
+
+def make_outbox(tmp_path, **options):
+    return DeliveryOutbox(str(tmp_path / "outbox.sqlite"), **options)
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(outbox_module.random, "uniform", lambda low, high: high)
+
+def test_retry_delay():
+    assert retry_delay(discord.RateLimited(42.0), 1) == 42.0
+    assert retry_delay(http_error(discord.HTTPException, 429, {"Retry-After": "3"}), 1) == 3.0
+    assert retry_delay(http_error(discord.NotFound, 404), 1) is None
+    assert retry_delay(http_error(discord.Forbidden, 403), 1) is None
+    assert retry_delay(http_error(discord.HTTPException, 400), 1) is None
+    assert retry_delay(ValueError("bug"), 1) is None
+    # exponential backoff with jitter for 5xx and connection errors, capped
+    assert 2 <= retry_delay(OSError("reset"), 2) <= 4
+    assert 0.5 * outbox_module.OUTBOX_MAX_DELAY <= retry_delay(http_error(discord.DiscordServerError, 503), 30) <= outbox_module.OUTBOX_MAX_DELAY
+
+def test_drain_retries_until_delivered(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_BASE_DELAY", 0.01)
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("1", "message", b"png")
+    send = ScriptedSender(OSError("reset"), discord.RateLimited(0.01))
+
+    results = asyncio.run(outbox.drain(send))
+    assert results == [{"user_id": "1", "success": True, "error": None}]
+    assert send.calls == [("1", "message", b"png")] * 3
+    assert outbox.stats()["delivered"] == 1
+    # the chart bytes are dropped once delivered
+    assert outbox.connection.execute("SELECT attempts, plot FROM outbox").fetchone() == (3, None)
+
+def test_drain_gives_up_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_BASE_DELAY", 0.01)
+    outbox = make_outbox(tmp_path, max_attempts=3)
+    outbox.enqueue("1", "message")
+    send = ScriptedSender(*[OSError("reset")] * 5)
+
+    results = asyncio.run(outbox.drain(send))
+    assert len(send.calls) == 3
+    assert not results[0]["success"]
+    assert outbox.stats()["failed"] == 1
+
+def test_permanent_error_fails_without_retrying(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("1", "message")
+    send = ScriptedSender(http_error(discord.Forbidden, 403))
+
+    results = asyncio.run(outbox.drain(send))
+    assert len(send.calls) == 1
+    assert results[0]["error"] == "Bot doesn't have permission to send messages to user 1"
+    assert outbox.stats()["failed"] == 1
+
+def test_long_rate_limit_is_left_for_the_next_drain(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("1", "message")
+    send = ScriptedSender(discord.RateLimited(60))
+
+    results = asyncio.run(outbox.drain(send, timeout=1))
+    assert not results[0]["success"]
+    assert outbox.stats()["pending"] == 1
+
+def test_stale_items_expire_instead_of_sending(tmp_path):
+    clock = Clock()
+    outbox = make_outbox(tmp_path, max_age=3600, clock=clock)
+    outbox.enqueue("1", "message")
+    clock.now += 3601
+    send = ScriptedSender()
+
+    assert asyncio.run(outbox.drain(send)) == []
+    assert send.calls == []
+    assert outbox.stats()["expired"] == 1
+
+def test_same_user_and_date_is_queued_once(tmp_path):
+    outbox = make_outbox(tmp_path)
+    key = dedupe_key("1", date(2026, 10, 18))
+    outbox.enqueue("1", "first", dedupe_key=key)
+    # a rerun after a crash between the send and its ack
+    outbox.enqueue("1", "rerun", dedupe_key=key)
+    send = ScriptedSender()
+
+    asyncio.run(outbox.drain(send))
+    outbox.enqueue("1", "after delivery", dedupe_key=key)
+    asyncio.run(outbox.drain(send))
+    assert send.calls == [("1", "first", None)]
+    assert outbox.stats()["delivered"] == 1
+
+def test_failed_forecast_is_queued_again(tmp_path):
+    outbox = make_outbox(tmp_path)
+    key = dedupe_key("1", date(2026, 10, 18))
+    outbox.enqueue("1", "first", dedupe_key=key)
+    asyncio.run(outbox.drain(ScriptedSender(http_error(discord.Forbidden, 403))))
+
+    outbox.enqueue("1", "retry", dedupe_key=key)
+    send = ScriptedSender()
+    asyncio.run(outbox.drain(send))
+    assert send.calls == [("1", "retry", None)]
+    assert outbox.stats() == {"pending": 0, "delivered": 1, "failed": 0, "expired": 0}
+
+def test_items_without_a_dedupe_key_are_all_queued(tmp_path):
+    outbox = make_outbox(tmp_path)
+    assert outbox.enqueue_many([("1", "a", None), ("1", "b", None)]) == 2
+    assert outbox.stats()["pending"] == 2
@@ -0,0 +1,49 @@
+import os
+
+from functions.plot_cache import PlotCache, image_extension
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"p" * 92
+WEBP = b"RIFF\x00\x00\x00\x00WEBP" + b"w" * 88
+
+
+def test_image_extension():
+    assert image_extension(PNG) == "png"
+    assert image_extension(WEBP) == "webp"
+
+def test_evicts_least_recently_used_past_the_byte_cap():
+    cache = PlotCache(max_bytes=250)
+    cache.put("a", PNG)
+    cache.put("b", PNG)
+    assert cache.get("a") == PNG  # b is now the least recently used
+    cache.put("c", PNG)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == PNG and cache.get("c") == PNG
+    assert cache.stats()["bytes"] == 200
+
+def test_evicted_charts_spill_to_disk_with_their_own_extension(tmp_path):
+    cache = PlotCache(max_bytes=150, spill_dir=str(tmp_path))
+    cache.put("a", WEBP)
+    cache.put("b", PNG)
+
+    assert sorted(os.listdir(tmp_path)) == ["a.webp"]
+    assert cache.get("a") == WEBP
+    assert cache.stats()["disk_hits"] == 1
+
+def test_spill_directory_is_capped(tmp_path):
+    cache = PlotCache(max_bytes=100, spill_dir=str(tmp_path), spill_max_bytes=250)
+    for key in "abcd":
+        cache.put(key, PNG)
+    # a, b and c were spilled, a is the oldest and goes over the cap
+    assert sorted(os.listdir(tmp_path)) == ["b.png", "c.png"]
+    assert cache.get("a") is None
+    assert cache.stats()["spill_bytes"] == 200
+
+def test_spilled_files_survive_a_restart_within_the_cap(tmp_path):
+    cache = PlotCache(max_bytes=100, spill_dir=str(tmp_path))
+    cache.put("a", PNG)
+    cache.put("b", WEBP)
+
+    restarted = PlotCache(max_bytes=100, spill_dir=str(tmp_path), spill_max_bytes=100)
+    assert restarted.get("a") == PNG
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from functions.providers import HedgedProviders, LatencyTracker, ProviderError, valid_geocode
+
+LONDON = (51.5, -0.12)
+PARIS = (48.86, 2.35)
+
+
+# a stand-in geocoder: answers result (or raises it) after delay seconds, and notes when it was asked and cancelled
+class ScriptedProvider:
+    def __init__(self, name, result, delay=0.0):
+        self.name = name
+        self.result = result
+        self.delay = delay
+        self.started = None
+        self.cancelled = False
+
+    async def geocode(self, city, state_code=None, country_code=None):
+        self.started = time.perf_counter()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+def geocode(providers, tracker):
+    async def run():
+        started = time.perf_counter()
+        result = await HedgedProviders(providers, tracker).geocode("London")
+        return result, started
+
+    return asyncio.run(run())
+
+# p95 of 0.1s for the primary, and a default delay far longer than any test
+def tracked(primary_seconds=0.1):
+    tracker = LatencyTracker(min_samples=20, default_delay=5.0)
+    for _ in range(20):
+        tracker.record("primary", primary_seconds)
+    return tracker
+
+def test_first_valid_result_wins_without_asking_the_next_provider():
+    primary = ScriptedProvider("primary", LONDON, delay=0.01)
+    secondary = ScriptedProvider("secondary", PARIS)
+
+    result, _ = geocode([primary, secondary], tracked())
+    assert result == LONDON
+    assert secondary.started is None
+
+def test_hedge_fires_only_after_the_tracked_p95():
+    primary = ScriptedProvider("primary", LONDON, delay=1.0)
+    secondary = ScriptedProvider("secondary", PARIS)
+
+    result, started = geocode([primary, secondary], tracked(0.1))
+    assert result == PARIS
+    assert 0.1 <= secondary.started - started < 0.5
+
+def test_loser_is_cancelled_and_its_latency_recorded():
+    primary = ScriptedProvider("primary", LONDON, delay=1.0)
+    secondary = ScriptedProvider("secondary", PARIS)
+    tracker = tracked(0.05)
+
+    geocode([primary, secondary], tracker)
+    assert primary.cancelled
+    assert len(tracker.samples["primary"]) == 21
+    assert tracker.samples["primary"][-1] >= 0.05
+
+@pytest.mark.parametrize("result", [ConnectionError("reset"), (None, None)])
+def test_failed_or_invalid_result_falls_back_right_away(result):
+    primary = ScriptedProvider("primary", result)
+    secondary = ScriptedProvider("secondary", PARIS)
+    tracker = tracked()
+
+    answer, started = geocode([primary, secondary], tracker)
+    assert answer == PARIS
+    # well before the primary's 0.1s p95
+    assert secondary.started - started < 0.05
+    assert tracker.failures == {"primary": 1}
+
+def test_provider_error_when_every_provider_fails():
+    providers = [ScriptedProvider("primary", ConnectionError("reset")), ScriptedProvider("secondary", (None, None))]
+
+    with pytest.raises(ProviderError, match="primary: reset; secondary: invalid result"):
+        geocode(providers, tracked())
+
+def test_valid_geocode():
+    assert valid_geocode(LONDON)
+    assert not valid_geocode((None, -0.12))
@@ -0,0 +1,130 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+import functions.scheduler_daemon as scheduler_daemon
+from functions.forecast import Forecast
+from functions.forecast_cache import ForecastCache
+from functions.plot_cache import plot_cache_key_for_df
+from functions.scheduler_daemon import BatchedForecastFetcher, WeatherDaemon
+from functions.subscribers import SubscriberRegistry
+
+# the same instant: 20:00 on the 18th in Los Angeles is 03:00 on the 19th in UTC
+SLOT = datetime(2026, 10, 19, 3, 0, tzinfo=timezone.utc)
+
+
+class StubSender:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, jobs):
+        self.sent.extend(jobs)
+        return [{"user_id": job[0], "success": True} for job in jobs]
+
+def make_daemon(tmp_path):
+    registry = SubscriberRegistry(str(tmp_path / "subscribers.sqlite"))
+    registry.upsert_many([
+        {"user_id": "1", "name": "Los Angeles", "latitude": 34.05, "longitude": -118.24, "timezone": "America/Los_Angeles", "send_time": "20:00"},
+        {"user_id": "2", "name": "London", "latitude": 51.5, "longitude": -0.12, "timezone": "UTC", "send_time": "03:00"},
+    ])
+    return WeatherDaemon(registry, StubSender(), ledger_path=str(tmp_path / "ledger.sqlite"))
+
+def test_due_slots_split_same_instant_by_time_zone(tmp_path):
+    daemon = make_daemon(tmp_path)
+    slots = daemon.due_slots(SLOT - timedelta(minutes=1), SLOT + timedelta(minutes=1))
+
+    assert len(slots) == 2
+    dates = {subscribers[0]["user_id"]: send_at.date() for send_at, subscribers in slots}
+    assert dates == {"1": date(2026, 10, 18), "2": date(2026, 10, 19)}
+
+def test_send_slot_records_each_subscribers_local_date(tmp_path, monkeypatch):
+    daemon = make_daemon(tmp_path)
+    monkeypatch.setattr(scheduler_daemon, "utc_now", lambda: SLOT)
+    prepared = []
+
+    async def prepare_slot(subscribers, send_date=None):
+        prepared.append(send_date)
+        return [(subscriber["user_id"], "message", None) for subscriber in subscribers]
+
+    monkeypatch.setattr(daemon, "prepare_slot", prepare_slot)
+
+    async def run():
+        for send_at, subscribers in daemon.due_slots(SLOT - timedelta(minutes=1), SLOT + timedelta(minutes=1)):
+            await daemon.send_slot(send_at, subscribers)
+
+    asyncio.run(run())
+    assert sorted(prepared) == [date(2026, 10, 18), date(2026, 10, 19)]
+    assert daemon.ledger.has_entry("1", date(2026, 10, 18))
+    assert daemon.ledger.has_entry("2", date(2026, 10, 19))
+    assert not daemon.ledger.has_entry("2", date(2026, 10, 18))
+
+def test_prepare_slot_leaves_out_only_the_failing_cell(tmp_path, monkeypatch):
+    daemon = make_daemon(tmp_path)
+
+    class StubStore:
+        async def get_day(self, LATITUDE, LONGITUDE, timezone, date):
+            if timezone == "UTC":
+                raise LookupError(f"No stored forecast covers {date}")
+            return "hourly", "daily"
+
+    daemon.forecast_store = StubStore()
+    monkeypatch.setattr(scheduler_daemon, "build_forecast_jobs", lambda group, hourly, daily, plot_cache, plot_options=None, plot=None: [(subscriber["user_id"], hourly, daily) for subscriber in group])
+
+    jobs = asyncio.run(daemon.prepare_slot(list(daemon.registry), date(2026, 10, 18)))
+    assert jobs == [("1", "hourly", "daily")]
+
+def test_prepare_slot_renders_only_uncached_charts_in_the_render_pool(tmp_path, monkeypatch):
+    daemon = make_daemon(tmp_path)
+    hours = np.arange(24)
+    forecasts = {
+        timezone: Forecast(int(SLOT.timestamp()), 3600, 0, "UTC", {"temperature_2m": hours.astype(np.float32) + offset, "precipitation": np.zeros(24, dtype=np.float32)})
+        for timezone, offset in (("America/Los_Angeles", 0), ("UTC", 10))
+    }
+    cached_key = plot_cache_key_for_df(forecasts["America/Los_Angeles"].from_hour(6).to_pandas())
+    daemon.plot_cache.put(cached_key, b"cached")
+
+    class StubStore:
+        async def get_day(self, LATITUDE, LONGITUDE, timezone, date):
+            return forecasts[timezone], "daily"
+
+    class StubPool:
+        def __init__(self):
+            self.payloads = []
+
+        async def render_async(self, payloads):
+            self.payloads.extend(payloads)
+            for payload in payloads:
+                yield payload[0], b"pooled"
+
+    daemon.forecast_store = StubStore()
+    daemon.render_pool = StubPool()
+    monkeypatch.setattr(scheduler_daemon, "build_forecast_jobs", lambda group, hourly, daily, plot_cache, plot_options=None, plot=None: [(subscriber["user_id"], plot) for subscriber in group])
+
+    jobs = asyncio.run(daemon.prepare_slot(list(daemon.registry), date(2026, 10, 19)))
+    assert sorted(jobs) == [("1", b"cached"), ("2", b"pooled")]
+    assert len(daemon.render_pool.payloads) == 1
+    # the pooled chart is in the plot cache for the next slot
+    assert daemon.plot_cache.get(daemon.render_pool.payloads[0][0][1]) == b"pooled"
+
+def test_prepare_slot_fetches_its_cells_in_one_batch_per_time_zone(tmp_path, monkeypatch):
+    daemon = make_daemon(tmp_path)
+    daemon.registry.upsert_many([
+        {"user_id": "3", "name": "San Diego", "latitude": 32.72, "longitude": -117.16, "timezone": "America/Los_Angeles", "send_time": "20:00"},
+    ])
+    batches = []
+
+    def fetch_batch(coordinates, timezone):
+        batches.append((timezone, sorted(coordinates)))
+        if timezone == "UTC":
+            raise ConnectionError("Open-Meteo is down")
+        return [f"{LATITUDE},{LONGITUDE}" for LATITUDE, LONGITUDE in coordinates]
+
+    daemon.forecast_cache = ForecastCache(BatchedForecastFetcher(fetch_batch))
+    monkeypatch.setattr(scheduler_daemon, "day_forecasts", lambda response: (response, "daily"))
+    monkeypatch.setattr(scheduler_daemon, "build_forecast_jobs", lambda group, hourly, daily, plot_cache, plot_options=None, plot=None: [(subscriber["user_id"], hourly) for subscriber in group])
+
+    jobs = asyncio.run(daemon.prepare_slot(list(daemon.registry)))
+    assert sorted(batches) == [("America/Los_Angeles", [(32.72, -117.16), (34.05, -118.24)]), ("UTC", [(51.5, -0.12)])]
+    # the failed batch only leaves out its own cells
+    assert sorted(jobs) == [("1", "34.05,-118.24"), ("3", "32.72,-117.16")]
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from functions.subscribers import SubscriberRegistry
+
+LA = ZoneInfo("America/Los_Angeles")
+
+
+def subscriber(user_id, send_time="07:00", latitude=34.0522, longitude=-118.2437, tz="America/Los_Angeles", **fields):
+    return dict({"user_id": user_id, "name": f"User {user_id}", "latitude": latitude, "longitude": longitude, "timezone": tz, "send_time": send_time}, **fields)
+
+def make_registry(tmp_path, *subscribers):
+    registry = SubscriberRegistry(str(tmp_path / "subscribers.sqlite"))
+    registry.upsert_many(subscribers)
+    return registry
+
+def due_users(registry, start, end):
+    return [(send_at.astimezone(timezone.utc), subscriber["user_id"]) for send_at, subscriber in registry.due(start, end)]
+
+def local(*args):
+    return datetime(*args, tzinfo=LA)
+
+def test_window_includes_its_start_and_excludes_its_end(tmp_path):
+    registry = make_registry(tmp_path, subscriber("1", "07:00"), subscriber("2", "07:05"))
+
+    assert [user for _, user in due_users(registry, local(2026, 10, 18, 7, 0), local(2026, 10, 18, 7, 5))] == ["1"]
+    assert [user for _, user in due_users(registry, local(2026, 10, 18, 7, 1), local(2026, 10, 18, 7, 6))] == ["2"]
+
+def test_window_across_midnight(tmp_path):
+    registry = make_registry(tmp_path, subscriber("1", "23:59"), subscriber("2", "00:00"), subscriber("3", "00:05"))
+
+    slots = registry.due(local(2026, 10, 18, 23, 58), local(2026, 10, 19, 0, 3))
+    assert [(send_at.date().isoformat(), subscriber["user_id"]) for send_at, subscriber in slots] == [("2026-10-18", "1"), ("2026-10-19", "2")]
+
+def test_send_time_in_the_spring_forward_gap_is_sent_once(tmp_path):
+    # 2026-03-08 02:00 PST jumps to 03:00 PDT, 02:30 does not exist that day
+    registry = make_registry(tmp_path, subscriber("1", "02:30"))
+    start = datetime(2026, 3, 8, 8, 0, tzinfo=timezone.utc)
+    slots = []
+    for minutes in range(0, 6 * 60, 5):
+        slots += due_users(registry, start + timedelta(minutes=minutes), start + timedelta(minutes=minutes + 5))
+
+    # read in the old offset: 02:30 PST, which is 03:30 PDT
+    assert slots == [(datetime(2026, 3, 8, 10, 30, tzinfo=timezone.utc), "1")]
+
+def test_send_time_in_the_fall_back_fold_is_sent_once(tmp_path):
+    # 2026-11-01 01:00-02:00 happens twice
+    registry = make_registry(tmp_path, subscriber("1", "01:30"))
+    start = datetime(2026, 11, 1, 7, 0, tzinfo=timezone.utc)
+    slots = []
+    for minutes in range(0, 4 * 60, 5):
+        slots += due_users(registry, start + timedelta(minutes=minutes), start + timedelta(minutes=minutes + 5))
+
+    # the first 01:30, still PDT
+    assert slots == [(datetime(2026, 11, 1, 8, 30, tzinfo=timezone.utc), "1")]
+
+def test_send_time_stays_local_across_dst(tmp_path):
+    registry = make_registry(tmp_path, subscriber("1", "07:00"))
+
+    summer = due_users(registry, local(2026, 10, 31, 6, 0), local(2026, 10, 31, 8, 0))
+    winter = due_users(registry, local(2026, 11, 2, 6, 0), local(2026, 11, 2, 8, 0))
+    assert [send_at.hour for send_at, _ in summer + winter] == [14, 15]
+
+def test_each_time_zone_is_scanned_in_its_own_local_time(tmp_path):
+    registry = make_registry(tmp_path, subscriber("1", "07:00"), subscriber("2", "07:00", tz="Europe/London"))
+
+    assert due_users(registry, datetime(2026, 10, 18, 6, 0, tzinfo=timezone.utc), datetime(2026, 10, 18, 6, 5, tzinfo=timezone.utc)) == [
+        (datetime(2026, 10, 18, 6, 0, tzinfo=timezone.utc), "2")
+    ]
+
+def test_forecast_groups_by_grid_cell_and_time_zone(tmp_path):
+    registry = make_registry(
+        tmp_path,
+        subscriber("2", latitude=34.0522, longitude=-118.2437),
+        subscriber("1", latitude=34.0501, longitude=-118.2419),  # same 0.01 degree cell
+        subscriber("3", latitude=34.0622, longitude=-118.2437),  # next cell north
+        subscriber("4", latitude=34.0522, longitude=-118.2437, tz="America/Denver"),
+    )
+
+    groups = {key: sorted(subscriber["user_id"] for subscriber in group) for key, group in registry.forecast_groups().items()}
+    # a shared cell is fetched at the exact point of its lowest user id
+    assert groups == {
+        (34.0501, -118.2419, "America/Los_Angeles"): ["1", "2"],
+        (34.0622, -118.2437, "America/Los_Angeles"): ["3"],
+        (34.0522, -118.2437, "America/Denver"): ["4"],
+    }
+    assert sorted(subscriber["user_id"] for subscriber in registry.in_cell(34.05, -118.24)) == ["1", "2", "4"]
+    assert registry.stats()["cells"] == 2
+
+def test_moving_a_subscriber_updates_the_indexes(tmp_path):
+    registry = make_registry(tmp_path, subscriber("1", "07:00"))
+    registry.upsert(subscriber("1", "08:00", latitude=40.7128, longitude=-74.006, tz="America/New_York"))
+
+    assert registry.in_cell(34.05, -118.24) == []
+    assert registry.stats() == {"subscribers": 1, "timezones": 1, "send_buckets": 1, "cells": 1}
+    # and the sqlite table is what a restart loads
+    assert SubscriberRegistry(str(tmp_path / "subscribers.sqlite")).get("1")["send_time"] == "08:00"
+
+def test_invalid_subscribers_are_rejected(tmp_path):
+    registry = make_registry(tmp_path)
+
+    with pytest.raises(ValueError, match="units"):
+        registry.upsert(subscriber("1", units="kelvin"))
+    with pytest.raises(ValueError, match="city or latitude"):
+        registry.upsert(subscriber("1", latitude=None))
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from functions.async_fetch import decode_weather_responses
+from functions.variables import CONSUMERS, VARIABLES, decode_section, request_variables, variables_for
+from record_fixtures import DAY_START, LATITUDE, LONGITUDE, TIMEZONE, UTC_OFFSET_SECONDS, encode_weather_response
+
+
+def values_for(name, length):
+    if VARIABLES[name][5]:
+        return DAY_START + 3600 * np.arange(length, dtype=np.int64)
+    return np.linspace(0, 30, length, dtype=np.float32) + len(name)
+
+# a response carrying exactly the variables the consumers request, in reverse registry order
+def encode(consumers):
+    sections = request_variables(consumers)
+    daily = {name: values_for(name, 1) for name in reversed(sections.get("daily", []))}
+    hourly = {name: values_for(name, 24) for name in reversed(sections.get("hourly", []))}
+    return decode_weather_responses(encode_weather_response(LATITUDE, LONGITUDE, UTC_OFFSET_SECONDS, TIMEZONE, daily, hourly))[0]
+
+@pytest.mark.parametrize("consumer", sorted(CONSUMERS))
+def test_each_consumer_round_trips(consumer):
+    response = encode((consumer,))
+
+    for kind, section in (("daily", response.Daily()), ("hourly", response.Hourly())):
+        names = variables_for((consumer,), kind)
+        values = decode_section(section, kind, names)
+        assert sorted(values) == sorted(names)
+        for name in names:
+            assert np.array_equal(values[name], values_for(name, 1 if kind == "daily" else 24))
+
+def test_request_variables_leave_out_unread_sections():
+    assert request_variables(("message",)) == {"daily": ["temperature_2m_max", "temperature_2m_min", "uv_index_max"]}
+    assert request_variables(("message", "temperature_plot")) == {
+        "hourly": ["temperature_2m", "precipitation"],
+        "daily": ["temperature_2m_max", "temperature_2m_min", "uv_index_max"],
+    }
+
+def test_timestamps_decode_as_int64():
+    daily = {name: values_for(name, 2) for name in ("temperature_2m_max", "sunrise", "sunset")}
+    response = decode_weather_responses(encode_weather_response(LATITUDE, LONGITUDE, UTC_OFFSET_SECONDS, TIMEZONE, daily, {}))[0]
+
+    values = decode_section(response.Daily(), "daily")
+    assert values["sunrise"].dtype == np.int64
+    assert np.array_equal(values["sunset"], daily["sunset"])
+    assert values["temperature_2m_max"].dtype == np.float32
+
+def test_missing_variables_and_sections_raise():
+    response = encode(("message",))
+
+    with pytest.raises(ValueError, match="precipitation"):
+        decode_section(response.Daily(), "daily", ["temperature_2m_max", "precipitation_hours"])
+    with pytest.raises(ValueError, match="no hourly section"):
+        decode_section(response.Hourly(), "hourly", ["temperature_2m"])
+    assert decode_section(response.Hourly(), "hourly") == {}
+
+def test_variables_outside_the_wanted_names_are_skipped():
+    response = encode(("message",))
+    assert list(decode_section(response.Daily(), "daily", ["uv_index_max"])) == ["uv_index_max"]
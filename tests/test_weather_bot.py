@@ -0,0 +1,32 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cloud_ready_weather_bot
+from functions import metrics
+
+
+def hourly_weather_df(days):
+    dates = pd.date_range("2026-10-18 06:00", periods=days * 24, freq="h", tz="America/Los_Angeles")
+    return pd.DataFrame({
+        "date": dates,
+        "hour": dates.hour,
+        "temperature_2m": np.linspace(55, 75, len(dates), dtype=np.float32),
+        "precipitation": np.zeros(len(dates), dtype=np.float32),
+    })
+
+@pytest.mark.parametrize("weekly", [False, True])
+def test_one_plot_render_span_per_chart(weekly, monkeypatch):
+    sent = []
+
+    async def start_discord_weather_batch(jobs, delivery):
+        sent.extend(jobs)
+
+    monkeypatch.setattr(cloud_ready_weather_bot, "start_discord_weather_batch", start_discord_weather_batch)
+    metrics.reset()
+    asyncio.run(cloud_ready_weather_bot.start_discord_weather_bot("1", "message", hourly_weather_df(3 if weekly else 1), weekly=weekly))
+
+    assert len(sent) == 1
+    assert metrics.reset().stages["plot_render"]["count"] == 1
@@ -0,0 +1,48 @@
+from functions.work_leases import LeaseStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_stores(tmp_path, clock):
+    path = str(tmp_path / "leases.sqlite")
+    # the same worker id twice, e.g. a restart while the old process is still running
+    return LeaseStore(path, worker_id=0, lease_seconds=60, clock=clock), LeaseStore(path, worker_id=0, lease_seconds=60, clock=clock)
+
+def test_same_worker_id_does_not_share_a_lease(tmp_path):
+    clock = Clock()
+    first, second = make_stores(tmp_path, clock)
+
+    assert first.claim("slot")
+    assert first.claim("slot")
+    assert not second.claim("slot")
+    assert second.renew(["slot"]) == []
+    assert first.renew(["slot"]) == ["slot"]
+
+def test_expired_lease_is_taken_over_and_the_old_owner_cannot_renew_it(tmp_path):
+    clock = Clock()
+    first, second = make_stores(tmp_path, clock)
+
+    assert first.claim("slot")
+    clock.now += 61
+    assert second.claim("slot")
+    assert first.renew(["slot"]) == []
+    # the old owner's complete and release leave the new owner's lease alone
+    first.complete(["slot"])
+    first.release(["slot"])
+    assert second.renew(["slot"]) == ["slot"]
+    assert first.stats() == {"leased": 1, "done": 0, "expired": 0}
+
+def test_done_batch_is_never_claimed_again(tmp_path):
+    clock = Clock()
+    first, second = make_stores(tmp_path, clock)
+
+    assert first.claim("slot")
+    first.complete(["slot"])
+    clock.now += 61
+    assert not first.claim("slot")
+    assert not second.claim("slot")